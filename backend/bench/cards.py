@@ -0,0 +1,47 @@
+"""Benchmark do gerador de cartões (src/imagegen.py).
+
+Uso (a partir de backend/):
+    CARD_FONT_PATH=/caminho/fonte.ttf python -m bench.cards --n 200
+
+Mede a primeira chamada (camada estática + paleta), cartões novos (sem LRU)
+e cartões repetidos (LRU), em ms por cartão.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from src import imagegen
+
+
+def _per_call_ms(fn, n):
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - t0) * 1000 / n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    imagegen.make_card("Aquecimento", 0, 10, 10)
+    first_ms = (time.perf_counter() - t0) * 1000
+
+    uncached = _per_call_ms(lambda i: imagegen.make_card(f"Cliente{i}", i % 10, 10, 10 - i % 10), args.n)
+    cached = _per_call_ms(lambda i: imagegen.make_card("Cliente0", 0, 10, 10), args.n)
+    size = len(imagegen.make_card("Cliente Exemplo", 3, 10, 7))
+
+    print(json.dumps({
+        "first_call_ms": round(first_ms, 2),
+        "uncached_ms": round(uncached, 2),
+        "cached_ms": round(cached, 4),
+        "png_bytes": size,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Quantos terminais simultâneos cada modo de servir aguenta (WSGI x ASGI).
+
+Uso (a partir de backend/):
+    DATABASE_URL=postgresql+psycopg://... python -m bench.concurrency --visits 100000 --reseed
+    DATABASE_URL=... python -m bench.concurrency --levels 8,32,128 --duration 15 --slo-ms 300
+
+Sobe, um de cada vez e com o mesmo número de workers, os dois modos:
+
+  - wsgi: gunicorn gthread sobre src.main:app (como no render.yaml);
+  - asgi: gunicorn com workers uvicorn sobre src.asgi:app (engine async).
+
+Para cada nível de --levels, N terminais rodam em paralelo por --duration
+segundos o ciclo do balcão — busca pelo final do telefone, registra a
+visita e, a cada 5 ciclos, abre os KPIs — com --think-ms de pausa entre as
+chamadas. Mede vazão, p50/p95/p99 e erros por nível. "Aguenta" = maior nível
+com p95 <= --slo-ms e nenhum erro.
+
+Com o banco na mesma máquina cada consulta leva microssegundos e os dois
+modos ficam presos à CPU. --db-latency-ms N põe um proxy TCP entre os
+servidores e o PostgreSQL que atrasa cada pacote em N/2 ms por sentido (ida
+e volta = N), para simular o banco em outro host, como no Render.
+
+Gerador de carga e servidor dividem a máquina: compare os modos entre si,
+não com a produção. O resultado vai para --out (padrão
+bench/results/concurrency-<commit>-<banco>.json).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+
+from src.db import SessionLocal, engine
+from src.models import Client
+from src.schema import ensure_schema
+
+from .endpoints import RESULTS_DIR, _git_commit, _http, _start_gunicorn, summarize
+from .seed import (
+    BENCH_EMAIL, BENCH_PASSWORD, NotBenchDatabase, current_sizes, require_bench_database, seed,
+)
+
+MODES = ("wsgi", "asgi")
+
+
+class LatencyProxy:
+    """Proxy TCP -> PostgreSQL (TCP ou socket unix) com atraso fixo por sentido."""
+
+    def __init__(self, url: str, rtt_ms: float):
+        self.url = make_url(url)
+        self.delay = rtt_ms / 2000
+        self.port = None
+        self._ready = threading.Event()
+
+    def _target(self):
+        socket_dir = self.url.query.get("host")
+        port = self.url.port or 5432
+        if socket_dir and socket_dir.startswith("/"):
+            return asyncio.open_unix_connection(f"{socket_dir}/.s.PGSQL.{port}")
+        return asyncio.open_connection(self.url.host or "localhost", port)
+
+    async def _pipe(self, reader, writer):
+        # lê sem esperar e entrega cada pedaço `delay` depois: atraso sem serializar
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def deliver():
+            while True:
+                due, data = await queue.get()
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+                if not data:
+                    writer.close()
+                    return
+                writer.write(data)
+                await writer.drain()
+
+        task = asyncio.create_task(deliver())
+        try:
+            while True:
+                data = await reader.read(65536)
+                await queue.put((time.monotonic() + self.delay, data))
+                if not data:
+                    break
+            await task
+        except (ConnectionError, asyncio.CancelledError):
+            task.cancel()
+
+    async def _handle(self, client_reader, client_writer):
+        try:
+            db_reader, db_writer = await self._target()
+        except OSError:
+            client_writer.close()
+            return
+        await asyncio.gather(
+            self._pipe(client_reader, db_writer), self._pipe(db_reader, client_writer),
+            return_exceptions=True,
+        )
+
+    def _serve(self):
+        async def main():
+            server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(main())
+
+    def start(self) -> str:
+        """Inicia o proxy numa thread e devolve a DATABASE_URL que passa por ele."""
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait(10)
+        query = {k: v for k, v in self.url.query.items() if k != "host"}
+        return self.url.set(host="127.0.0.1", port=self.port, query=query).render_as_string(
+            hide_password=False
+        )
+
+
+def _login(base):
+    req = urllib.request.Request(
+        base + "/api/auth/login", method="POST",
+        data=json.dumps({"email": BENCH_EMAIL, "password": BENCH_PASSWORD}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())["token"]
+
+
+def _terminal(base, headers, clients, think, deadline, rng, out):
+    """Um terminal do balcão em laço até `deadline`; anexa (ms, status) em `out`."""
+    n = 0
+    while time.monotonic() < deadline:
+        client_id, phone = rng.choice(clients)
+        calls = [
+            ("GET", f"/api/clientes/search?q={phone[-4:]}", None),
+            ("POST", "/api/visitas", {"client_id": client_id}),
+        ]
+        if n % 5 == 4:
+            calls.append(("GET", "/api/dashboard/kpis", None))
+        for call in calls:
+            t0 = time.perf_counter()
+            status = _http(base, *call, headers)
+            out.append(((time.perf_counter() - t0) * 1000, status))
+            if think:
+                time.sleep(think)
+        n += 1
+
+
+def run_level(base, headers, clients, terminals, duration, think):
+    out = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=_terminal,
+            args=(base, headers, clients, think, deadline, random.Random(i), out),
+            daemon=True,
+        )
+        for i in range(terminals)
+    ]
+    t_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    result = summarize([ms for ms, _ in out], time.perf_counter() - t_start, [s for _, s in out])
+    result["errors"] = sum(1 for _, s in out if s == "error" or (isinstance(s, int) and s >= 500))
+    return result
+
+
+def run_mode(mode, args, clients):
+    proc, base = _start_gunicorn(args.port, args.workers, args.threads, asgi=(mode == "asgi"))
+    try:
+        headers = {"Authorization": f"Bearer {_login(base)}"}
+        levels, sustained = {}, 0
+        for terminals in args.levels:
+            r = run_level(base, headers, clients, terminals, args.duration, args.think_ms / 1000)
+            levels[str(terminals)] = r
+            print(f"[{mode}] {terminals:>4} terminais: {r}", file=sys.stderr)
+            if r["errors"] or r["p95_ms"] is None or r["p95_ms"] > args.slo_ms:
+                break  # acima da capacidade: os níveis seguintes só pioram
+            sustained = terminals
+        return {"sustained_terminals": sustained, "levels": levels}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--visits", type=int, default=100_000, help="tamanho da base com --reseed")
+    ap.add_argument("--reseed", action="store_true",
+                    help="apaga e recria a base sintética (só numa base vazia/de bench)")
+    ap.add_argument("--levels", default="4,8,16,32,64,128",
+                    type=lambda s: [int(x) for x in s.split(",")], help="terminais por rodada")
+    ap.add_argument("--duration", type=float, default=10.0, help="segundos por nível")
+    ap.add_argument("--think-ms", type=float, default=50.0, help="pausa entre chamadas de um terminal")
+    ap.add_argument("--slo-ms", type=float, default=300.0, help="p95 máximo para contar como sustentado")
+    ap.add_argument("--db-latency-ms", type=float, default=0.0,
+                    help="ida e volta simulada até o PostgreSQL (proxy TCP)")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=4, help="threads por worker no modo wsgi")
+    ap.add_argument("--modes", default=",".join(MODES))
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        # os terminais registram visitas: nunca numa base real
+        require_bench_database(db)
+        if args.reseed:
+            print(f"seed: {seed(clients=max(1, args.visits // 10), visits=args.visits)}", file=sys.stderr)
+        elif current_sizes(db)["visits"] < args.visits:
+            sys.exit(f"bench: a base tem menos de {args.visits} visitas; rode com --reseed")
+        clients = [
+            (cid, phone) for cid, phone in
+            db.execute(select(Client.id, Client.phone).where(Client.phone.is_not(None)).limit(5000))
+            if phone and len(phone) >= 4
+        ]
+    except NotBenchDatabase as e:
+        sys.exit(f"bench: {e}")
+    finally:
+        db.close()
+
+    if args.db_latency_ms:
+        if engine.dialect.name != "postgresql":
+            ap.error("--db-latency-ms só com PostgreSQL")
+        # os servidores herdam o ambiente: passam a falar com o banco pelo proxy
+        os.environ["DATABASE_URL"] = LatencyProxy(
+            engine.url.render_as_string(hide_password=False), args.db_latency_ms
+        ).start()
+
+    result = {
+        "meta": {
+            "commit": _git_commit(),
+            "when": datetime.utcnow().isoformat(timespec="seconds"),
+            "database": engine.dialect.name,
+            "workers": args.workers, "threads": args.threads,
+            "duration_s": args.duration, "think_ms": args.think_ms, "slo_ms": args.slo_ms,
+            "db_latency_ms": args.db_latency_ms,
+        },
+    }
+    for mode in args.modes.split(","):
+        result[mode] = run_mode(mode, args, clients)
+
+    print({mode: result[mode]["sustained_terminals"] for mode in args.modes.split(",")})
+    out = Path(args.out) if args.out else (
+        RESULTS_DIR / f"concurrency-{result['meta']['commit']}-{engine.dialect.name}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    print(f"resultado salvo em {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark da outbox de e-mails (src/emailer.py).
+
+Uso (a partir de backend/):
+    pip install aiosmtpd
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.email_outbox --n 200
+
+Sobe um SMTP local (aiosmtpd, descarta as mensagens) e compara:
+  - direto: uma conexão SMTP nova por mensagem (comportamento antigo);
+  - outbox: `send_email` só enfileira, e o OutboxSender envia tudo
+    reaproveitando uma conexão.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+
+SMTP_PORT = 8025
+
+
+def _start_smtp():
+    from aiosmtpd.controller import Controller
+
+    class _Sink:
+        async def handle_DATA(self, server, session, envelope):
+            return "250 OK"
+
+    ctl = Controller(_Sink(), hostname="127.0.0.1", port=SMTP_PORT)
+    ctl.start()
+    return ctl
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200)
+    args = ap.parse_args()
+
+    # precisa estar no ambiente antes de importar o emailer
+    os.environ["SMTP_HOST"] = "127.0.0.1"
+    os.environ["SMTP_PORT"] = str(SMTP_PORT)
+    os.environ["EMAIL_SENDER_THREAD"] = "0"
+    from src import emailer
+    from src.schema import ensure_schema
+
+    ensure_schema()
+    ctl = _start_smtp()
+    try:
+        t0 = time.perf_counter()
+        for i in range(args.n):
+            smtp = emailer.SmtpConnection()
+            smtp.send(f"c{i}@example.com", "Teste", "corpo", "plain")
+            smtp.close()
+        direct = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for i in range(args.n):
+            emailer.send_email(f"c{i}@example.com", "Teste", "corpo")
+        enqueue = time.perf_counter() - t0
+
+        sender = emailer.OutboxSender()
+        t0 = time.perf_counter()
+        sent = sender.drain()
+        outbox = time.perf_counter() - t0
+        sender.smtp.close()
+    finally:
+        ctl.stop()
+
+    print(json.dumps({
+        "n": args.n,
+        "direct_msgs_per_s": round(args.n / direct, 1),
+        "enqueue_ms_per_request": round(enqueue * 1000 / args.n, 3),
+        "outbox_sent": sent,
+        "outbox_msgs_per_s": round(sent / outbox, 1) if outbox else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
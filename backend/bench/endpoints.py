@@ -0,0 +1,300 @@
+"""Benchmark de carga dos endpoints principais.
+
+Uso (a partir de backend/):
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.endpoints --visits 100000
+    DATABASE_URL=postgresql+psycopg://... python -m bench.endpoints --visits 5000000 --gunicorn
+
+Roda só numa base de bench (bench/seed.py): --reseed recria a base sintética
+no tamanho pedido (recusa se houver dados reais) e, sem ele, a base precisa
+já ter esse tamanho. Mede registrar_visita, redeem_gift, list_clients, kpis, birthday_list e a
+busca do balcão (search_name, search_phone):
+
+  - pelo test client do Flask (em processo): latência p50/p95/p99,
+    requisições/s e consultas SQL por requisição (src/metrics.py);
+  - com --gunicorn, num gunicorn real (mesma linha de comando do render.yaml)
+    com --concurrency clientes HTTP simultâneos: latência e vazão.
+
+O resultado vai para --out (padrão bench/results/endpoints-<commit>-<banco>.json);
+--compare antigo.json imprime a variação do p95 contra uma execução anterior.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote_plus
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import select
+
+from src.db import SessionLocal, engine
+from src import metrics
+from src.main import app
+from src.models import Client, Store
+from src.schema import ensure_schema
+
+from .seed import (
+    BENCH_EMAIL, BENCH_PASSWORD, FIRST_NAMES, LAST_NAMES, NotBenchDatabase, current_sizes,
+    require_bench_database, seed,
+)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+class QueryCounter:
+    """Soma os statements de cada requisição (contador do engine em src/metrics.py)."""
+
+    def __init__(self):
+        self.n = 0
+        if not metrics.ENABLED:
+            raise SystemExit("bench.endpoints precisa de METRICS_ENABLED=1 para contar as consultas")
+        metrics.on_request(self._on_request)
+
+    def _on_request(self, endpoint, statements, sql_seconds):
+        self.n += statements
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def summarize(latencies_ms, elapsed, statuses, queries=None):
+    out = {
+        "requests": len(latencies_ms),
+        "rps": round(len(latencies_ms) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+        "status": dict(Counter(str(s) for s in statuses)),
+    }
+    if queries is not None:
+        out["queries_per_request"] = round(sum(queries) / len(queries), 2)
+        out["queries_max"] = max(queries)
+    return out
+
+
+def build_scenarios(n):
+    """{nome: gerador de (método, caminho, corpo)} com alvos sorteados da base."""
+    db = SessionLocal()
+    try:
+        meta = db.scalar(select(Store.meta_visitas).limit(1)) or 10
+        ids = list(db.scalars(select(Client.id).order_by(Client.id)))
+        eligible = list(db.scalars(
+            select(Client.cpf).where(Client.visits_cycle >= meta).order_by(Client.id)
+        ))
+    finally:
+        db.close()
+    rng = random.Random(7)
+    rng.shuffle(eligible)
+    redeem = (eligible * (n // max(1, len(eligible)) + 1))[:n] if eligible else []
+    month = datetime.utcnow().month
+
+    return {
+        "registrar_visita": lambda i: ("POST", "/api/visitas", {"client_id": rng.choice(ids)}),
+        "redeem_gift": lambda i: ("POST", "/api/resgates", {"cpf": redeem[i] if redeem else "0"}),
+        "list_clients": lambda i: ("GET", "/api/clientes?per_page=20", None),
+        "list_clients_cpf": lambda i: ("GET", f"/api/clientes?cpf={rng.choice(ids):011d}", None),
+        "kpis": lambda i: ("GET", "/api/dashboard/kpis", None),
+        "birthday_list": lambda i: ("GET", f"/api/dashboard/aniversariantes?mes={month}", None),
+        # balcão: "sobrenome parcial" e "primeiro nome + sobrenome", sem acento
+        "search_name": lambda i: ("GET", "/api/clientes/search?q=" + quote_plus(
+            rng.choice(LAST_NAMES)[:5] if i % 2 else
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)[:4]}"
+        ), None),
+        "search_phone": lambda i: ("GET", f"/api/clientes/search?q={rng.randrange(10 ** 4):04d}", None),
+    }
+
+
+def run_test_client(scenarios, n):
+    counter = QueryCounter()
+    client = app.test_client()
+    token = client.post(
+        "/api/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+    ).get_json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    results = {}
+    for name, make in scenarios.items():
+        method, path, body = make(0)
+        client.open(path, method=method, json=body, headers=headers)  # aquecimento
+        lat, statuses, queries = [], [], []
+        t_start = time.perf_counter()
+        for i in range(n):
+            method, path, body = make(i)
+            q0 = counter.n
+            t0 = time.perf_counter()
+            resp = client.open(path, method=method, json=body, headers=headers)
+            lat.append((time.perf_counter() - t0) * 1000)
+            queries.append(counter.n - q0)
+            statuses.append(resp.status_code)
+        results[name] = summarize(lat, time.perf_counter() - t_start, statuses, queries)
+        print(f"[test_client] {name}: {results[name]}", file=sys.stderr)
+    return results
+
+
+def _http(base, method, path, body, headers):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base + path, data=data, method=method, headers={
+        **headers, "Content-Type": "application/json",
+    })
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return "error"
+
+
+def _start_gunicorn(port, workers, threads, asgi=False):
+    """gunicorn gthread (src.main:app) ou, com asgi=True, workers uvicorn (src.asgi:app)."""
+    if asgi:
+        worker = ["-k", "uvicorn.workers.UvicornWorker", "-b", f"127.0.0.1:{port}", "src.asgi:app"]
+    else:
+        worker = ["-k", "gthread", "--threads", str(threads), "-b", f"127.0.0.1:{port}", "src.main:app"]
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), *worker]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=os.environ.copy(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if _http(base, "GET", "/api/_health", None, {}) == 200:
+            return proc, base
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("gunicorn não subiu")
+
+
+def run_gunicorn(scenarios, n, concurrency, port, workers, threads):
+    proc, base = _start_gunicorn(port, workers, threads)
+    try:
+        req = urllib.request.Request(
+            base + "/api/auth/login", method="POST",
+            data=json.dumps({"email": BENCH_EMAIL, "password": BENCH_PASSWORD}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(req) as resp:
+            token = json.loads(resp.read())["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        results = {}
+        for name, make in scenarios.items():
+            calls = [make(i) for i in range(n)]
+
+            def one(call):
+                t0 = time.perf_counter()
+                status = _http(base, *call, headers)
+                return (time.perf_counter() - t0) * 1000, status
+
+            t_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as ex:
+                done = list(ex.map(one, calls))
+            results[name] = summarize(
+                [ms for ms, _ in done], time.perf_counter() - t_start, [s for _, s in done]
+            )
+            print(f"[gunicorn] {name}: {results[name]}", file=sys.stderr)
+        return results
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(old_path, new):
+    old = json.loads(Path(old_path).read_text())
+    for mode in ("test_client", "gunicorn"):
+        for name, cur in (new.get(mode) or {}).items():
+            prev = (old.get(mode) or {}).get(name)
+            if not prev:
+                continue
+            delta = (cur["p95_ms"] - prev["p95_ms"]) / prev["p95_ms"] * 100 if prev["p95_ms"] else 0
+            print(f"{mode:11s} {name:18s} p95 {prev['p95_ms']:>9} -> {cur['p95_ms']:>9} ms ({delta:+.1f}%)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--visits", type=int, default=100_000, help="tamanho da base (10k a 5M)")
+    ap.add_argument("--clients", type=int, default=None, help="padrão: visits / 10")
+    ap.add_argument("--stores", type=int, default=5)
+    ap.add_argument("--reseed", action="store_true",
+                    help="apaga e recria a base sintética (só numa base vazia/de bench)")
+    ap.add_argument("--requests", type=int, default=200, help="requisições por endpoint")
+    ap.add_argument("--gunicorn", action="store_true", help="mede também num gunicorn real")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--compare", default=None, help="JSON de uma execução anterior")
+    args = ap.parse_args()
+    clients = args.clients or max(1, args.visits // 10)
+
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        # os cenários de escrita gravam visitas/resgates: nunca numa base real
+        require_bench_database(db)
+        sizes = current_sizes(db)
+    except NotBenchDatabase as e:
+        sys.exit(f"bench: {e}")
+    finally:
+        db.close()
+    if args.reseed:
+        print(f"seed: {seed(args.stores, clients, args.visits)}", file=sys.stderr)
+    elif sizes["clients"] != clients or sizes["visits"] < args.visits:
+        sys.exit(
+            f"bench: a base tem {sizes['clients']} clientes e {sizes['visits']} visitas;"
+            f" rode com --reseed para gerar {clients} clientes e {args.visits} visitas"
+        )
+
+    result = {
+        "meta": {
+            "commit": _git_commit(),
+            "when": datetime.utcnow().isoformat(timespec="seconds"),
+            "database": engine.dialect.name,
+            "visits": args.visits, "clients": clients, "stores": args.stores,
+            "requests": args.requests, "concurrency": args.concurrency,
+            "gunicorn": {"workers": args.workers, "threads": args.threads} if args.gunicorn else None,
+        },
+        "test_client": run_test_client(build_scenarios(args.requests), args.requests),
+    }
+    if args.gunicorn:
+        result["gunicorn"] = run_gunicorn(
+            build_scenarios(args.requests), args.requests,
+            args.concurrency, args.port, args.workers, args.threads,
+        )
+
+    out = Path(args.out) if args.out else (
+        RESULTS_DIR / f"endpoints-{result['meta']['commit']}-{engine.dialect.name}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    print(f"resultado salvo em {out}")
+    if args.compare:
+        compare(args.compare, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark da verificação de senhas (src/passwords.py).
+
+Uso (a partir de backend/):
+    python -m bench.login --n 64 --clients 16
+    PASSWORD_POOL=process PASSWORD_WORKERS=4 python -m bench.login
+
+Compara a verificação direta (`util.verify_password`, uma thread) com o
+pool dedicado sendo chamado por várias threads ao mesmo tempo (como os
+threads do gunicorn no pico de logins), em logins por segundo. Também
+conta quantas chamadas foram rejeitadas por pool saturado.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src import passwords, util
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=64, help="logins por cenário")
+    ap.add_argument("--clients", type=int, default=16, help="threads chamando ao mesmo tempo")
+    args = ap.parse_args()
+
+    hashed = util.hash_password("segredo")
+
+    t0 = time.perf_counter()
+    for _ in range(args.n):
+        assert util.verify_password("segredo", hashed)
+    inline = time.perf_counter() - t0
+
+    rejected = 0
+
+    def one(_):
+        nonlocal rejected
+        try:
+            return passwords.verify("segredo", hashed)
+        except passwords.PoolSaturated:
+            rejected += 1
+            return None
+
+    passwords.verify("segredo", hashed)  # sobe o pool fora da medição
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as ex:
+        ok = sum(1 for r in ex.map(one, range(args.n)) if r)
+    pooled = time.perf_counter() - t0
+
+    print(json.dumps({
+        "cpus": os.cpu_count(),
+        "bcrypt_rounds": util.BCRYPT_ROUNDS,
+        "pool": passwords.POOL_KIND,
+        "pool_workers": passwords.POOL_WORKERS,
+        "pool_queue": passwords.POOL_QUEUE,
+        "inline_logins_per_s": round(args.n / inline, 1),
+        "pool_logins_per_s": round(ok / pooled, 1),
+        "pool_rejected": rejected,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Dados sintéticos para os benchmarks (lojas, clientes, visitas).
+
+Uso (a partir de backend/):
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.seed --visits 100000
+    DATABASE_URL=postgresql+psycopg://... python -m bench.seed --visits 5000000
+
+Insere direto pelo Core em lotes (sem ORM), preenche os contadores
+materializados (visits_total/visits_cycle, birth_month/birth_day) e recria o
+rollup daily_stats. Cria também o usuário BENCH_EMAIL/BENCH_PASSWORD (ADMIN).
+
+`seed` apaga tudo antes de inserir, então só aceita uma base vazia ou que
+já seja de bench (só o usuário BENCH_EMAIL e lojas "Loja Bench N"); em
+qualquer outra levanta NotBenchDatabase sem tocar em nada.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+from src import stats
+from src.db import SessionLocal
+from src.models import Client, DailyStat, Redemption, Store, User, Visit
+from src.schema import ensure_schema
+from src.util import hash_password, phone_rev, search_key
+
+BENCH_EMAIL = "bench@bench.local"
+BENCH_PASSWORD = "bench123"
+CHUNK = 10_000
+
+# nomes com acento e repetição realistas, para a busca do balcão ter o que filtrar
+FIRST_NAMES = (
+    "Ana", "Maria", "José", "João", "Antônio", "Francisco", "Carlos", "Paulo", "Pedro", "Lucas",
+    "Luiz", "Marcos", "Luís", "Gabriel", "Rafael", "Márcia", "Daniel", "Marcelo", "Bruno", "Eduardo",
+    "Juliana", "Patrícia", "Aline", "Sandra", "Camila", "Amanda", "Letícia", "Júlia", "Beatriz", "Fábio",
+    "Vitória", "Renata", "Cláudia", "Sérgio", "Vinícius", "Thaís", "Débora", "Igor", "Otávio", "Conceição",
+)
+LAST_NAMES = (
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+    "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+    "Rocha", "Dias", "Nascimento", "Andrade", "Moreira", "Nunes", "Marques", "Machado", "Mendes", "Freitas",
+    "Cardoso", "Ramos", "Gonçalves", "Santana", "Teixeira", "Araújo", "Conceição", "Simões", "Brandão", "Peçanha",
+)
+
+
+def _chunks(rows, size=CHUNK):
+    buf = []
+    for row in rows:
+        buf.append(row)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def current_sizes(db) -> dict:
+    return {
+        "stores": db.scalar(select(func.count(Store.id))),
+        "clients": db.scalar(select(func.count(Client.id))),
+        "visits": db.scalar(select(func.count(Visit.id))),
+    }
+
+
+class NotBenchDatabase(RuntimeError):
+    """A base tem dados que não vieram do seed; recriá-la apagaria dados reais."""
+
+
+def is_bench_database(db) -> bool:
+    """Base vazia ou só com dados do seed (usuário BENCH_EMAIL, lojas "Loja Bench N")."""
+    foreign = (
+        select(User.id).where(User.email != BENCH_EMAIL),
+        select(Store.id).where(Store.name.not_like("Loja Bench %")),
+        select(Client.id).where(Client.store_id.is_(None)),
+    )
+    return all(db.scalar(q.limit(1)) is None for q in foreign)
+
+
+def require_bench_database(db) -> None:
+    if not is_bench_database(db):
+        raise NotBenchDatabase(
+            "a base não é de bench (há usuários ou lojas que não vieram do bench/seed.py);"
+            " aponte DATABASE_URL para uma base vazia/de bench"
+        )
+
+
+def seed(stores: int = 5, clients: int = 10_000, visits: int = 100_000,
+         meta: int = 10, days: int = 365, rng_seed: int = 42) -> dict:
+    """Apaga os dados e gera um conjunto novo. Devolve tamanhos e tempo gasto.
+
+    NotBenchDatabase (sem apagar nada) se a base tiver dados que não são de bench.
+    """
+    ensure_schema()
+    rng = random.Random(rng_seed)
+    t0 = time.perf_counter()
+    db = SessionLocal()
+    try:
+        require_bench_database(db)
+        for model in (DailyStat, Redemption, Visit, User, Client, Store):
+            db.execute(delete(model))
+        db.commit()
+
+        db.execute(insert(Store), [
+            {"id": i, "name": f"Loja Bench {i}", "meta_visitas": meta}
+            for i in range(1, stores + 1)
+        ])
+        db.execute(insert(User), [{
+            "name": "Bench", "email": BENCH_EMAIL, "password_hash": hash_password(BENCH_PASSWORD),
+            "role": "ADMIN", "lock_loja": False, "store_id": None,
+        }])
+
+        # distribuição enviesada (poucos clientes muito frequentes), como na vida real
+        weights = [1.0 / (1 + i % 50) for i in range(clients)]
+        client_ids = rng.choices(range(1, clients + 1), weights=weights, k=visits)
+        counts = Counter(client_ids)
+
+        # ciclos já fechados a cada `per_cycle` visitas (consistente com balance.reconcile)
+        per_cycle = meta + 5
+        now = datetime.utcnow()
+        start = now - timedelta(days=days)
+
+        def client_rows():
+            for cid in range(1, clients + 1):
+                bday = date(rng.randint(1950, 2005), rng.randint(1, 12), rng.randint(1, 28))
+                n = counts.get(cid, 0)
+                name = " ".join((rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(LAST_NAMES)))
+                phone = f"1199{rng.randrange(10 ** 7):07d}"
+                yield {
+                    "id": cid, "name": name, "name_key": search_key(name), "cpf": f"{cid:011d}",
+                    "cpf_key": f"{cid:011d}",
+                    "phone": phone, "phone_rev": phone_rev(phone), "email": None,
+                    "birthday": bday.isoformat(), "birth_month": bday.month, "birth_day": bday.day,
+                    "store_id": 1 + cid % stores, "visits_total": n,
+                    "cycle": n // per_cycle, "visits_cycle": n % per_cycle,
+                    "created_at": start + timedelta(seconds=rng.randint(0, days * 86400)),
+                }
+
+        for chunk in _chunks(client_rows()):
+            db.execute(insert(Client), chunk)
+        db.commit()
+
+        def visit_rows():
+            seen = Counter()
+            for cid in client_ids:
+                seen[cid] += 1
+                yield {
+                    "client_id": cid, "store_id": 1 + cid % stores,
+                    "cycle": (seen[cid] - 1) // per_cycle,
+                    "created_at": start + timedelta(seconds=rng.randint(0, days * 86400)),
+                }
+
+        for chunk in _chunks(visit_rows()):
+            db.execute(insert(Visit), chunk)
+            db.commit()
+
+        stats.rebuild(db)
+        db.commit()
+        if db.get_bind().dialect.name == "postgresql":
+            db.connection().exec_driver_sql("ANALYZE")
+            db.commit()
+        sizes = current_sizes(db)
+    finally:
+        db.close()
+    return {**sizes, "seconds": round(time.perf_counter() - t0, 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stores", type=int, default=5)
+    ap.add_argument("--visits", type=int, default=100_000)
+    ap.add_argument("--clients", type=int, default=None, help="padrão: visits / 10")
+    args = ap.parse_args()
+    clients = args.clients or max(1, args.visits // 10)
+    try:
+        print(json.dumps(seed(args.stores, clients, args.visits), indent=2))
+    except NotBenchDatabase as e:
+        sys.exit(f"seed: {e}")
+
+
+if __name__ == "__main__":
+    main()
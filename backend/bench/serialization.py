@@ -0,0 +1,148 @@
+"""Benchmark do caminho de leitura das listagens (src/serializers.py).
+
+Uso (a partir de backend/):
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.serialization
+    DATABASE_URL=postgresql+psycopg://... python -m bench.serialization --rows 100 --n 300
+
+Para cada listagem, monta a mesma página de --rows linhas dos dois jeitos:
+
+  - antes: entidades ORM (identity map) -> dict campo a campo -> json da
+    stdlib (provider padrão do Flask);
+  - agora: só as colunas da projeção (Row) -> `Projection.dump` -> provider
+    do app (orjson quando instalado).
+
+Mede o tempo por página (consulta + serialização e só serialização) e o
+pico de memória alocada (tracemalloc). Só lê: roda em qualquer base com
+linhas suficientes; --reseed recria a base do bench/seed.py (só numa base
+vazia ou de bench).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from src import serializers
+from src.db import SessionLocal
+from src.main import app
+from src.models import Client, User, Visit, Redemption
+from src.schema import ensure_schema
+
+from .seed import NotBenchDatabase, current_sizes, seed
+
+# (projeção, entidade, ordem, dict "antigo" por linha)
+CASES = {
+    "list_clients": (
+        serializers.CLIENT, Client, Client.created_at.desc(),
+        lambda c: {"id": c.id, "name": c.name, "cpf": c.cpf, "phone": c.phone,
+                   "email": c.email, "birthday": c.birthday, "store_id": c.store_id},
+    ),
+    "listar_visitas": (
+        serializers.VISIT, Visit, Visit.created_at.desc(),
+        lambda v: {"id": v.id, "client_id": v.client_id, "store_id": v.store_id,
+                   "created_at": v.created_at.isoformat()},
+    ),
+    "listar_resgates": (
+        serializers.REDEMPTION, Redemption, Redemption.created_at.desc(),
+        lambda r: {"id": r.id, "gift_name": r.gift_name, "created_at": r.created_at.isoformat()},
+    ),
+    "birthday_list": (
+        serializers.BIRTHDAY, Client, Client.birth_month,
+        lambda c: {"id": c.id, "name": c.name, "cpf": c.cpf, "birthday": c.birthday},
+    ),
+    "list_users": (
+        serializers.USER, User, User.id.desc(),
+        lambda u: {"id": u.id, "name": u.name, "email": u.email, "role": u.role,
+                   "lock_loja": u.lock_loja, "store_id": u.store_id},
+    ),
+}
+
+
+def _measure(fn, n):
+    fn()  # aquece caches de compilação do SQLAlchemy
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    per_call = (time.perf_counter() - t0) / n
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return per_call * 1e6, peak
+
+
+def run(rows: int, n: int) -> dict:
+    legacy_json = DefaultJSONProvider(app)
+    results = {"provider": type(app.json).__name__, "rows": rows}
+    db = SessionLocal()
+    try:
+        for name, (proj, entity, order, to_dict) in CASES.items():
+            def before():
+                items = db.execute(select(entity).order_by(order).limit(rows)).scalars().all()
+                out = legacy_json.dumps([to_dict(x) for x in items])
+                db.expunge_all()
+                return out
+
+            def after():
+                items = db.execute(select(*proj.columns).order_by(order).limit(rows)).all()
+                return app.json.dumps(proj.dump(items))
+
+            before_items = db.execute(select(entity).order_by(order).limit(rows)).scalars().all()
+            after_items = db.execute(select(*proj.columns).order_by(order).limit(rows)).all()
+            db.expunge_all()
+
+            def before_encode():
+                return legacy_json.dumps([to_dict(x) for x in before_items])
+
+            def after_encode():
+                return app.json.dumps(proj.dump(after_items))
+
+            old_us, old_peak = _measure(before, n)
+            new_us, new_peak = _measure(after, n)
+            old_enc, _ = _measure(before_encode, n)
+            new_enc, _ = _measure(after_encode, n)
+            results[name] = {
+                "before_us": round(old_us, 1), "after_us": round(new_us, 1),
+                "speedup": round(old_us / new_us, 2) if new_us else None,
+                "encode_before_us": round(old_enc, 1), "encode_after_us": round(new_enc, 1),
+                "peak_kib_before": old_peak // 1024, "peak_kib_after": new_peak // 1024,
+            }
+            print(f"{name}: {results[name]}")
+    finally:
+        db.close()
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100, help="linhas por página")
+    ap.add_argument("--n", type=int, default=200, help="repetições por caso")
+    ap.add_argument("--visits", type=int, default=20_000, help="tamanho da base com --reseed")
+    ap.add_argument("--reseed", action="store_true",
+                    help="apaga e recria a base sintética (só numa base vazia/de bench)")
+    args = ap.parse_args()
+
+    ensure_schema()
+    if args.reseed:
+        try:
+            seed(clients=max(args.rows, args.visits // 10), visits=args.visits)
+        except NotBenchDatabase as e:
+            sys.exit(f"seed: {e}")
+    db = SessionLocal()
+    try:
+        sizes = current_sizes(db)
+    finally:
+        db.close()
+    if sizes["visits"] < args.rows or sizes["clients"] < args.rows:
+        sys.exit(f"bench: a base tem menos de {args.rows} linhas; rode com --reseed numa base de bench")
+
+    print(json.dumps(run(args.rows, args.n), indent=2))
+
+
+if __name__ == "__main__":
+    main()
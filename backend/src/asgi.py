@@ -0,0 +1,321 @@
+"""Porta de entrada ASGI: as rotas de balcão e dashboard com engine async.
+
+    uvicorn src.asgi:app --workers 2
+    gunicorn -w 2 -k uvicorn.workers.UvicornWorker -b 0.0.0.0:$PORT src.asgi:app
+
+No modo WSGI (src.main:app, gunicorn gthread) cada requisição prende uma
+thread e uma conexão do pool enquanto espera o PostgreSQL; a concorrência
+fica limitada a threads x workers. Aqui as rotas mais chamadas pelos
+terminais — login/me, clientes (lista, busca, cadastro), visitas (uma, lote,
+lista), resgate e dashboard (kpis, aniversariantes) — rodam num event loop:
+
+  - `create_async_engine` (psycopg async no PostgreSQL, aiosqlite no SQLite);
+  - o corpo de cada rota é o mesmo do Flask (src/handlers.py), executado com
+    `AsyncSession.run_sync`: cada consulta espera o banco sem bloquear o loop;
+  - bcrypt continua no pool de src/passwords.py (`verify_async`);
+  - JWT emitido/validado com as mesmas chaves e claims do Flask-JWT-Extended
+    (tokens valem nos dois modos), revogação por token_version inclusive;
+  - ETag/304 dos dashboards com os mesmos validadores de src/httpcache.py.
+
+Todo o resto (admin, importação, exportações, cartão, _metrics, seed) segue
+para o app Flask, montado como WSGI no mesmo processo. As métricas por
+requisição de /api/_metrics só cobrem as rotas Flask; as consultas lentas do
+engine async entram na amostragem normalmente.
+
+Pool async: ASYNC_POOL_SIZE (20) + ASYNC_MAX_OVERFLOW (10) conexões por worker
+no primário e outro tanto (ASYNC_READ_POOL_SIZE/ASYNC_READ_MAX_OVERFLOW) no
+banco de leitura de src/db.py; as rotas GET seguem o mesmo `read_router` do
+modo WSGI (réplica, salvo escrita recente do usuário ou réplica atrasada).
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional, Union
+
+import jwt as pyjwt
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MultiDict
+
+from . import handlers, httpcache, metrics, passwords, stores
+from .auth import Identity, identity_from_claims, is_revoked, keep_tokens, token_claims, token_versions
+from .db import DATABASE_URL, READ_DATABASE_URL, READ_MARKER_HEADER, async_database_url, read_router
+from .main import allowed_origins, app as flask_app
+from .models import User
+from .passwords import PoolSaturated
+
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "20"))
+ASYNC_MAX_OVERFLOW = int(os.getenv("ASYNC_MAX_OVERFLOW", "10"))
+ASYNC_READ_POOL_SIZE = int(os.getenv("ASYNC_READ_POOL_SIZE", str(ASYNC_POOL_SIZE)))
+ASYNC_READ_MAX_OVERFLOW = int(os.getenv("ASYNC_READ_MAX_OVERFLOW", str(ASYNC_MAX_OVERFLOW)))
+TOKEN_EXPIRES = timedelta(hours=8)
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+
+def _async_engine(url: str, pool_size: int, max_overflow: int):
+    url = async_database_url(url)
+    eng = create_async_engine(
+        url,
+        pool_pre_ping=True,
+        # SQLite em memória usa StaticPool, que não aceita tamanho de pool
+        **({} if url.startswith("sqlite") else {
+            "pool_size": pool_size, "max_overflow": max_overflow,
+        }),
+    )
+    metrics.instrument_engine(eng.sync_engine)
+    return eng
+
+
+async_engine = _async_engine(DATABASE_URL, ASYNC_POOL_SIZE, ASYNC_MAX_OVERFLOW)
+async_read_engine = _async_engine(READ_DATABASE_URL, ASYNC_READ_POOL_SIZE, ASYNC_READ_MAX_OVERFLOW)
+
+
+class _SyncSession(Session):
+    """Sessão síncrona por trás de cada AsyncSession (é ela que `run_sync` recebe)."""
+
+
+# versões por tabela também nas escritas feitas por aqui
+httpcache.track(_SyncSession)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, sync_session_class=_SyncSession, autoflush=False,
+    # atributos lidos depois do commit não podem disparar I/O fora do run_sync
+    expire_on_commit=False,
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, sync_session_class=_SyncSession, autoflush=False, expire_on_commit=False,
+)
+
+
+async def _session_factory(method: str, user: Identity, marker: Optional[str] = None) -> async_sessionmaker:
+    """Primário para escrita; para leitura, a mesma escolha de `read_router.factory`."""
+    if method in WRITE_METHODS:
+        return AsyncSessionLocal
+    if read_router.stale():
+        # conferência da réplica é síncrona (engines de src/db.py): fora do event loop
+        await run_in_threadpool(read_router.refresh)
+    return AsyncReadSessionLocal if read_router.use_read_engine(user.id, marker) else AsyncSessionLocal
+
+_jwt_config = flask_app.config
+
+
+# ---------- JWT ----------
+def _access_token(user: User) -> str:
+    """Mesmo formato do `create_access_token` do Flask-JWT-Extended."""
+    now = datetime.now(timezone.utc)
+    payload = {
+        "fresh": False, "iat": now, "jti": str(uuid.uuid4()), "type": "access",
+        _jwt_config["JWT_IDENTITY_CLAIM"]: str(user.id), "nbf": now, "exp": now + TOKEN_EXPIRES,
+        **token_claims(user),
+    }
+    return pyjwt.encode(payload, _jwt_config["JWT_SECRET_KEY"], algorithm=_jwt_config["JWT_ALGORITHM"])
+
+
+def _error(msg: str, status: int) -> Response:
+    # mesmas mensagens/status do Flask-JWT-Extended
+    return _json({"msg": msg}, status)
+
+
+async def _authenticate(request: Request) -> Union[Identity, Response]:
+    header = request.headers.get("Authorization", "")
+    if not header:
+        return _error("Missing Authorization Header", 401)
+    scheme, _, token = header.partition(" ")
+    if scheme != "Bearer" or not token:
+        return _error("Bad Authorization header. Expected 'Authorization: Bearer <JWT>'", 422)
+    try:
+        payload = pyjwt.decode(
+            token, _jwt_config["JWT_SECRET_KEY"], algorithms=[_jwt_config["JWT_ALGORITHM"]],
+            leeway=_jwt_config["JWT_DECODE_LEEWAY"],
+        )
+    except pyjwt.ExpiredSignatureError:
+        return _error("Token has expired", 401)
+    except pyjwt.InvalidTokenError as e:
+        return _error(str(e), 422)
+    if payload.get("type") != "access":
+        return _error("Only non-refresh tokens are allowed", 422)
+
+    claim = _jwt_config["JWT_IDENTITY_CLAIM"]
+    try:
+        user_id = int(payload[claim])
+    except (KeyError, TypeError, ValueError):
+        return _error("Token has been revoked", 401)
+    if token_versions.stale(user_id):
+        # recarga do mapa é síncrona (SessionLocal): fora do event loop
+        await run_in_threadpool(token_versions.get, user_id)
+    if is_revoked(payload, claim):
+        return _error("Token has been revoked", 401)
+    return identity_from_claims(payload[claim], payload)
+
+
+# ---------- respostas ----------
+def _json(payload: Any, status: int = 200, headers: Optional[dict] = None) -> Response:
+    # provider do app Flask: orjson e datas em ISO, como no modo WSGI
+    return Response(flask_app.json.dumps(payload), status, headers, media_type="application/json")
+
+
+async def _body(request: Request) -> Optional[dict]:
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return data if isinstance(data, dict) else {}
+
+
+def _args(request: Request) -> MultiDict:
+    return MultiDict(request.query_params.multi_items())
+
+
+def _route(path: str, handler, method: str = "GET", name: Optional[str] = None,
+           tables=(), dated: bool = False) -> Route:
+    """Rota autenticada que executa `handler(db, user, args|data)` via run_sync.
+
+    `name` é o endpoint do Flask: entra no ETag (`tables`/`dated`, como em
+    `httpcache.conditional`), então um 304 vale em qualquer dos dois modos.
+    """
+    endpoint_name = name or handler.__name__
+
+    async def endpoint(request: Request) -> Response:
+        user = await _authenticate(request)
+        if isinstance(user, Response):
+            return user
+        if method == "GET":
+            params = _args(request)
+        else:
+            params = await _body(request)
+            if params is None:
+                return _json({"error": "JSON inválido"}, 400)
+
+        if stores.registry.stale():
+            # os handlers leem metas/lojas do cadastro; a recarga usa SessionLocal (síncrona)
+            await run_in_threadpool(stores.registry.refresh)
+        session_factory = await _session_factory(method, user, request.headers.get(READ_MARKER_HEADER))
+        async with session_factory() as session:
+            validators = None
+            if tables:
+                validators = await session.run_sync(
+                    lambda db: httpcache.validators(
+                        endpoint_name, request.url.query, user, tables, dated, db=db)
+                )
+                etag, last_modified = validators
+                if httpcache.not_modified(request.headers.get("If-None-Match"),
+                                          request.headers.get("If-Modified-Since"),
+                                          etag, last_modified):
+                    return Response(status_code=304, headers=httpcache.response_headers(
+                        etag, last_modified, httpcache.REVALIDATE))
+            payload, status = await session.run_sync(handler, user, params)
+            if method in WRITE_METHODS:
+                # mesmo desfecho único de src/requestdb.py: commit se < 400
+                if status >= 400:
+                    await session.rollback()
+                else:
+                    try:
+                        await session.commit()
+                    except Exception:
+                        await session.rollback()
+                        return _json({"error": "Falha ao gravar"}, 500)
+
+        resp = _json(payload, status)
+        if method in WRITE_METHODS and status < 400:
+            resp.headers[READ_MARKER_HEADER] = read_router.wrote(user.id)
+        if validators and status == 200:
+            resp.headers.update(httpcache.response_headers(*validators, httpcache.REVALIDATE))
+        return resp
+
+    return Route(path, endpoint, methods=[method], name=endpoint_name)
+
+
+# ---------- auth ----------
+async def login(request: Request) -> Response:
+    data = await _body(request)
+    if data is None:
+        return _json({"error": "JSON inválido"}, 400)
+    email = data.get("email", "").strip().lower()
+    password = data.get("password", "")
+    async with AsyncSessionLocal() as session:
+        user = (await session.execute(select(User).where(User.email == email))).scalar_one_or_none()
+        try:
+            ok = bool(user) and await passwords.verify_async(password, user.password_hash)
+        except (PoolSaturated, TimeoutError):
+            # pool cheio ou fila que não andou em PASSWORD_TIMEOUT: mesmo 503
+            return _json({"error": "Muitos logins simultâneos, tente novamente"}, 503,
+                         {"Retry-After": str(passwords.RETRY_AFTER)})
+        if not ok:
+            return _json({"error": "Credenciais inválidas"}, 401)
+
+        if passwords.needs_rehash(user.password_hash):
+            # custo (BCRYPT_ROUNDS) mudou: regrava o hash com a senha que acabou de conferir
+            try:
+                user.password_hash = await passwords.hash_async(password)
+                keep_tokens(session.sync_session, user)
+                await session.commit()
+            except (PoolSaturated, TimeoutError):
+                await session.rollback()
+
+        return _json({
+            "token": _access_token(user),
+            "user": {
+                "id": user.id, "name": user.name, "email": user.email,
+                "role": user.role, "lock_loja": user.lock_loja, "store_id": user.store_id
+            },
+        })
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(_app):
+    # cadastro de lojas carregado antes do primeiro request, fora do event loop
+    await run_in_threadpool(stores.registry.warm)
+    yield
+    await async_engine.dispose()
+    await async_read_engine.dispose()
+
+
+def _cors_options() -> dict:
+    # mesma política do flask-cors em src/main.py (strings + regex de previews)
+    exact = [o for o in allowed_origins if isinstance(o, str)]
+    patterns = [o.pattern for o in allowed_origins if not isinstance(o, str)]
+    return {
+        "allow_origins": exact,
+        "allow_origin_regex": "|".join(f"(?:{p})" for p in patterns) or None,
+        "allow_credentials": True,
+        "allow_methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization", "If-None-Match", "If-Modified-Since",
+                          READ_MARKER_HEADER],
+        "expose_headers": ["ETag", "Last-Modified", READ_MARKER_HEADER],
+    }
+
+
+app = Starlette(
+    routes=[
+        Route("/api/auth/login", login, methods=["POST"]),
+        _route("/api/auth/me", lambda db, user, _: handlers.me(db, user), name="me"),
+        _route("/api/clientes", handlers.list_clients),
+        _route("/api/clientes", handlers.create_client, "POST"),
+        _route("/api/clientes/search", handlers.search_clients, name="buscar_clientes"),
+        _route("/api/visitas", handlers.register_visit, "POST", name="visita_bp.registrar_visita"),
+        _route("/api/visitas/lote", handlers.register_visits_batch, "POST",
+               name="visita_bp.registrar_visitas_lote"),
+        _route("/api/visitas", handlers.list_visits, name="visita_bp.listar_visitas"),
+        _route("/api/resgates", handlers.redeem_gift, "POST"),
+        _route("/api/dashboard/kpis", handlers.kpis, tables=("daily_stats",), dated=True),
+        _route("/api/dashboard/aniversariantes", handlers.birthday_list,
+               tables=("clients_profile",), dated=True),
+        # demais rotas: o app Flask, como WSGI
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, **_cors_options())],
+    lifespan=_lifespan,
+)
@@ -0,0 +1,209 @@
+"""Identidade da requisição montada a partir das claims do JWT.
+
+As rotas protegidas não precisam mais ir ao banco para saber quem é o usuário:
+`role`, `lock_loja`, `store_id` etc. já vêm assinados no token emitido no login.
+Para ainda conseguir revogar tokens (usuário rebaixado ou excluído) o token
+carrega `tv` (token_version); comparamos com a versão do usuário guardada em
+memória, consultada por usuário (uma linha por PK) e válida por
+TOKEN_VERSION_TTL segundos.
+
+`track()` incrementa `token_version` em todo flush que muda `role`,
+`lock_loja`, `store_id` ou `password_hash` de um usuário, e o commit limpa a
+versão em cache dele neste worker; os demais workers veem em até
+TOKEN_VERSION_TTL. Um rehash com a mesma senha (login com BCRYPT_ROUNDS
+novo) passa por `keep_tokens` e não revoga nada.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from flask import current_app, g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import User
+
+TOKEN_VERSION_TTL = float(os.getenv("TOKEN_VERSION_TTL", "30"))
+# colunas que, alteradas, derrubam os tokens já emitidos (claims ou senha)
+REVOKING_COLUMNS = ("role", "lock_loja", "store_id", "password_hash")
+
+
+@dataclass(frozen=True)
+class Identity:
+    id: int
+    role: str
+    lock_loja: bool
+    store_id: Optional[int]
+    token_version: int = 0
+    name: Optional[str] = None
+    email: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "name": self.name, "email": self.email,
+            "role": self.role, "lock_loja": self.lock_loja, "store_id": self.store_id,
+        }
+
+
+def token_claims(user: User) -> Dict[str, Any]:
+    """Claims adicionais gravadas no access token no login."""
+    return {
+        "role": user.role,
+        "lock_loja": user.lock_loja,
+        "store_id": user.store_id,
+        "name": user.name,
+        "email": user.email,
+        "tv": user.token_version or 0,
+    }
+
+
+def identity_from_claims(identity: Any, claims: Dict[str, Any]) -> Identity:
+    """Identity a partir do `sub` e das claims de um token já validado."""
+    return Identity(
+        id=int(identity),
+        role=claims.get("role") or "ATENDENTE",
+        lock_loja=bool(claims.get("lock_loja")),
+        store_id=claims.get("store_id"),
+        token_version=int(claims.get("tv") or 0),
+        name=claims.get("name"),
+        email=claims.get("email"),
+    )
+
+
+def current_user() -> Optional[Identity]:
+    """Identidade da requisição atual (cacheada em `g`), sem consulta ao banco."""
+    if "identity" in g:
+        return g.identity
+    identity = get_jwt_identity()
+    if not identity:
+        return None
+    g.identity = identity_from_claims(identity, get_jwt())
+    return g.identity
+
+
+class _TokenVersions:
+    """{user_id: (token_version, consultado em)} compartilhado pelas threads do worker."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._versions: Dict[int, Tuple[Optional[int], float]] = {}
+
+    def _load(self, user_id: int) -> Tuple[Optional[int], float]:
+        db = SessionLocal()
+        try:
+            row = db.execute(select(User.token_version).where(User.id == user_id)).first()
+        finally:
+            db.close()
+        # usuário excluído também fica em cache (None): token revogado sem nova consulta
+        entry = self._versions[user_id] = (int(row[0] or 0) if row else None, time.monotonic())
+        return entry
+
+    @staticmethod
+    def _expired(entry: Optional[Tuple[Optional[int], float]]) -> bool:
+        return entry is None or time.monotonic() - entry[1] > TOKEN_VERSION_TTL
+
+    def stale(self, user_id: int) -> bool:
+        """True se `get(user_id)` vai consultar o banco."""
+        return self._expired(self._versions.get(user_id))
+
+    def get(self, user_id: int) -> Optional[int]:
+        entry = self._versions.get(user_id)
+        if self._expired(entry):
+            with self._lock:
+                # outra thread pode ter consultado enquanto esperávamos
+                entry = self._versions.get(user_id)
+                if self._expired(entry):
+                    entry = self._load(user_id)
+        return entry[0]
+
+    def invalidate(self, user_ids: Optional[Iterable[int]] = None) -> None:
+        """Esquece as versões de `user_ids` (todas, sem argumento)."""
+        if user_ids is None:
+            self._versions = {}
+            return
+        for user_id in user_ids:
+            self._versions.pop(user_id, None)
+
+
+token_versions = _TokenVersions()
+
+
+def token_is_revoked(jwt_header: Dict[str, Any], jwt_payload: Dict[str, Any]) -> bool:
+    """Callback de `token_in_blocklist_loader`: usuário excluído ou com versão nova."""
+    return is_revoked(jwt_payload, current_app.config["JWT_IDENTITY_CLAIM"])
+
+
+def is_revoked(jwt_payload: Dict[str, Any], identity_claim: str = "sub") -> bool:
+    try:
+        user_id = int(jwt_payload[identity_claim])
+    except (KeyError, TypeError, ValueError):
+        return True
+    version = token_versions.get(user_id)
+    if version is None:
+        return True
+    return int(jwt_payload.get("tv") or 0) != version
+
+
+# ---------- revogação ----------
+def keep_tokens(db: Session, user: User) -> None:
+    """A troca de `password_hash` de `user` neste flush é só rehash (mesma senha): não revoga."""
+    db.info.setdefault("same_password", set()).add(user.id)
+
+
+def revoke_tokens(db: Session, user_ids: Iterable[int]) -> None:
+    """Derruba os tokens de `user_ids` via Core (scripts, UPDATE em massa); vale no commit."""
+    ids = sorted(set(user_ids))
+    if ids:
+        db.execute(
+            update(User).where(User.id.in_(ids)).values(token_version=User.token_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.info.setdefault("revoked_users", set()).update(ids)
+
+
+def _before_update(mapper, connection, target: User) -> None:
+    state = inspect(target)
+    changed = {col for col in REVOKING_COLUMNS if state.attrs[col].history.has_changes()}
+    if state.session is not None and target.id in state.session.info.get("same_password", ()):
+        changed.discard("password_hash")
+    if not changed:
+        return
+    target.token_version = (target.token_version or 0) + 1
+    if state.session is not None:
+        state.session.info.setdefault("revoked_users", set()).add(target.id)
+
+
+def _after_delete(mapper, connection, target: User) -> None:
+    session = inspect(target).session
+    if session is not None:
+        session.info.setdefault("revoked_users", set()).add(target.id)
+
+
+def _after_commit(session: Session) -> None:
+    session.info.pop("same_password", None)
+    revoked = session.info.pop("revoked_users", None)
+    if revoked:
+        token_versions.invalidate(revoked)
+
+
+def _after_rollback(session: Session) -> None:
+    session.info.pop("same_password", None)
+    session.info.pop("revoked_users", None)
+
+
+def track() -> None:
+    """Revogação automática: registra os eventos em User e no commit das sessões."""
+    for target, name, fn in (
+        (User, "before_update", _before_update),
+        (User, "after_delete", _after_delete),
+        (Session, "after_commit", _after_commit),
+        (Session, "after_rollback", _after_rollback),
+    ):
+        if not event.contains(target, name, fn):
+            event.listen(target, name, fn)
@@ -0,0 +1,126 @@
+"""Saldo de visitas materializado em `clients` (ledger por ciclo).
+
+`clients.cycle` é a época atual do cliente; cada visita grava o ciclo em que
+entrou (`visits.cycle`) e cada resgate consome o ciclo inteiro: incrementa
+`clients.cycle` e grava o ciclo consumido em `redemptions.cycle`. Visitas
+nunca são apagadas, então o histórico fica disponível para análise.
+
+`visits_total` conta todas as visitas do cliente (vitalício) e `visits_cycle`
+as visitas do ciclo atual. Os contadores são atualizados na mesma transação
+do INSERT da visita / do resgate, então as rotas quentes leem o saldo direto
+da linha do cliente em vez de COUNT(*).
+
+Ordem de locks: o UPDATE em `clients` vem antes do INSERT da visita, assim a
+visita sempre recebe o ciclo vigente mesmo com um resgate concorrente.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+
+from .models import Client, Visit
+
+RECONCILE_CHUNK = 5000
+
+
+def add_visits(db: Session, client_id: int, n: int = 1) -> Tuple[int, int, int]:
+    """Soma `n` visitas ao saldo (travando a linha do cliente).
+
+    Devolve (visits_cycle, visits_total, cycle) já atualizados; `cycle` é o
+    valor a gravar em `Visit.cycle`.
+    """
+    row = db.execute(
+        update(Client)
+        .where(Client.id == client_id)
+        .values(
+            visits_total=Client.visits_total + n,
+            visits_cycle=Client.visits_cycle + n,
+        )
+        .returning(Client.visits_cycle, Client.visits_total, Client.cycle)
+    ).one()
+    return int(row[0]), int(row[1]), int(row[2])
+
+
+def add_visits_bulk(db: Session, counts: Dict[int, int]) -> Dict[int, Tuple[int, int, int]]:
+    """Versão em lote de `add_visits` ({client_id: n}): um UPDATE executemany + um SELECT.
+
+    Devolve {client_id: (visits_cycle, visits_total, cycle)} já atualizados.
+    """
+    if not counts:
+        return {}
+    t = Client.__table__
+    db.execute(
+        update(t)
+        .where(t.c.id == bindparam("cid"))
+        .values(
+            visits_total=t.c.visits_total + bindparam("n"),
+            visits_cycle=t.c.visits_cycle + bindparam("n"),
+        ),
+        # ordem fixa de ids evita deadlock entre lotes concorrentes
+        [{"cid": cid, "n": n} for cid, n in sorted(counts.items())],
+    )
+    rows = db.execute(
+        select(Client.id, Client.visits_cycle, Client.visits_total, Client.cycle)
+        .where(Client.id.in_(list(counts)))
+    )
+    return {cid: (int(n), int(total), int(cycle)) for cid, n, total, cycle in rows}
+
+
+def lock_client(db: Session, *conds) -> Optional[Client]:
+    """SELECT ... FOR UPDATE do cliente: serializa resgates (e visitas) do mesmo cliente."""
+    return db.execute(select(Client).where(*conds).with_for_update()).scalar_one_or_none()
+
+
+def close_cycle(db: Session, client_id: int) -> int:
+    """Fecha o ciclo atual num resgate: nova época e saldo do ciclo zerado.
+
+    O total vitalício é preservado e nenhuma visita é apagada. Devolve o
+    ciclo consumido (para `Redemption.cycle`).
+    """
+    new_cycle = db.execute(
+        update(Client)
+        .where(Client.id == client_id)
+        .values(cycle=Client.cycle + 1, visits_cycle=0)
+        .returning(Client.cycle)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+    return int(new_cycle) - 1
+
+
+def reconcile(db: Session, client_ids: Optional[Iterable[int]] = None) -> int:
+    """Reconstrói os contadores a partir de `visits`. Devolve quantos clientes foram processados.
+
+    O ciclo atual são as visitas com `visits.cycle = clients.cycle`. O total
+    vitalício nunca é reduzido: bases antigas ainda não têm as visitas que o
+    resgate apagava antes do ledger.
+    """
+    if client_ids is not None:
+        ids = sorted(set(client_ids))
+    else:
+        ids = list(db.execute(select(Client.id).order_by(Client.id)).scalars())
+
+    cnt = (
+        select(func.count(Visit.id))
+        .where(Visit.client_id == Client.id)
+        .scalar_subquery()
+    )
+    cnt_cycle = (
+        select(func.count(Visit.id))
+        .where(Visit.client_id == Client.id, Visit.cycle == Client.cycle)
+        .scalar_subquery()
+    )
+    for i in range(0, len(ids), RECONCILE_CHUNK):
+        chunk = ids[i:i + RECONCILE_CHUNK]
+        db.execute(
+            update(Client)
+            .where(Client.id.in_(chunk))
+            .values(
+                visits_cycle=cnt_cycle,
+                visits_total=case((Client.visits_total > cnt, Client.visits_total), else_=cnt),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    return len(ids)
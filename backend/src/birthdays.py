@@ -0,0 +1,84 @@
+"""Filtros de aniversário sobre as colunas indexadas birth_month/birth_day.
+
+`birthday` continua sendo a string 'YYYY-MM-DD'; os filtros aqui viram
+range scans no índice (birth_month, birth_day) em vez de parsear a data de
+cada cliente.
+"""
+from __future__ import annotations
+
+import calendar
+from datetime import date, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import Integer, and_, cast, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from .models import Client
+
+BACKFILL_CHUNK = 5000
+
+
+def month_filter(month: int):
+    return Client.birth_month == month
+
+
+def _segments(start: date, days: int) -> List[Tuple[int, int, int]]:
+    """Quebra [start, start+days) em trechos (mês, dia_ini, dia_fim) dentro de cada mês."""
+    if days >= 366:
+        return [(m, 1, 31) for m in range(1, 13)]
+    segs: List[Tuple[int, int, int]] = []
+    end = start + timedelta(days=max(days, 1) - 1)
+    cur = start
+    while cur <= end:
+        last = date(cur.year, cur.month, calendar.monthrange(cur.year, cur.month)[1])
+        seg_end = min(last, end)
+        to_day = seg_end.day
+        # 29/02 entra junto com o dia 28 em anos não bissextos
+        if cur.month == 2 and to_day == 28 and not calendar.isleap(cur.year):
+            to_day = 29
+        segs.append((cur.month, cur.day, to_day))
+        cur = seg_end + timedelta(days=1)
+    return segs
+
+
+def window_filter(start: date, days: int):
+    """Aniversariantes de `start` até `days` dias à frente (inclusive `start`)."""
+    return or_(*(
+        and_(Client.birth_month == m, Client.birth_day.between(d1, d2))
+        for m, d1, d2 in _segments(start, days)
+    ))
+
+
+def next_occurrence(birth_month: int, birth_day: int, today: date) -> date:
+    """Próxima data (>= today) em que cai o aniversário; usada para ordenar a janela."""
+    for year in (today.year, today.year + 1):
+        day = min(birth_day, calendar.monthrange(year, birth_month)[1])
+        d = date(year, birth_month, day)
+        if d >= today:
+            return d
+    return d
+
+
+def backfill(db: Session) -> int:
+    """Preenche birth_month/birth_day de clientes antigos. Devolve quantos foram atualizados."""
+    pending = (
+        select(Client.id)
+        .where(Client.birthday.is_not(None), Client.birth_month.is_(None))
+        .order_by(Client.id)
+    )
+    ids = list(db.execute(pending).scalars())
+    total = 0
+    for i in range(0, len(ids), BACKFILL_CHUNK):
+        chunk = ids[i:i + BACKFILL_CHUNK]
+        res = db.execute(
+            update(Client)
+            .where(Client.id.in_(chunk), Client.birthday.like("____-__-__"))
+            .values(
+                birth_month=cast(func.substr(Client.birthday, 6, 2), Integer),
+                birth_day=cast(func.substr(Client.birthday, 9, 2), Integer),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        total += res.rowcount or 0
+        db.commit()
+    return total
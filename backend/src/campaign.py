@@ -0,0 +1,364 @@
+"""Campanha mensal de aniversariantes: cartão + link do WhatsApp por cliente.
+
+`Job(mes, ano).run()` percorre os aniversariantes do mês em streaming
+(src/exports.py, pool de leitura) e grava, de forma incremental, numa pasta
+por campanha (CAMPAIGN_DIR/aniversario_AAAA_MM, com sufixo _lojaN se for de uma loja):
+
+  cards/<etag>.png   um PNG por cartão distinto — clientes com o mesmo
+                     primeiro nome e saldo compartilham o arquivo
+  manifest.ndjson    uma linha por cliente: id, nome, telefone, nascimento,
+                     loja, visitas, cartão e whatsapp_url (wa.me, UTF-8
+                     percent-encoded, como no PATCH_whatsapp_unicode_only)
+  status.json        progresso e vazão (clientes/s), lido pela rota de status
+  campanha.zip       no fim: cards + manifest + contatos.csv (Excel pt-BR)
+
+Os cartões são renderizados num pool de processos (CAMPAIGN_WORKERS, padrão
+todos os núcleos; `spawn`, com `nice` para não disputar CPU com os workers
+web). O manifest sai em ordem de id e só depois dos PNGs do lote: rodar de
+novo retoma do último id gravado. Um lock de arquivo impede duas execuções
+da mesma campanha.
+
+A campanha roda só na CLI `birthday-campaign`; a rota de admin usa
+`Job.launch()`, que dispara essa CLI num processo próprio (nova sessão, log em
+campanha.log): reciclar ou derrubar o worker web não interrompe a geração.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import select
+
+from . import exports, imagegen, stores
+from .handlers import DEFAULT_META, GIFT_NAME
+from .models import Client
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+CAMPAIGN_DIR = os.getenv("CAMPAIGN_DIR", os.path.join(tempfile.gettempdir(), "campanhas"))
+CAMPAIGN_WORKERS = int(os.getenv("CAMPAIGN_WORKERS", "0")) or os.cpu_count() or 1
+# clientes por lote: um map no pool + um append/fsync no manifest
+CAMPAIGN_BATCH = int(os.getenv("CAMPAIGN_BATCH", "2000"))
+CAMPAIGN_NICE = int(os.getenv("CAMPAIGN_NICE", "10"))
+SITE_URL = "https://www.casadocigano.com.br/"
+
+HEART = "\u2764\uFE0F"   # ❤️
+PARTY = "\U0001F389"     # 🎉
+GIFT = "\U0001F381"      # 🎁
+HOURGLASS = "\u23F3"     # ⏳
+
+MANIFEST = "manifest.ndjson"
+STATUS = "status.json"
+ZIP_NAME = "campanha.zip"
+LOG_NAME = "campanha.log"
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# campos de cada linha do manifest, também cabeçalho do contatos.csv
+FIELDS = ["id", "nome", "telefone", "nascimento", "loja", "visitas", "meta", "cartao", "whatsapp_url"]
+
+
+# ---------- WhatsApp ----------
+def wa_number(phone: Optional[str]) -> Optional[str]:
+    """Telefone no formato do wa.me (55 + DDD + número); None se não for um celular/fixo BR."""
+    digits = re.sub(r"\D", "", phone or "").lstrip("0")
+    if len(digits) in (10, 11):
+        return "55" + digits
+    if len(digits) in (12, 13) and digits.startswith("55"):
+        return digits
+    return None
+
+
+def birthday_message(first: str, visitas: int, meta: int) -> str:
+    faltam = max(meta - visitas, 0)
+    if faltam == 0:
+        saldo = (
+            f"Você tem *{visitas}* visita(s) no nosso programa *CiganoLovers* — "
+            f"{PARTY} *já pode resgatar seu brinde!* {GIFT}\n"
+        )
+    else:
+        saldo = (
+            f"Você tem *{visitas}* visita(s) no nosso programa *CiganoLovers*.\n"
+            f"{HOURGLASS} Faltam *{faltam}* visita(s) para o brinde *{GIFT_NAME}* (meta *{meta}* visitas).\n"
+        )
+    return (
+        f"Oi, *{first}*! {PARTY} A Casa do Cigano deseja um feliz aniversário! {HEART}\n"
+        + saldo
+        + f"Confira as novidades em nossa loja: {SITE_URL}"
+    )
+
+
+def whatsapp_url(phone: Optional[str], message: str) -> Optional[str]:
+    number = wa_number(phone)
+    if not number:
+        return None
+    return f"https://wa.me/{number}?text=" + quote(message, safe="", encoding="utf-8")
+
+
+# ---------- job ----------
+class CampaignLocked(Exception):
+    """Outra execução desta campanha está em andamento."""
+
+
+def campaign_dir(month: int, year: int, store_id: Optional[int] = None) -> str:
+    suffix = f"_loja{store_id}" if store_id else ""
+    return os.path.join(CAMPAIGN_DIR, f"aniversario_{year}_{month:02d}{suffix}")
+
+
+def read_status(month: int, year: int, store_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(campaign_dir(month, year, store_id), STATUS), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+class Job:
+    """Uma campanha (mês/ano); `acquire()` + `run()`, ou só `run()` (adquire sozinho)."""
+
+    def __init__(self, month: int, year: Optional[int] = None, store_id: Optional[int] = None,
+                 workers: Optional[int] = None):
+        if not 1 <= month <= 12:
+            raise ValueError("mes inválido")
+        self.month = month
+        self.year = year or datetime.utcnow().year
+        self.store_id = store_id
+        self.workers = max(1, workers or CAMPAIGN_WORKERS)
+        self.dir = campaign_dir(month, self.year, store_id)
+        self.cards_dir = os.path.join(self.dir, "cards")
+        self._lock_fh = None
+        self.stats: Dict[str, Any] = {}
+
+    # ----- lock -----
+    def acquire(self) -> bool:
+        """Lock exclusivo da campanha (não bloqueia); False se outra execução o detém."""
+        if self._lock_fh is not None:
+            return True
+        os.makedirs(self.cards_dir, exist_ok=True)
+        fh = open(os.path.join(self.dir, ".lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                return False
+        self._lock_fh = fh
+        return True
+
+    def release(self) -> None:
+        if self._lock_fh is not None:
+            self._lock_fh.close()  # fechar solta o flock
+            self._lock_fh = None
+
+    def adopt_lock(self, fd: int) -> None:
+        """Assume o lock já obtido pelo processo que nos disparou (`Job.launch`), herdado em `fd`."""
+        self._lock_fh = os.fdopen(fd, "a")
+
+    def status(self) -> Optional[Dict[str, Any]]:
+        """Conteúdo de status.json (progresso, vazão, estado); None se nunca rodou."""
+        return read_status(self.month, self.year, self.store_id)
+
+    def queue(self) -> None:
+        """Marca a campanha como enfileirada (antes de o processo da CLI assumir)."""
+        self.stats = {"month": self.month, "year": self.year, "store_id": self.store_id}
+        self._write_status(state="queued")
+
+    # ----- estado em disco -----
+    def _resume_point(self) -> Tuple[int, int]:
+        """(último id gravado, linhas) do manifest; corta uma linha final incompleta."""
+        path = os.path.join(self.dir, MANIFEST)
+        if not os.path.exists(path):
+            return 0, 0
+        last_id, count, good = 0, 0, 0
+        with open(path, "rb") as fh:
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    last_id = int(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    break
+                count += 1
+                good += len(line)
+        if good != os.path.getsize(path):
+            with open(path, "r+b") as fh:
+                fh.truncate(good)
+        return last_id, count
+
+    def _write_status(self, **extra: Any) -> None:
+        self.stats.update(extra, updated_at=datetime.utcnow().isoformat(timespec="seconds"))
+        path = os.path.join(self.dir, STATUS)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.stats, fh, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def launch(self, restart: bool = False) -> bool:
+        """Dispara `flask birthday-campaign` desta campanha num processo separado do worker web.
+
+        False se a campanha já está rodando. O lock é obtido aqui e passa ao
+        processo filho pelo descritor herdado (--lock-fd), então duas chamadas
+        seguidas não disparam duas execuções. A saída vai para campanha.log.
+        """
+        if not self.acquire():
+            return False
+        try:
+            self.queue()
+            fd = self._lock_fh.fileno()
+            cmd = [sys.executable, "-m", "flask", "--app", "src.main", "birthday-campaign",
+                   "--mes", str(self.month), "--ano", str(self.year), "--workers", str(self.workers),
+                   "--lock-fd", str(fd)]
+            if self.store_id:
+                cmd += ["--store-id", str(self.store_id)]
+            if restart:
+                cmd.append("--restart")
+            with open(os.path.join(self.dir, LOG_NAME), "ab") as log:
+                subprocess.Popen(cmd, cwd=BACKEND_DIR, stdin=subprocess.DEVNULL, stdout=log,
+                                 stderr=subprocess.STDOUT, start_new_session=True, pass_fds=(fd,))
+        finally:
+            self.release()  # o flock segue com o filho: o descritor aberto é o mesmo
+        return True
+
+    # ----- execução -----
+    def _query(self, after_id: int):
+        q = (
+            select(Client.id, Client.name, Client.phone, Client.birthday,
+                   Client.store_id, Client.visits_cycle)
+            .where(Client.birth_month == self.month, Client.id > after_id)
+            .order_by(Client.id)
+        )
+        if self.store_id:
+            q = q.where(Client.store_id == self.store_id)
+        return q
+
+    def run(self, progress: Callable[[Dict[str, Any]], None] = lambda _: None) -> Dict[str, Any]:
+        """Gera (ou retoma) a campanha e devolve o status final; CampaignLocked se já estiver rodando."""
+        if not self.acquire():
+            raise CampaignLocked(self.dir)
+        try:
+            return self._run(progress)
+        except Exception as e:
+            self._write_status(state="failed", error=str(e)[:500])
+            raise
+        finally:
+            self.release()
+
+    def reset(self) -> None:
+        """Descarta manifest/status para gerar do zero (os cartões, por etag, continuam valendo)."""
+        for name in (MANIFEST, STATUS, ZIP_NAME):
+            path = os.path.join(self.dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _run(self, progress) -> Dict[str, Any]:
+        after_id, done = self._resume_point()
+        have = {n for n in os.listdir(self.cards_dir) if n.endswith(".png")}
+        # contadores acumulam entre retomadas; a vazão é só desta execução
+        prev = (read_status(self.month, self.year, self.store_id) or {}) if done else {}
+        self.stats = {
+            "month": self.month, "year": self.year, "store_id": self.store_id,
+            "workers": self.workers, "resumed_from": done, "clients": done,
+            **{k: prev.get(k, 0) for k in ("cards_rendered", "cards_reused", "without_phone")},
+        }
+        self._write_status(state="running")
+        t0 = time.perf_counter()
+
+        rows = exports.stream_query(lambda: self._query(after_id))
+        # spawn: o processo web tem threads (fork herdaria locks/conexões)
+        ctx = multiprocessing.get_context("spawn")
+        nice = getattr(os, "nice", None)  # prioridade menor que a dos workers web
+        with ProcessPoolExecutor(self.workers, mp_context=ctx, initializer=nice,
+                                 initargs=(CAMPAIGN_NICE,) if nice else ()) as pool, \
+                open(os.path.join(self.dir, MANIFEST), "a", encoding="utf-8") as manifest:
+            batch: List[tuple] = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= CAMPAIGN_BATCH:
+                    self._batch(pool, manifest, batch, have)
+                    batch = []
+                    self._progress(t0, progress)
+            if batch:
+                self._batch(pool, manifest, batch, have)
+                self._progress(t0, progress)
+
+        self._write_zip()
+        self._write_status(state="done", zip=ZIP_NAME)
+        return self.stats
+
+    def _batch(self, pool, manifest, batch: List[tuple], have: set) -> None:
+        lines, todo = [], {}
+        for cid, name, phone, birthday, store_id, visitas in batch:
+            first = imagegen.first_name(name)
+            visitas = int(visitas or 0)
+            meta = stores.registry.meta_for(store_id, DEFAULT_META)
+            key = (first, visitas, meta, max(meta - visitas, 0))
+            card = f"{imagegen.card_etag(*key)}.png"
+            if card in have or card in todo:
+                self.stats["cards_reused"] += 1
+            else:
+                todo[card] = key
+            url = whatsapp_url(phone, birthday_message(first, visitas, meta))
+            if url is None:
+                self.stats["without_phone"] += 1
+            store = stores.registry.get(store_id)
+            values = (cid, name, phone, birthday, store.name if store else None, visitas, meta,
+                      f"cards/{card}", url)
+            lines.append(json.dumps(dict(zip(FIELDS, values)), ensure_ascii=False))
+
+        # PNGs do lote primeiro: uma linha no manifest garante o cartão em disco
+        keys = list(todo.values())
+        if keys:
+            chunk = max(1, len(keys) // (self.workers * 4))
+            render = partial(imagegen.save_card, self.cards_dir)
+            have.update(pool.map(render, *zip(*keys), chunksize=chunk))
+        self.stats["cards_rendered"] += len(keys)
+
+        manifest.write("\n".join(lines) + "\n")
+        manifest.flush()
+        os.fsync(manifest.fileno())
+        self.stats["clients"] += len(batch)
+
+    def _progress(self, t0: float, progress) -> None:
+        elapsed = time.perf_counter() - t0
+        new = self.stats["clients"] - self.stats["resumed_from"]
+        self._write_status(
+            elapsed_s=round(elapsed, 2),
+            clients_per_s=round(new / elapsed, 1) if elapsed > 0 else None,
+        )
+        progress(self.stats)
+
+    def _write_zip(self) -> None:
+        """campanha.zip com manifest, contatos.csv e os cartões citados (PNGs sem recompressão)."""
+        path = os.path.join(self.dir, ZIP_NAME)
+        tmp = path + ".tmp"
+        manifest = os.path.join(self.dir, MANIFEST)
+        cards = set()
+
+        def csv_rows():
+            with open(manifest, encoding="utf-8") as fh:
+                for line in fh:
+                    item = json.loads(line)
+                    cards.add(item["cartao"])
+                    yield [item[k] for k in FIELDS]
+
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.write(manifest, MANIFEST)
+            with zf.open("contatos.csv", "w") as out:
+                for chunk in exports.csv_chunks(FIELDS, csv_rows()):
+                    out.write(chunk)
+            for card in sorted(cards):
+                zf.write(os.path.join(self.dir, card), card, compress_type=zipfile.ZIP_STORED)
+        os.replace(tmp, path)
@@ -1,18 +1,50 @@
+"""Engines e sessões: primário para escrita, pool (ou réplica) para leitura.
+
+  - `engine`/`SessionLocal`: primário; escritas e tudo que precisa ler o que
+    acabou de escrever.
+  - `read_engine`/`ReadSessionLocal`: DATABASE_REPLICA_URL (ou DB_REPLICA_HOST)
+    quando configurada; senão o próprio primário, com pool separado, para que
+    dashboards e exportações não disputem conexões com o registro de visitas.
+  - `read_session(key)`: o que as rotas só de leitura usam. Vai ao primário se
+    `key` (o usuário) escreveu há menos de DB_READ_AFTER_WRITE_SECONDS ou se a
+    réplica não acompanhou o primário na última conferência (a cada
+    DB_REPLICA_CHECK_SECONDS, via LSN).
+
+Read-your-writes entre workers: o registro de `read_router.wrote` é da
+memória do processo, e com `gunicorn -w 2` a leitura seguinte pode cair no
+outro worker. Por isso `wrote` devolve um marcador assinado (usuário +
+horário da escrita, HMAC com SECRET_KEY) que a resposta leva no cabeçalho
+READ_MARKER_HEADER e o front reenvia; `use_read_engine(key, marker)` aceita
+qualquer um dos dois. Um cliente que não reenvia o cabeçalho (curl, scripts)
+só tem a garantia dentro do mesmo worker.
+
+Pools por env: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE e
+DB_STATEMENT_TIMEOUT_MS; as mesmas com prefixo DB_READ_ para o pool de leitura
+(faltando, valem as do primário).
+"""
+import hashlib
+import hmac
 import os
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
+
+from .metrics import TimedQueuePool
 
-def _build_database_url():
+def _build_database_url(env="DATABASE_URL", host=None, port=None):
     # Preferir DATABASE_URL completa
-    url = os.getenv("DATABASE_URL")
+    url = os.getenv(env)
     if url:
         return url
 
     # Fallback por partes
     user = os.getenv("DB_USER", "")
     pwd = os.getenv("DB_PASSWORD", "")
-    host = os.getenv("DB_HOST", "localhost")
-    port = os.getenv("DB_PORT", "5432")
+    host = host or os.getenv("DB_HOST", "localhost")
+    port = port or os.getenv("DB_PORT", "5432")
     name = os.getenv("DB_NAME", "postgres")
     sslmode = os.getenv("DB_SSLMODE", "disable")
     schema = os.getenv("DB_SCHEMA", None)
@@ -34,11 +66,170 @@ def _build_database_url():
 
 DATABASE_URL = _build_database_url()
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=5,
-)
+
+def _build_replica_url():
+    # réplica é opcional: DATABASE_REPLICA_URL, ou as partes do primário com outro host
+    if not (os.getenv("DATABASE_REPLICA_URL") or os.getenv("DB_REPLICA_HOST")):
+        return None
+    return _build_database_url(
+        "DATABASE_REPLICA_URL", os.getenv("DB_REPLICA_HOST"), os.getenv("DB_REPLICA_PORT"),
+    )
+
+REPLICA_URL = _build_replica_url()
+READ_DATABASE_URL = REPLICA_URL or DATABASE_URL
+
+READ_AFTER_WRITE_SECONDS = float(os.getenv("DB_READ_AFTER_WRITE_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "2"))
+# marcador de escrita devolvido ao cliente; o mesmo SECRET_KEY do app assina
+READ_MARKER_HEADER = "X-Last-Write"
+_MARKER_KEY = os.getenv("SECRET_KEY", "change").encode()
+
+
+def async_database_url(url: str) -> str:
+    """URL equivalente para `create_async_engine` (psycopg async / aiosqlite)."""
+    scheme, sep, rest = url.partition("://")
+    if scheme in ("postgres", "postgresql", "postgresql+psycopg2"):
+        scheme = "postgresql+psycopg"
+    elif scheme in ("sqlite", "sqlite+pysqlite"):
+        scheme = "sqlite+aiosqlite"
+    return scheme + sep + rest
+
+
+def _env_int(prefix: str, name: str, default: int) -> int:
+    # DB_READ_POOL_SIZE -> DB_POOL_SIZE -> padrão
+    return int(os.getenv(prefix + name) or os.getenv("DB_" + name) or default)
+
+
+def pool_options(prefix: str = "DB_") -> dict:
+    """Tamanho, overflow, timeout e reciclagem do pool a partir do env."""
+    return {
+        "pool_size": _env_int(prefix, "POOL_SIZE", 5),
+        "max_overflow": _env_int(prefix, "MAX_OVERFLOW", 5),
+        "pool_timeout": _env_int(prefix, "POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int(prefix, "POOL_RECYCLE", -1),
+    }
+
+
+def _make_engine(url: str, prefix: str):
+    eng = create_engine(
+        url,
+        pool_pre_ping=True,
+        # QueuePool que mede a espera por conexão (src/metrics.py)
+        poolclass=TimedQueuePool,
+        **pool_options(prefix),
+    )
+    timeout_ms = _env_int(prefix, "STATEMENT_TIMEOUT_MS", 0)
+    if timeout_ms and eng.dialect.name == "postgresql":
+        @event.listens_for(eng, "connect")
+        def _statement_timeout(dbapi_conn, _record):
+            with dbapi_conn.cursor() as cur:
+                cur.execute(f"SET statement_timeout = {timeout_ms}")
+            dbapi_conn.commit()
+    return eng
+
+
+engine = _make_engine(DATABASE_URL, "DB_")
+read_engine = _make_engine(READ_DATABASE_URL, "DB_READ_")
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False)
+
+
+class _ReadRouter:
+    """Escolhe, por leitura, entre o pool de leitura e o primário (por worker)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._writes: Dict[Hashable, float] = {}
+        self._checked_at = float("-inf")
+        self._primary_lsn: Optional[str] = None
+        self.healthy = REPLICA_URL is None
+
+    def wrote(self, key: Hashable) -> str:
+        """`key` acabou de escrever: suas leituras vão ao primário por um tempo.
+
+        Devolve o marcador para o cliente reenviar (vale em qualquer worker).
+        """
+        now = time.monotonic()
+        self._writes[key] = now
+        if len(self._writes) > 10_000:
+            cutoff = now - READ_AFTER_WRITE_SECONDS
+            self._writes = {k: t for k, t in list(self._writes.items()) if t > cutoff}
+        body = f"{key}.{int(time.time() * 1000)}"
+        return f"{body}.{_sign(body)}"
+
+    def recently_wrote(self, key: Optional[Hashable], marker: Optional[str] = None) -> bool:
+        if key is None:
+            return False
+        at = self._writes.get(key)
+        if at is not None and time.monotonic() - at < READ_AFTER_WRITE_SECONDS:
+            return True
+        return _marker_fresh(key, marker)
+
+    def stale(self) -> bool:
+        """True se a próxima decisão vai conferir a réplica (e portanto ir ao banco)."""
+        return REPLICA_URL is not None and time.monotonic() - self._checked_at > REPLICA_CHECK_SECONDS
+
+    def refresh(self) -> None:
+        with self._lock:
+            # outra thread pode ter conferido enquanto esperávamos
+            if self.stale():
+                self.healthy = self._check()
+                self._checked_at = time.monotonic()
+
+    def _check(self) -> bool:
+        if read_engine.dialect.name != "postgresql":
+            return True
+        try:
+            with engine.connect() as conn:
+                primary_lsn = conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+            # a réplica precisa ter aplicado o que o primário tinha na conferência
+            # anterior: atraso de no máximo REPLICA_CHECK_SECONDS
+            target, self._primary_lsn = self._primary_lsn or primary_lsn, primary_lsn
+            with read_engine.connect() as conn:
+                return bool(conn.execute(text(
+                    "SELECT NOT pg_is_in_recovery()"
+                    " OR pg_wal_lsn_diff(pg_last_wal_replay_lsn(), CAST(:lsn AS pg_lsn)) >= 0"
+                ), {"lsn": target}).scalar())
+        except Exception:
+            return False
+
+    def use_read_engine(self, key: Optional[Hashable] = None, marker: Optional[str] = None) -> bool:
+        if REPLICA_URL is None:
+            return True  # mesmo banco, pool próprio: não há o que esperar
+        if self.recently_wrote(key, marker):
+            return False
+        if self.stale():
+            self.refresh()
+        return self.healthy
+
+    def factory(self, key: Optional[Hashable] = None, marker: Optional[str] = None) -> sessionmaker:
+        return ReadSessionLocal if self.use_read_engine(key, marker) else SessionLocal
+
+
+def _sign(body: str) -> str:
+    return hmac.new(_MARKER_KEY, body.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _marker_fresh(key: Hashable, marker: Optional[str]) -> bool:
+    # "<key>.<ms>.<hmac>" de `wrote`; relógio de parede, com a mesma folga para os dois lados
+    if not marker:
+        return False
+    body, _, sig = marker.rpartition(".")
+    owner, _, at = body.rpartition(".")
+    if owner != str(key) or not at.isdigit() or not hmac.compare_digest(sig, _sign(body)):
+        return False
+    return abs(time.time() - int(at) / 1000) < READ_AFTER_WRITE_SECONDS
+
+
+read_router = _ReadRouter()
+
+
+def read_session(key: Optional[Hashable] = None, marker: Optional[str] = None) -> Session:
+    """Sessão para rotas só de leitura; `key` identifica quem lê e `marker` é o
+    cabeçalho READ_MARKER_HEADER da requisição (read-your-writes)."""
+    return read_router.factory(key, marker)()
+
+
+class Base(DeclarativeBase):
+    pass
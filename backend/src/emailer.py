@@ -1,26 +1,52 @@
 # src/emailer.py
+#
+# `send_email` só grava a mensagem na tabela email_outbox e retorna; o envio
+# acontece num OutboxSender em background, que reaproveita uma conexão SMTP
+# autenticada para várias mensagens, envia em lotes e reagenda falhas com
+# backoff exponencial. O sender roda numa thread por worker (iniciada no
+# primeiro envio) ou num processo dedicado: `flask --app src.main send-emails`.
 import os
 import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 
+from sqlalchemy import select, update
+
 SMTP_HOST = os.getenv("SMTP_HOST", "").strip()
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER", "").strip()
 SMTP_PASS = os.getenv("SMTP_PASS", "").strip()
 FROM_EMAIL = os.getenv("FROM_EMAIL", "no-reply@localhost")
 
-def _send_raw(to: str, subject: str, body: str, subtype: str = "plain") -> bool:
-    """Envio real via SMTP; se não tiver SMTP configurado, apenas loga e segue."""
-    if not SMTP_HOST:
-        print(f"[emailer] (mock) To: {to} | Subject: {subject}\n---{subtype}---\n{body}\n--------------")
-        return True
+OUTBOX_BATCH = int(os.getenv("EMAIL_OUTBOX_BATCH", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("EMAIL_BACKOFF_BASE", "30"))    # segundos
+OUTBOX_LEASE = float(os.getenv("EMAIL_LEASE_SECONDS", "120"))         # reserva de um lote
+OUTBOX_POLL = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+SMTP_IDLE_CLOSE = float(os.getenv("SMTP_IDLE_CLOSE", "60"))
+# 0 desliga a thread nos workers web (use o comando send-emails)
+SENDER_THREAD = os.getenv("EMAIL_SENDER_THREAD", "1") != "0"
+
 
+def _build_message(to: str, subject: str, body: str, subtype: str) -> MIMEText:
     msg = MIMEText(body, _subtype=subtype, _charset="utf-8")
     msg["Subject"] = subject
     msg["From"] = FROM_EMAIL
     msg["To"] = to
+    return msg
+
+
+class SmtpConnection:
+    """Conexão SMTP reaproveitada entre mensagens (reconecta se cair ou ficar ociosa)."""
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20) as s:
+    def __init__(self):
+        self._smtp = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20)
         if SMTP_USER and SMTP_PASS:
             try:
                 s.starttls()
@@ -28,8 +54,167 @@ def _send_raw(to: str, subject: str, body: str, subtype: str = "plain") -> bool:
                 # Alguns servidores já vêm em TLS/SSL
                 pass
             s.login(SMTP_USER, SMTP_PASS)
-        s.sendmail(FROM_EMAIL, [to], msg.as_string())
-    return True
+        return s
+
+    def send(self, to: str, subject: str, body: str, subtype: str) -> None:
+        if not SMTP_HOST:
+            print(f"[emailer] (mock) To: {to} | Subject: {subject}\n---{subtype}---\n{body}\n--------------")
+            return
+        if self._smtp is None or time.monotonic() - self._last_used > SMTP_IDLE_CLOSE:
+            self.close()
+            self._smtp = self._connect()
+        msg = _build_message(to, subject, body, subtype)
+        try:
+            self._smtp.sendmail(FROM_EMAIL, [to], msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # conexão caiu entre mensagens: uma nova tentativa com conexão nova
+            self._smtp = self._connect()
+            self._smtp.sendmail(FROM_EMAIL, [to], msg.as_string())
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)), 6 * 3600))
+
+
+class OutboxSender:
+    """Consome email_outbox em lotes usando uma única conexão SMTP."""
+
+    def __init__(self, session_factory=None):
+        if session_factory is None:
+            from .db import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.smtp = SmtpConnection()
+        self.wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    def _claim(self, db):
+        """Reserva um lote (lease): outras instâncias só o pegam depois de OUTBOX_LEASE."""
+        from .models import EmailOutbox
+
+        now = datetime.utcnow()
+        q = (
+            select(
+                EmailOutbox.id, EmailOutbox.to_addr, EmailOutbox.subject,
+                EmailOutbox.body, EmailOutbox.subtype, EmailOutbox.attempts,
+            )
+            .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+            .limit(OUTBOX_BATCH)
+            .with_for_update(skip_locked=True)
+        )
+        batch = db.execute(q).all()
+        if batch:
+            db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_([m.id for m in batch]))
+                .values(next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        return batch
+
+    def run_once(self) -> int:
+        """Envia um lote; devolve quantas mensagens foram processadas."""
+        from .models import EmailOutbox
+
+        db = self.session_factory()
+        try:
+            batch = self._claim(db)
+            sent = []
+            for m in batch:
+                try:
+                    self.smtp.send(m.to_addr, m.subject, m.body, m.subtype)
+                    sent.append(m.id)
+                except Exception as e:
+                    self.smtp.close()
+                    attempts = m.attempts + 1
+                    values = {"attempts": attempts, "last_error": str(e)[:1000]}
+                    if attempts >= OUTBOX_MAX_ATTEMPTS:
+                        values["status"] = "failed"
+                    else:
+                        values["next_attempt_at"] = datetime.utcnow() + _backoff(attempts)
+                    db.execute(update(EmailOutbox).where(EmailOutbox.id == m.id).values(**values))
+                    print(f"[emailer] erro ao enviar #{m.id}: {e}")
+            if sent:
+                db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id.in_(sent))
+                    .values(status="sent", sent_at=datetime.utcnow(), last_error=None)
+                )
+            db.commit()
+            return len(batch)
+        finally:
+            db.close()
+
+    def drain(self) -> int:
+        """Envia até não haver mais mensagens prontas."""
+        total = 0
+        while True:
+            n = self.run_once()
+            total += n
+            if n == 0:
+                return total
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                n = self.drain()
+            except Exception as e:
+                print(f"[emailer] sender falhou: {e}")
+                n = 0
+            if n == 0:
+                if self._idle_long():
+                    self.smtp.close()
+                self.wakeup.wait(OUTBOX_POLL)
+                self.wakeup.clear()
+
+    def _idle_long(self) -> bool:
+        return time.monotonic() - self.smtp._last_used > SMTP_IDLE_CLOSE
+
+    def stop(self):
+        self._stop.set()
+        self.wakeup.set()
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def _ensure_sender():
+    """Sobe a thread de envio deste processo (uma por worker), se habilitada."""
+    global _sender
+    if not SENDER_THREAD:
+        return None
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                s = OutboxSender()
+                threading.Thread(target=s.run_forever, name="email-outbox", daemon=True).start()
+                _sender = s
+    return _sender
+
+
+def enqueue_email(db, to: str, subject: str, body: str, subtype: str = "plain"):
+    """Adiciona uma mensagem à outbox na sessão `db` (commit fica com quem chamou)."""
+    from .models import EmailOutbox
+
+    m = EmailOutbox(
+        to_addr=to, subject=subject[:255], body=body, subtype=subtype,
+        status="pending", attempts=0, next_attempt_at=datetime.utcnow(),
+    )
+    db.add(m)
+    return m
+
 
 def send_email(to: str, subject: str, text_body: str, html_body: str | None = None) -> bool:
     """
@@ -37,12 +222,25 @@ def send_email(to: str, subject: str, text_body: str, html_body: str | None = No
       - 3 args: send_email(to, subject, text_body)
       - 4 args: send_email(to, subject, text_body, html_body)
     Se html_body vier, priorizamos HTML, senão enviamos texto puro.
+    Apenas enfileira na outbox; o envio é assíncrono.
     """
+    from .db import SessionLocal
+
     try:
-        if html_body and html_body.strip():
-            return _send_raw(to, subject, html_body, subtype="html")
-        return _send_raw(to, subject, text_body, subtype="plain")
+        db = SessionLocal()
+        try:
+            if html_body and html_body.strip():
+                enqueue_email(db, to, subject, html_body, subtype="html")
+            else:
+                enqueue_email(db, to, subject, text_body, subtype="plain")
+            db.commit()
+        finally:
+            db.close()
+        sender = _ensure_sender()
+        if sender:
+            sender.wakeup.set()
+        return True
     except Exception as e:
         # Nunca derruba o fluxo de negócio
-        print(f"[emailer] erro ao enviar: {e}")
+        print(f"[emailer] erro ao enfileirar: {e}")
         return False
@@ -0,0 +1,123 @@
+"""Exportações em streaming com memória constante (CSV, NDJSON, XLSX).
+
+As linhas saem do banco em lotes (`yield_per` + cursor do lado do servidor no
+PostgreSQL) e são escritas direto na resposta; nada do resultado completo
+fica em memória. O XLSX usa o modo write-only do openpyxl, gravado num
+arquivo temporário e enviado em pedaços.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from flask import Response, stream_with_context
+
+from .db import ReadSessionLocal
+
+YIELD_PER = 1000
+CSV_FLUSH_ROWS = 500
+FILE_CHUNK = 64 * 1024
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def stream_query(
+    build_query: Callable[[], Any], session_factory: Callable[[], Any] = ReadSessionLocal,
+) -> Iterator[Sequence[Any]]:
+    """Executa a consulta numa sessão própria (pool de leitura) e devolve as linhas em lotes."""
+    db = session_factory()
+    try:
+        result = db.execute(
+            build_query().execution_options(yield_per=YIELD_PER, stream_results=True)
+        )
+        for row in result:
+            yield tuple(row)
+    finally:
+        db.close()
+
+
+def csv_chunks(header: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    # BOM + ';' para o Excel em pt-BR abrir direto
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";")
+    buf.write("\ufeff")
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([_cell(v) for v in row])
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(header: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, map(_cell, row))), ensure_ascii=False))
+        if len(lines) >= CSV_FLUSH_ROWS:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def xlsx_chunks(
+    header: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    title: str = "Dados",
+    widths: Sequence[int] = (),
+) -> Iterator[bytes]:
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title)
+    for i, w in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = w
+    ws.append(list(header))
+    for row in rows:
+        ws.append(["" if v is None else _cell(v) for v in row])
+    with tempfile.TemporaryFile() as fh:
+        wb.save(fh)
+        fh.seek(0)
+        while True:
+            chunk = fh.read(FILE_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+
+
+def export_response(
+    fmt: str,
+    filename: str,
+    header: Sequence[str],
+    build_query: Callable[[], Any],
+    session_factory: Callable[[], Any] = ReadSessionLocal,
+    **xlsx_opts: Any,
+) -> Response:
+    """Resposta em streaming no formato pedido (`fmt` em FORMATS)."""
+    rows = stream_query(build_query, session_factory)
+    if fmt == "xlsx":
+        body = xlsx_chunks(header, rows, **xlsx_opts)
+    elif fmt == "ndjson":
+        body = ndjson_chunks(header, rows)
+    else:
+        body = csv_chunks(header, rows)
+    resp = Response(stream_with_context(body), mimetype=FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return resp
@@ -0,0 +1,444 @@
+"""Corpo das rotas de balcão e dashboard, independente do framework.
+
+Cada função recebe a sessão, a identidade (src/auth.py) e os parâmetros da
+requisição — `args` é um MultiDict do werkzeug (`.get(..., type=int)`),
+`data` o JSON do corpo — e devolve `(payload, status)`, que o Flask já
+aceita como retorno de view. Servem às duas portas de entrada do app:
+
+  - src/main.py e src/routes/visita.py (WSGI, gunicorn gthread), com a
+    sessão da requisição (src/requestdb.py);
+  - src/asgi.py (ASGI, uvicorn), dentro de `AsyncSession.run_sync`: o código
+    é o mesmo, mas cada consulta espera o banco sem prender uma thread.
+
+Por isso nada aqui toca em `flask.request`, `g` ou no JWT. Nem faz commit:
+quem chama (src/requestdb.py, src/asgi.py) faz commit se o status for < 400
+e rollback caso contrário; `db.flush()` é o que antecipa erros de constraint.
+"""
+from __future__ import annotations
+
+import os
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session
+
+from . import balance, birthdays, pagination, requestdb, search, serializers, stats, stores
+from .auth import Identity
+from .models import Client, Redemption, User, Visit
+from .util import normalize_cpf
+
+GIFT_NAME = os.getenv("GIFT_NAME", "1 Kg de Vela Palito")
+DEFAULT_META = int(os.getenv("DEFAULT_META", "10"))
+MAX_LOTE = int(os.getenv("MAX_LOTE_VISITAS", "1000"))
+
+Reply = Tuple[Any, int]
+
+
+# ---------- auth ----------
+def me(db: Session, user: Identity) -> Reply:
+    if user.name is not None:
+        return user.to_dict(), 200
+    # token emitido antes de name/email irem para as claims
+    u = db.get(User, user.id)
+    if not u:
+        return {"error": "not found"}, 404
+    return {
+        "id": u.id, "name": u.name, "email": u.email,
+        "role": u.role, "lock_loja": u.lock_loja, "store_id": u.store_id
+    }, 200
+
+
+# ---------- clientes ----------
+def client_filters(user: Identity, args):
+    """Filtros da listagem de clientes (também usados na exportação).
+
+    Devolve (condições, escopo) — o escopo identifica o filtro no cache de totais.
+    """
+    # ?cpf= com 11 dígitos é busca exata; menos que isso, por prefixo (digitação)
+    cpf = normalize_cpf(args.get("cpf"))
+    if cpf:
+        return [Client.cpf_startswith(cpf)], f"cpf={cpf}"
+    if user.lock_loja and user.store_id:
+        return [Client.store_id == user.store_id], f"store={user.store_id}"
+    return [], ""
+
+
+def birthday_filters(user: Identity, args, hoje: date):
+    """Filtros de aniversariantes: mês (?mes=, padrão o atual) ou janela ?dias=N.
+
+    Devolve (condições, dias); ValueError se o mês for inválido.
+    """
+    dias = args.get("dias", type=int)
+    mes = args.get("mes", type=int) or hoje.month
+    if not 1 <= mes <= 12:
+        raise ValueError("mes inválido")
+    if dias:
+        conds = [birthdays.window_filter(hoje, min(dias, 366))]
+    else:
+        conds = [birthdays.month_filter(mes)]
+    if user.lock_loja and user.store_id:
+        conds.append(Client.store_id == user.store_id)
+    return conds, dias
+
+
+def create_client(db: Session, user: Identity, data: dict) -> Reply:
+    raw_bday = data.get("birthday")
+    bday_str = None
+    if raw_bday:
+        try:
+            bday_str = date.fromisoformat(str(raw_bday)).isoformat()
+        except Exception:
+            return {"error": "birthday inválido. Use YYYY-MM-DD"}, 400
+    try:
+        c = Client(
+            name=data.get("name", "").strip(),
+            cpf=(data.get("cpf") or "").strip(),
+            phone=(data.get("phone") or "").strip(),
+            email=(data.get("email") or "").strip() or None,
+            birthday=bday_str,
+            store_id=(data.get("store_id") or user.store_id),
+        )
+        db.add(c)
+        stats.bump(db, c.store_id, clients_new=1)
+        db.flush()
+        return {"id": c.id}, 201
+    except IntegrityError:
+        return {"error": "CPF já cadastrado"}, 400
+
+
+def list_clients(db: Session, user: Identity, args) -> Reply:
+    cursor = args.get("cursor")
+    page = max(1, args.get("page", 1, type=int) or 1)
+    per_page = pagination.per_page_arg(args)
+    try:
+        conds, scope = client_filters(user, args)
+        totals = pagination.total_for(
+            db, select(Client.id).where(*conds), args.get("total", "estimate"),
+            cache_key=f"clients:{scope}", table=None if scope else "clients",
+        )
+        q = select(*serializers.CLIENT.columns).where(*conds)
+        q = pagination.keyset(db, q, Client.created_at, Client.id, cursor)
+        if not cursor and page > 1:
+            # compatibilidade com ?page= (OFFSET); prefira next_cursor
+            q = q.offset((page - 1) * per_page)
+        items, next_cursor = pagination.fetch_page(db, q, per_page)
+    except ValueError:
+        return {"error": "cursor inválido"}, 400
+    return {
+        **totals,
+        "next_cursor": next_cursor,
+        "items": serializers.CLIENT.dump(items),
+    }, 200
+
+
+def search_clients(db: Session, user: Identity, args) -> Reply:
+    limit = args.get("limit", search.SEARCH_LIMIT, type=int) or search.SEARCH_LIMIT
+    store_id = user.store_id if user.lock_loja and user.store_id else None
+    items = search.search_clients(db, args.get("q", ""), store_id, limit)
+    return {"items": serializers.CLIENT_SEARCH.dump(items)}, 200
+
+
+# ---------- visitas ----------
+def register_visit(db: Session, user: Identity, data: dict) -> Reply:
+    """Registra uma visita por cpf OU client_id: { visit_id, visits_count, eligible }."""
+    cpf = (data.get("cpf") or "").strip()
+    client_id = data.get("client_id")
+    try:
+        # Encontrar cliente
+        cliente = None
+        if normalize_cpf(cpf):
+            cliente = db.execute(
+                select(Client).where(Client.cpf_is(cpf))
+            ).scalar_one_or_none()
+        elif client_id:
+            try:
+                cliente = db.get(Client, int(client_id))
+            except Exception:
+                cliente = None
+
+        if not cliente:
+            return {"error": "Cliente não encontrado"}, 404
+
+        # Preferir store_id do cliente; se não houver, tentar do JWT; senão 1
+        store_id = cliente.store_id or user.store_id or 1
+
+        # Atualizar o saldo (trava o cliente) e criar a visita no ciclo vigente,
+        # na mesma transação
+        total_visitas, _, ciclo = balance.add_visits(db, cliente.id)
+        visita = Visit(client_id=cliente.id, store_id=store_id, cycle=ciclo)
+        db.add(visita)
+        db.flush()
+        stats.bump(db, store_id, visits=1)
+
+        # Elegível (ajuste a regra se precisar)
+        elegivel = (total_visitas % 10 == 0)
+
+        return {
+            "visit_id": visita.id,
+            "visits_count": int(total_visitas),
+            "eligible": elegivel
+        }, 201
+    except Exception:
+        # Não vaza stack trace em produção
+        return {"error": "Falha ao registrar visita"}, 500
+
+
+def _parse_occurred_at(value) -> Optional[datetime]:
+    """ISO 8601 -> datetime UTC sem timezone (como created_at); None = agora."""
+    if not value:
+        return None
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _insert_visits(db: Session, rows: List[dict]) -> List[Tuple[int, int]]:
+    """Grava `rows` (saldo, visitas e rollup); [(visit_id, visits_count)] na ordem."""
+    # saldo primeiro (trava os clientes), depois as visitas no ciclo vigente
+    per_client = Counter(r["client_id"] for r in rows)
+    saldos = balance.add_visits_bulk(db, per_client)
+    for r in rows:
+        r["cycle"] = saldos[r["client_id"]][2]
+
+    # um único INSERT multi-linha; RETURNING na ordem dos parâmetros
+    visit_ids = db.execute(
+        insert(Visit).returning(Visit.id, sort_by_parameter_order=True),
+        rows,
+    ).scalars().all()
+
+    per_day = Counter((r["store_id"], r["created_at"].date()) for r in rows)
+    for (store_id, day), n in sorted(per_day.items()):
+        stats.bump(db, store_id, day, visits=n)
+
+    # visits_count de cada item = saldo anterior ao lote + posição no lote
+    seen = defaultdict(int)
+    out = []
+    for row, visit_id in zip(rows, visit_ids):
+        cid = row["client_id"]
+        seen[cid] += 1
+        out.append((visit_id, saldos[cid][0] - per_client[cid] + seen[cid]))
+    return out
+
+
+def register_visits_batch(db: Session, user: Identity, data: dict) -> Reply:
+    """Várias visitas de uma vez (fila offline dos terminais); ver POST /api/visitas/lote."""
+    entries = data.get("items")
+    if not isinstance(entries, list) or not entries:
+        return {"error": "items obrigatório"}, 422
+    if len(entries) > MAX_LOTE:
+        return {"error": f"máximo de {MAX_LOTE} itens por lote"}, 413
+
+    results = [None] * len(entries)
+    parsed = []  # (index, cpf, client_id, store_id, occurred_at)
+    for i, e in enumerate(entries):
+        if not isinstance(e, dict):
+            results[i] = {"index": i, "ok": False, "error": "item inválido"}
+            continue
+        raw_cpf = (e.get("cpf") or "").strip()
+        cpf = normalize_cpf(raw_cpf)
+        try:
+            cid = int(e["client_id"]) if e.get("client_id") and not raw_cpf else None
+            sid = int(e["store_id"]) if e.get("store_id") else None
+            when = _parse_occurred_at(e.get("occurred_at"))
+        except (TypeError, ValueError):
+            results[i] = {"index": i, "ok": False, "error": "client_id, store_id ou occurred_at inválido"}
+            continue
+        if not raw_cpf and not cid:
+            results[i] = {"index": i, "ok": False, "error": "cpf ou client_id obrigatório"}
+            continue
+        parsed.append((i, cpf, cid, sid, when))
+
+    try:
+        # resolve todos os clientes e lojas com um IN cada
+        cpfs = {p[1] for p in parsed if p[1]}
+        ids = {p[2] for p in parsed if p[2]}
+        by_cpf, by_id = {}, {}
+        if cpfs or ids:
+            conds = []
+            if cpfs:
+                conds.append(Client.cpf_key.in_(cpfs))
+            if ids:
+                conds.append(Client.id.in_(ids))
+            for row in db.execute(select(Client.id, Client.cpf_key, Client.store_id).where(or_(*conds))):
+                by_cpf[row.cpf_key] = row
+                by_id[row.id] = row
+        known_stores = {p[3] for p in parsed if p[3] and stores.registry.get(p[3])}
+
+        now = datetime.utcnow()
+        rows, accepted = [], []
+        for i, cpf, cid, sid, when in parsed:
+            cliente = by_cpf.get(cpf) if cid is None else by_id.get(cid)
+            if not cliente:
+                results[i] = {"index": i, "ok": False, "error": "Cliente não encontrado"}
+                continue
+            if sid and sid not in known_stores:
+                results[i] = {"index": i, "ok": False, "error": "Loja não encontrada"}
+                continue
+            store_id = sid or cliente.store_id or user.store_id or 1
+            rows.append({"client_id": cliente.id, "store_id": store_id, "created_at": when or now})
+            accepted.append(i)
+
+        if rows:
+            try:
+                # o lote inteiro num SAVEPOINT; se um item derrubar o INSERT, refaz
+                # item a item, cada um no seu, e só os que falharem ficam de fora
+                with requestdb.savepoint(db):
+                    inserted = _insert_visits(db, rows)
+            except DBAPIError:
+                inserted = []
+                for row in rows:
+                    try:
+                        with requestdb.savepoint(db):
+                            inserted += _insert_visits(db, [row])
+                    except DBAPIError:
+                        inserted.append(None)
+
+            for i, row, done in zip(accepted, rows, inserted):
+                if done is None:
+                    results[i] = {"index": i, "ok": False, "error": "Falha ao registrar visita"}
+                    continue
+                visit_id, count = done
+                results[i] = {
+                    "index": i, "ok": True, "visit_id": visit_id, "client_id": row["client_id"],
+                    "visits_count": count, "eligible": (count % 10 == 0),
+                }
+    except Exception:
+        return {"error": "Falha ao registrar lote de visitas"}, 500
+
+    ok = sum(1 for r in results if r and r["ok"])
+    return {"ok": ok, "failed": len(results) - ok, "items": results}, 200
+
+
+def list_visits(db: Session, user: Identity, args) -> Reply:
+    cursor = args.get("cursor")
+    page = max(1, args.get("page", 1, type=int) or 1)
+    per_page = pagination.per_page_arg(args)
+    try:
+        totals = pagination.total_for(
+            db, select(Visit.id), args.get("total", "estimate"),
+            cache_key="visits:", table="visits",
+        )
+        q = pagination.keyset(db, select(*serializers.VISIT.columns), Visit.created_at, Visit.id, cursor)
+        if not cursor and page > 1:
+            q = q.offset((page - 1) * per_page)
+        itens, next_cursor = pagination.fetch_page(db, q, per_page)
+    except ValueError:
+        return {"error": "cursor inválido"}, 400
+    return {
+        **totals,
+        "page": page,
+        "per_page": per_page,
+        "next_cursor": next_cursor,
+        "items": serializers.VISIT.dump(itens),
+    }, 200
+
+
+# ---------- resgates ----------
+def redeem_gift(db: Session, user: Identity, data: dict) -> Reply:
+    cpf = (data.get("cpf") or "").strip()
+    gift_name = (data.get("gift_name") or GIFT_NAME).strip()
+    # trava o cliente até o commit: dois resgates simultâneos não passam juntos na meta
+    c = balance.lock_client(db, Client.cpf_is(cpf)) if normalize_cpf(cpf) else None
+    if not c:
+        return {"error": "Cliente não encontrado"}, 404
+
+    store_id = user.store_id or c.store_id
+    if not store_id:
+        st = stores.registry.default()
+        store_id = st.id if st else None
+
+    meta = stores.registry.meta_for(store_id, DEFAULT_META)
+
+    count_visits = c.visits_cycle
+    if count_visits < meta:
+        return {
+            "error": "Cliente ainda não atingiu a meta",
+            "visits_count": int(count_visits), "meta": int(meta),
+        }, 400
+
+    # o resgate consome o ciclo: as visitas ficam no histórico (ledger)
+    ciclo = balance.close_cycle(db, c.id)
+    r_id, r_when = db.execute(
+        insert(Redemption)
+        .values(client_id=c.id, store_id=store_id, gift_name=gift_name, cycle=ciclo)
+        .returning(Redemption.id, Redemption.created_at)
+    ).one()
+    stats.bump(db, store_id, redemptions=1)
+
+    return {
+        "redemption_id": r_id, "gift_name": gift_name,
+        "when": r_when.isoformat(), "store_id": store_id,
+    }, 200
+
+
+# ---------- dashboard ----------
+def kpis(db: Session, user: Identity, args) -> Reply:
+    """KPIs a partir do rollup diário (daily_stats).
+
+    Sem parâmetros: últimos 30 dias. Aceita ?start=YYYY-MM-DD&end=YYYY-MM-DD
+    para um intervalo arbitrário e ?by_store=1 para quebrar por loja.
+    """
+    try:
+        start = date.fromisoformat(args["start"]) if args.get("start") else None
+        end = date.fromisoformat(args["end"]) if args.get("end") else None
+    except ValueError:
+        return {"error": "data inválida. Use YYYY-MM-DD"}, 400
+    custom_range = bool(start or end)
+    if not custom_range:
+        # 30 dias contando hoje (a consulta inclui `start`)
+        start = stats.today() - timedelta(days=29)
+    by_store = args.get("by_store") in ("1", "true")
+
+    store_id = None
+    if user.lock_loja and user.store_id:
+        store_id = user.store_id
+    elif args.get("store_id"):
+        store_id = args.get("store_id", type=int)
+
+    period = stats.totals(db, start=start, end=end, store_id=store_id)
+    clients_total = stats.totals(db, store_id=store_id)["clients_new"]
+    if custom_range:
+        out = {
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+            "visitas": period["visits"],
+            "resgates": period["redemptions"],
+            "clientes_novos": period["clients_new"],
+            "clientes_total": clients_total,
+        }
+    else:
+        out = {
+            "visitas_30d": period["visits"],
+            "clientes_total": clients_total,
+            "resgates_30d": period["redemptions"],
+        }
+    if by_store:
+        per_store = stats.totals(db, start=start, end=end, store_id=store_id, by_store=True)
+        out["lojas"] = [{
+            "store_id": sid or None,
+            "visitas": t["visits"],
+            "resgates": t["redemptions"],
+            "clientes_novos": t["clients_new"],
+        } for sid, t in per_store.items()]
+    return out, 200
+
+
+def birthday_list(db: Session, user: Identity, args) -> Reply:
+    """Aniversariantes do mês atual (ou ?mes=1..12), ou dos próximos ?dias=N."""
+    hoje = datetime.utcnow().date()
+    try:
+        conds, dias = birthday_filters(user, args, hoje)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    q = (
+        select(*serializers.BIRTHDAY.columns).where(*conds)
+        .order_by(Client.birth_month, Client.birth_day, Client.id)
+    )
+    items = db.execute(q).all()
+    if dias:
+        items.sort(key=lambda c: birthdays.next_occurrence(c.birth_month, c.birth_day, hoje))
+    return serializers.BIRTHDAY.dump(items), 200
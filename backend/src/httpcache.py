@@ -0,0 +1,261 @@
+"""GET condicional (ETag/Last-Modified) para dashboards e dados de referência.
+
+Cada marcador em TRACKED_TABLES tem linhas em `table_versions` (versão +
+horário da última alteração). Os eventos registrados em `SessionLocal`
+anotam quais marcadores a transação escreveu — flush do ORM, insert/update/
+delete do Core e SQL textual — e, logo antes do commit, incrementam as
+versões na mesma transação (linhas em ordem de nome, sem deadlock).
+
+  - `clients_profile` só muda com cadastro, exclusão ou alteração de nome,
+    CPF, aniversário ou loja: o UPDATE de saldo de cada visita
+    (src/balance.py) não invalida a lista de aniversariantes.
+  - `clients_profile` e `daily_stats` têm uma linha por loja
+    (`daily_stats:3`); a visita incrementa só a da sua loja, que já está
+    serializada pela linha (loja, dia) do rollup. Escritas sem loja
+    conhecida (SQL textual, delete em massa) usam a linha sem sufixo. O
+    validador soma todas.
+
+As rotas decoradas com `conditional` leem só essas versões (uma consulta
+por PK) e montam o ETag com elas, a rota, a query string e o escopo do
+usuário. Se o navegador mandar o mesmo ETag (If-None-Match) ou um
+If-Modified-Since ainda válido, a resposta é 304 sem rodar a consulta da
+rota. As versões são lidas antes da consulta: uma escrita no meio do caminho
+no máximo gera um 200 a mais, nunca um 304 com dado velho.
+
+    @app.get("/api/dashboard/kpis")
+    @jwt_required()
+    @httpcache.conditional(tables=("daily_stats",), dated=True)
+    def kpis(): ...
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from datetime import datetime, time, timezone
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from flask import make_response, request
+from sqlalchemy import event, inspect, or_, select, text
+from sqlalchemy.orm import Session
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+
+from . import requestdb
+from .auth import Identity, current_user
+from .db import SessionLocal
+from .models import TableVersion
+
+# marcadores lidos por rotas com cache; escritas nas demais tabelas não custam nada
+TRACKED_TABLES = frozenset({"clients_profile", "daily_stats", "stores", "users"})
+# tabela -> marcador, quando diferem
+_MARKERS = {"clients": "clients_profile"}
+# colunas de clients que invalidam `clients_profile`; saldo e updated_at não
+PROFILE_COLUMNS = frozenset({"name", "cpf", "birthday", "birth_month", "birth_day", "store_id"})
+# marcadores com uma linha por loja ("<marcador>:<store_id>")
+_PER_STORE = frozenset({"clients_profile", "daily_stats"})
+# execution option com a loja de um insert/update do Core (ver stats.bump)
+STORE_OPTION = "versions_store_id"
+
+# políticas de Cache-Control: "no-cache" guarda mas revalida sempre (304 barato);
+# dados de referência podem ser reusados por um minuto sem perguntar
+REVALIDATE = "private, no-cache"
+REFERENCE = "private, max-age=60, must-revalidate"
+
+_RE_DML = re.compile(r"^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+\"?(\w+)", re.IGNORECASE)
+_BUMP = text(
+    "INSERT INTO table_versions (name, version, updated_at) VALUES (:name, 1, :now)"
+    " ON CONFLICT (name) DO UPDATE SET version = table_versions.version + 1,"
+    " updated_at = excluded.updated_at"
+)
+
+
+# ---------- registro das escritas ----------
+def _mark(session: Session, table: Optional[str], store_id: Optional[int] = None) -> None:
+    marker = _MARKERS.get(table, table)
+    if marker not in TRACKED_TABLES:
+        return
+    if store_id is not None and marker in _PER_STORE:
+        marker = f"{marker}:{store_id}"
+    session.info.setdefault("dirty_tables", set()).add(marker)
+
+
+def _sets_profile(stmt) -> bool:
+    # colunas do SET de um UPDATE do Core; na dúvida conta como alteração de perfil
+    values = getattr(stmt, "_values", None) or dict(getattr(stmt, "_ordered_values", None) or ())
+    if not values:
+        return True
+    return any(getattr(col, "key", col) in PROFILE_COLUMNS for col in values)
+
+
+def _on_execute(state) -> None:
+    stmt = state.statement
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(getattr(stmt, "table", None), "name", None)
+        if table == "clients" and state.is_update and not _sets_profile(stmt):
+            return
+        _mark(state.session, table, state.execution_options.get(STORE_OPTION))
+    elif not state.is_select and hasattr(stmt, "text"):
+        m = _RE_DML.match(stmt.text)
+        if m:
+            _mark(state.session, m.group(1).lower())
+
+
+def _after_flush(session: Session, flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is None:
+            continue
+        store_id = getattr(obj, "store_id", None) or 0
+        if table.name == "clients" and obj in session.dirty:
+            attrs = inspect(obj).attrs
+            if not any(attrs[col].history.has_changes() for col in PROFILE_COLUMNS):
+                continue
+            # cliente mudou de loja: a lista da loja antiga também muda
+            for old in attrs.store_id.history.deleted:
+                _mark(session, table.name, old or 0)
+        _mark(session, table.name, store_id)
+
+
+def _before_commit(session: Session) -> None:
+    # o flush final do commit vem depois deste evento: antecipa para ver tudo
+    session.flush()
+    dirty = session.info.pop("dirty_tables", None)
+    if dirty:
+        now = datetime.utcnow()
+        session.execute(_BUMP, [{"name": name, "now": now} for name in sorted(dirty)])
+
+
+def _after_rollback(session: Session) -> None:
+    session.info.pop("dirty_tables", None)
+
+
+def track(session_factory=SessionLocal) -> None:
+    event.listen(session_factory, "do_orm_execute", _on_execute)
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "before_commit", _before_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
+
+
+# ---------- validadores ----------
+def versions(tables: Iterable[str], db: Optional[Session] = None) -> Tuple[Dict[str, int], Optional[datetime]]:
+    """({marcador: versão}, última alteração) dos marcadores pedidos.
+
+    Nos marcadores por loja a versão é a soma das linhas (todas só crescem).
+    """
+    names = sorted(tables)
+    conds = [TableVersion.name.in_(names)]
+    conds += [TableVersion.name.startswith(f"{name}:", autoescape=True)
+              for name in names if name in _PER_STORE]
+    q = (
+        select(TableVersion.name, TableVersion.version, TableVersion.updated_at)
+        .where(or_(*conds))
+    )
+    if db is not None:
+        rows = db.execute(q).all()
+    else:
+        db = SessionLocal()
+        try:
+            rows = db.execute(q).all()
+        finally:
+            db.close()
+    found: Dict[str, int] = {}
+    for name, version, _ in rows:
+        marker = name.split(":", 1)[0]
+        found[marker] = found.get(marker, 0) + int(version)
+    stamps = [at for _, _, at in rows if at is not None]
+    return {name: found.get(name, 0) for name in names}, max(stamps) if stamps else None
+
+
+def _user_scope(user: Optional[Identity]) -> str:
+    if user is None:
+        return "-"
+    return f"{user.role}:{user.store_id if user.lock_loja else '*'}"
+
+
+def validators(
+    endpoint: str,
+    query_string: str,
+    user: Optional[Identity],
+    tables: Sequence[str] = (),
+    dated: bool = False,
+    fingerprint: Optional[Callable[[], str]] = None,
+    db: Optional[Session] = None,
+) -> Tuple[str, Optional[datetime]]:
+    """(ETag, Last-Modified) de uma resposta; mesma conta no WSGI e no ASGI."""
+    parts = [endpoint, query_string, _user_scope(user)]
+    last_modified = None
+    if tables:
+        vers, last_modified = versions(tables, db)
+        parts += [f"{name}={v}" for name, v in vers.items()]
+    if fingerprint is not None:
+        parts.append(fingerprint())
+    if dated:
+        today = datetime.now(timezone.utc).date()
+        parts.append(today.isoformat())
+        midnight = datetime.combine(today, time.min)
+        last_modified = max(last_modified or midnight, midnight)
+    etag = hashlib.sha1("|".join(parts).encode()).hexdigest()[:24]
+    if last_modified is not None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+    return etag, last_modified
+
+
+def not_modified(if_none_match: Optional[str], if_modified_since: Optional[str],
+                 etag: str, last_modified: Optional[datetime]) -> bool:
+    """True se os cabeçalhos condicionais do cliente ainda valem (responder 304)."""
+    environ = {"REQUEST_METHOD": "GET"}
+    if if_none_match:
+        environ["HTTP_IF_NONE_MATCH"] = if_none_match
+    if if_modified_since:
+        environ["HTTP_IF_MODIFIED_SINCE"] = if_modified_since
+    return not is_resource_modified(environ, etag=etag, last_modified=last_modified)
+
+
+def response_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> Dict[str, str]:
+    headers = {"ETag": quote_etag(etag), "Cache-Control": cache_control, "Vary": "Authorization"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def conditional(
+    tables: Sequence[str] = (),
+    cache_control: str = REVALIDATE,
+    dated: bool = False,
+    fingerprint: Optional[Callable[[], str]] = None,
+):
+    """Responde 304 quando os validadores não mudaram; senão roda a rota e os anexa.
+
+    `tables`: marcadores (de TRACKED_TABLES) que a rota lê. `dated`: a resposta
+    depende do dia (janela de 30 dias, mês corrente). `fingerprint`: ETag a
+    partir de dados já em memória (ex.: cadastro de lojas), sem ir ao banco.
+    """
+    untracked = set(tables) - TRACKED_TABLES
+    if untracked:
+        raise ValueError(f"tabela sem versão: {', '.join(sorted(untracked))}")
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # versões lidas na mesma sessão (réplica ou primário) que a view vai usar
+            etag, last_modified = validators(
+                request.endpoint or "", request.query_string.decode(), current_user(),
+                tables, dated, fingerprint, requestdb.read() if tables else None,
+            )
+            if not_modified(request.headers.get("If-None-Match"),
+                            request.headers.get("If-Modified-Since"), etag, last_modified):
+                resp = make_response("", 304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            for name, value in response_headers(etag, last_modified, cache_control).items():
+                if name == "Vary":
+                    resp.vary.add(value)
+                else:
+                    resp.headers[name] = value
+            return resp
+
+        return wrapper
+
+    return decorator
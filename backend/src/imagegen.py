@@ -1,6 +1,17 @@
 # imagegen.py — gera arte padrão personalizada para WhatsApp (PNG)
+#
+# A parte fixa do cartão (fundo, faixa, logo, título, rodapé, borda) é
+# renderizada uma vez por processo, junto com uma paleta de 256 cores. A cada
+# cartão só desenhamos os textos dinâmicos numa faixa recortada dela,
+# quantizamos essa faixa na paleta fixa e gravamos um PNG paletizado (bem mais
+# barato de codificar que RGB). Fontes e logo redimensionado ficam em cache, e
+# os PNGs prontos ficam num LRU por (primeiro nome, visitas, meta, faltam).
+import hashlib
 import os
+from functools import lru_cache
 from io import BytesIO
+from typing import Tuple
+
 from PIL import Image, ImageDraw, ImageFont
 
 # Cores da CDC
@@ -9,6 +20,17 @@ DOURADO = (214, 167, 46) # #D6A72E
 CREME = (250, 245, 235)  # #FAF5EB
 CHUMBO = (33, 33, 33)
 
+W, H = 1080, 1080  # quadrado padrão feed/whatsapp
+
+# faixa vertical onde ficam os textos dinâmicos
+BAND_TOP, BAND_BOTTOM = 400, 880
+
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", "512"))
+# zlib 1..9; com a imagem paletizada o nível 1 já gera PNGs pequenos
+PNG_COMPRESS_LEVEL = int(os.getenv("CARD_PNG_COMPRESS_LEVEL", "1"))
+
+
+@lru_cache(maxsize=None)
 def _load_font(size=64):
     # tenta fontes comuns; fallback para default
     try:
@@ -21,54 +43,37 @@ def _load_font(size=64):
     except Exception:
         return ImageFont.load_default()
 
+
+@lru_cache(maxsize=1)
 def _load_logo():
-    # Logo opcional: BACKEND_LOGO_PATH no .env
+    # Logo opcional: BACKEND_LOGO_PATH no .env — já redimensionado para o topo
     logo_path = os.getenv("BACKEND_LOGO_PATH")
     if logo_path and os.path.exists(logo_path):
         try:
-            return Image.open(logo_path).convert("RGBA")
+            logo = Image.open(logo_path).convert("RGBA")
+            max_h = 220
+            ratio = max_h / logo.height
+            return logo.resize((int(logo.width*ratio), int(logo.height*ratio)))
         except Exception:
             pass
     return None
 
-def make_card(cliente_nome: str, visitas: int, meta: int, faltam: int):
-    W, H = 1080, 1080  # quadrado padrão feed/whatsapp
-    img = Image.new("RGB", (W, H), CREME)
-    draw = ImageDraw.Draw(img)
-
-    # topo vinho
-    draw.rectangle([0,0,W,360], fill=VINHO)
 
-    # linhas douradas decorativas
-    draw.rectangle([0,340,W,360], fill=DOURADO)
+def _text_size(draw, text, font):
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    return right - left, bottom - top
 
-    # logo (se houver)
-    logo = _load_logo()
-    if logo:
-        # redimensiona para caber no topo
-        max_h = 220
-        ratio = max_h / logo.height
-        logo2 = logo.resize((int(logo.width*ratio), int(logo.height*ratio)))
-        img.paste(logo2, (60, 60), logo2)
 
-    # textos
-    title_font = _load_font(78)
+def _draw_dynamic(draw, first_name, visitas, meta, faltam, dy=0):
     name_font = _load_font(64)
     big_font = _load_font(120)
-    small_font = _load_font(44)
-
-    # Título topo (à direita do logo)
-    title = "Programa de Fidelidade"
-    tw, th = draw.textsize(title, font=title_font)
-    draw.text((W-60-tw, 80), title, font=title_font, fill=(255,255,255))
 
     # saudação
-    hello = f"Olá, {cliente_nome.split()[0]}!"
-    draw.text((60, 420), hello, font=name_font, fill=CHUMBO)
+    draw.text((60, 420-dy), f"Olá, {first_name}!", font=name_font, fill=CHUMBO)
 
     # pontuação
     pontos = f"Você tem {visitas} visita(s)"
-    draw.text((60, 520), pontos, font=big_font, fill=VINHO)
+    draw.text((60, 520-dy), pontos, font=big_font, fill=VINHO)
 
     # meta/ faltam
     if faltam <= 0:
@@ -77,19 +82,108 @@ def make_card(cliente_nome: str, visitas: int, meta: int, faltam: int):
     else:
         frase = f"Faltam {faltam} visita(s) para o brinde."
         fillc = CHUMBO
-    draw.text((60, 670), f"Meta: {meta} visitas", font=name_font, fill=CHUMBO)
-    draw.text((60, 760), frase, font=name_font, fill=fillc)
+    draw.text((60, 670-dy), f"Meta: {meta} visitas", font=name_font, fill=CHUMBO)
+    draw.text((60, 760-dy), frase, font=name_font, fill=fillc)
+
+
+@lru_cache(maxsize=1)
+def _static_layer():
+    """Camada fixa (RGB e paletizada) e a paleta, calculadas uma vez por processo."""
+    img = Image.new("RGB", (W, H), CREME)
+    draw = ImageDraw.Draw(img)
+
+    # topo vinho
+    draw.rectangle([0,0,W,360], fill=VINHO)
+
+    # linhas douradas decorativas
+    draw.rectangle([0,340,W,360], fill=DOURADO)
+
+    # logo (se houver)
+    logo = _load_logo()
+    if logo:
+        img.paste(logo, (60, 60), logo)
+
+    # Título topo (à direita do logo)
+    title_font = _load_font(78)
+    title = "Programa de Fidelidade"
+    tw, th = _text_size(draw, title, title_font)
+    draw.text((W-60-tw, 80), title, font=title_font, fill=(255,255,255))
 
     # rodapé
+    small_font = _load_font(44)
     footer = "Casa do Cigano • Obrigado pela visita!"
-    fw, fh = draw.textsize(footer, font=small_font)
+    fw, fh = _text_size(draw, footer, small_font)
     draw.text(((W-fw)//2, 980-fh), footer, font=small_font, fill=CHUMBO)
 
     # borda fina
     draw.rectangle([5,5,W-5,H-5], outline=VINHO, width=6)
 
-    # retorna bytes PNG
+    # paleta a partir de um cartão de referência (inclui o antialiasing dos textos)
+    ref = img.copy()
+    _draw_dynamic(ImageDraw.Draw(ref), "Olá", 0, 10, 10)
+    _draw_dynamic(ImageDraw.Draw(ref), "Olá", 10, 10, 0)
+    palette = ref.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+    paletted = img.quantize(palette=palette, dither=Image.Dither.NONE)
+    return img, paletted, palette
+
+
+def _template_version():
+    """Muda quando fonte/logo configurados mudam; entra no ETag."""
+    parts = []
+    for env in ("CARD_FONT_PATH", "BACKEND_LOGO_PATH"):
+        path = os.getenv(env) or ""
+        mtime = os.path.getmtime(path) if path and os.path.exists(path) else 0
+        parts.append(f"{path}:{mtime}")
+    return "|".join(parts)
+
+
+def card_etag(first_name: str, visitas: int, meta: int, faltam: int) -> str:
+    """ETag do cartão, calculado sem renderizar (permite 304 direto)."""
+    key = f"v2|{_template_version()}|{first_name}|{visitas}|{meta}|{faltam}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def first_name(cliente_nome: str) -> str:
+    parts = (cliente_nome or "").split()
+    return parts[0] if parts else "cliente"
+
+
+@lru_cache(maxsize=CARD_CACHE_SIZE)
+def _render(first_name: str, visitas: int, meta: int, faltam: int) -> bytes:
+    rgb, paletted, palette = _static_layer()
+    band = rgb.crop((0, BAND_TOP, W, BAND_BOTTOM))
+    _draw_dynamic(ImageDraw.Draw(band), first_name, visitas, meta, faltam, dy=BAND_TOP)
+
+    img = paletted.copy()
+    img.paste(band.quantize(palette=palette, dither=Image.Dither.NONE), (0, BAND_TOP))
+
     buf = BytesIO()
-    img.save(buf, format="PNG", optimize=True)
-    buf.seek(0)
+    img.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
     return buf.getvalue()
+
+
+def render_card(cliente_nome: str, visitas: int, meta: int, faltam: int) -> Tuple[bytes, str]:
+    """(PNG, ETag) do cartão; usa o LRU de cartões prontos."""
+    first = first_name(cliente_nome)
+    args = (first, int(visitas), int(meta), int(faltam))
+    return _render(*args), card_etag(*args)
+
+
+def make_card(cliente_nome: str, visitas: int, meta: int, faltam: int):
+    # retorna bytes PNG
+    return render_card(cliente_nome, visitas, meta, faltam)[0]
+
+
+def save_card(directory: str, cliente_nome: str, visitas: int, meta: int, faltam: int) -> str:
+    """Grava o cartão em directory/<etag>.png (escrita atômica) e devolve o nome do arquivo.
+
+    Usada pelo pool de processos da campanha de aniversariantes (src/campaign.py).
+    """
+    png, etag = render_card(cliente_nome, visitas, meta, faltam)
+    name = f"{etag}.png"
+    path = os.path.join(directory, name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(png)
+    os.replace(tmp, path)
+    return name
@@ -0,0 +1,147 @@
+"""Confere os índices do banco contra os padrões de consulta do app.
+
+`QUERY_PATTERNS` lista as colunas que cada consulta quente filtra/ordena; um
+padrão está coberto quando algum índice (ou PK/UNIQUE) começa por essas
+colunas. No PostgreSQL também aponta índices nunca usados desde o último
+reset de estatísticas (pg_stat_user_indexes.idx_scan = 0), índices INVALID
+(CONCURRENTLY interrompido) e índices redundantes (duplicados ou prefixo de
+outro).
+
+    flask --app src.main db check-indexes
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from .db import engine as default_engine
+
+# (tabela, colunas na ordem do índice, onde é usado)
+QUERY_PATTERNS: Sequence[Tuple[str, Tuple[str, ...], str]] = (
+    ("users", ("email",), "login"),
+    ("clients", ("cpf_key",), "visita/resgate por CPF, filtro ?cpf= (exato e prefixo)"),
+    ("clients", ("created_at", "id"), "GET /api/clientes (keyset)"),
+    ("clients", ("store_id", "created_at"), "GET /api/clientes de usuário travado na loja"),
+    ("clients", ("birth_month", "birth_day"), "aniversariantes"),
+    ("visits", ("client_id",), "saldo/reconcile por cliente"),
+    ("visits", ("created_at", "id"), "GET /api/visitas (keyset)"),
+    ("visits", ("store_id", "created_at"), "visitas por loja e período (rollup, relatórios)"),
+    ("redemptions", ("created_at", "id"), "GET /api/resgates (keyset)"),
+    ("redemptions", ("store_id", "created_at"), "resgates por loja e período"),
+    ("clients", ("name_key",), "GET /api/clientes/search (nome que começa pelo termo)"),
+    ("clients", ("phone_rev",), "GET /api/clientes/search (final do telefone)"),
+    ("email_outbox", ("status", "next_attempt_at"), "OutboxSender"),
+    ("clients", ("updated_at", "id"), "GET /api/sync (watermark)"),
+    ("clients", ("store_id", "updated_at", "id"), "GET /api/sync de terminal travado na loja"),
+    ("stores", ("updated_at", "id"), "GET /api/sync (watermark)"),
+    ("sync_tombstones", ("deleted_at", "id"), "GET /api/sync (exclusões)"),
+)
+# só fazem sentido no PostgreSQL (GIN/pg_trgm)
+PG_QUERY_PATTERNS: Sequence[Tuple[str, Tuple[str, ...], str]] = (
+    ("clients", ("name_key",), "GET /api/clientes/search (nome, GIN pg_trgm)"),
+)
+
+
+@dataclass
+class IndexReport:
+    missing: List[Tuple[str, Tuple[str, ...], str]] = field(default_factory=list)
+    unused: List[Tuple[str, str, int]] = field(default_factory=list)  # (tabela, índice, bytes)
+    invalid: List[Tuple[str, str]] = field(default_factory=list)
+    redundant: List[Tuple[str, str, str]] = field(default_factory=list)  # (tabela, índice, coberto por)
+    usage_stats: bool = False
+
+
+def _table_indexes(insp, table: str) -> Tuple[Dict[str, Tuple[str, ...]], set]:
+    """({nome: colunas}, nomes que garantem unicidade) de uma tabela."""
+    out: Dict[str, Tuple[str, ...]] = {}
+    unique = set()
+    pk = insp.get_pk_constraint(table)
+    if pk and pk.get("constrained_columns"):
+        name = pk.get("name") or f"{table}_pkey"
+        out[name] = tuple(pk["constrained_columns"])
+        unique.add(name)
+    for uc in insp.get_unique_constraints(table):
+        out[uc["name"]] = tuple(uc["column_names"])
+        unique.add(uc["name"])
+    for ix in insp.get_indexes(table):
+        cols = tuple(c for c in ix["column_names"] if c)
+        if cols and ix["name"] not in out:
+            out[ix["name"]] = cols
+            if ix.get("unique"):
+                unique.add(ix["name"])
+    return out, unique
+
+
+def _redundant(idx: Dict[str, Tuple[str, ...]], unique: set) -> List[Tuple[str, str]]:
+    """(índice, coberto por): prefixo de um índice maior ou duplicata de outro."""
+    out = []
+    for name, cols in idx.items():
+        if name in unique:
+            continue  # garante unicidade; não dá para remover
+        for other, ocols in sorted(idx.items()):
+            if other == name or ocols[:len(cols)] != cols:
+                continue
+            if len(ocols) > len(cols) or other in unique or other < name:
+                out.append((name, other))
+                break
+    return out
+
+
+def check(bind: Optional[Engine] = None) -> IndexReport:
+    bind = bind or default_engine
+    insp = inspect(bind)
+    tables = set(insp.get_table_names())
+    report = IndexReport()
+
+    by_table = {t: _table_indexes(insp, t) for t in sorted(tables)}
+    patterns = list(QUERY_PATTERNS)
+    if bind.dialect.name == "postgresql":
+        patterns += PG_QUERY_PATTERNS
+    for table, cols, used_by in patterns:
+        existing = by_table.get(table, ({}, set()))[0]
+        if not any(ix[:len(cols)] == cols for ix in existing.values()):
+            report.missing.append((table, cols, used_by))
+
+    for table, (idx, unique) in by_table.items():
+        report.redundant += [(table, name, other) for name, other in _redundant(idx, unique)]
+
+    if bind.dialect.name == "postgresql":
+        report.usage_stats = True
+        with bind.connect() as conn:
+            report.unused = [tuple(r) for r in conn.execute(text(
+                "SELECT s.relname, s.indexrelname, pg_relation_size(s.indexrelid)"
+                " FROM pg_stat_user_indexes s JOIN pg_index i ON i.indexrelid = s.indexrelid"
+                " WHERE s.idx_scan = 0 AND NOT i.indisunique AND NOT i.indisprimary"
+                " ORDER BY pg_relation_size(s.indexrelid) DESC"
+            ))]
+            report.invalid = [tuple(r) for r in conn.execute(text(
+                "SELECT t.relname, c.relname FROM pg_index i"
+                " JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_class t ON t.oid = i.indrelid"
+                " WHERE NOT i.indisvalid AND pg_table_is_visible(c.oid)"
+            ))]
+    return report
+
+
+def format_report(report: IndexReport) -> List[str]:
+    lines: List[str] = []
+    if report.missing:
+        lines.append("Índices faltando:")
+        lines += [f"  {t}({', '.join(c)})  — {why}" for t, c, why in report.missing]
+    else:
+        lines.append("Nenhum índice faltando para os padrões de consulta conhecidos.")
+    if report.invalid:
+        lines.append("Índices INVALID (rode `db upgrade` de novo):")
+        lines += [f"  {t}.{name}" for t, name in report.invalid]
+    if report.redundant:
+        lines.append("Índices redundantes (duplicados ou prefixo de outro):")
+        lines += [f"  {t}.{name} — coberto por {other}" for t, name, other in report.redundant]
+    if report.usage_stats:
+        if report.unused:
+            lines.append("Índices sem uso desde o último reset de estatísticas:")
+            lines += [f"  {t}.{name} ({size // 1024} KiB)" for t, name, size in report.unused]
+    else:
+        lines.append("(uso de índices só é medido no PostgreSQL)")
+    return lines
@@ -2,22 +2,30 @@ from __future__ import annotations
 
 import os
 import re
-from datetime import datetime, timedelta, date
+import click
+from datetime import datetime, timedelta
+from functools import wraps
 from urllib.parse import quote
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from flask_jwt_extended import (
-    JWTManager, create_access_token, jwt_required,
-    get_jwt, get_jwt_identity
+    JWTManager, create_access_token, jwt_required, get_jwt
 )
-from sqlalchemy import func, select, delete
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 
-from .db import Base, engine, SessionLocal
-from .models import User, Store, Client, Visit, Redemption
-from .util import hash_password, verify_password
+from .db import READ_MARKER_HEADER, SessionLocal, engine, read_engine, read_router
+from .models import User, Store, Client, Visit
+from .util import hash_password
+from .auth import current_user, keep_tokens, token_claims, token_is_revoked
+from .schema import ensure_schema, missing as schema_missing
+from .passwords import PoolSaturated
+from . import (
+    auth, balance, birthdays, campaign, exports, handlers, httpcache, importer, metrics, passwords, requestdb,
+    serializers, stats, stores, sync,
+)
 
 # importa blueprint de visitas
 from .routes.visita import visita_bp
@@ -41,33 +49,57 @@ CORS(
     resources={r"/api/*": {"origins": allowed_origins}},
     supports_credentials=True,
     methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "If-None-Match", "If-Modified-Since", READ_MARKER_HEADER],
+    # validadores de cache (src/httpcache.py) e marcador de escrita (src/db.py) legíveis pelo front
+    expose_headers=["ETag", "Last-Modified", READ_MARKER_HEADER],
 )
 
 jwt = JWTManager(app)
+# revogação por token_version (sem SELECT em users a cada requisição)
+jwt.token_in_blocklist_loader(token_is_revoked)
+
+# latência/SQL por requisição + GET /api/_metrics (Prometheus)
+metrics.init_app(app, engine, read_engine)
+# uma sessão por requisição, commit/rollback no fim (src/requestdb.py)
+requestdb.init_app(app)
+# JSON das respostas com orjson quando instalado (src/serializers.py)
+serializers.init_app(app)
+# versões por tabela para ETag/304 (src/httpcache.py)
+httpcache.track()
+# exclusões de clientes/lojas viram tombstones do sync dos terminais (src/sync.py)
+sync.track()
+# troca de papel, loja ou senha de um usuário derruba os tokens dele (src/auth.py)
+auth.track()
+
+# lojas em memória por worker, carregadas no primeiro uso (src/stores.py)
+stores.init_app(app)
 
 # registra o blueprint de visitas
 app.register_blueprint(visita_bp, url_prefix="/api")
 
+
 # ================== CONSTANTES ==================
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
 STORE_NAMES = [
     "Mega Loja – Jabaquara", "Mascote", "Indianopolis",
     "Tatuape", "Praia Grande", "Bertioga", "Osasco",
 ]
-GIFT_NAME = os.getenv("GIFT_NAME", "1 Kg de Vela Palito")
-DEFAULT_META = int(os.getenv("DEFAULT_META", "10"))
 
 
-# ================= HELPERS =================
-def current_user():
-    identity = get_jwt_identity()
-    if not identity:
-        return None
-    db = SessionLocal()
+@app.after_request
+def _read_your_writes(response):
+    # depois de uma escrita, as leituras deste usuário vão ao primário (src/db.py);
+    # o front reenvia o marcador, que vale também no outro worker
+    if request.method not in WRITE_METHODS or response.status_code >= 400:
+        return response
     try:
-        return db.get(User, int(identity))
-    finally:
-        db.close()
+        # a view pode não ter chamado current_user (ex.: create_user, importação)
+        user = current_user()
+    except RuntimeError:
+        user = None  # rota sem @jwt_required
+    if user is not None:
+        response.headers[READ_MARKER_HEADER] = read_router.wrote(user.id)
+    return response
 
 
 # ================= AUTH =================
@@ -76,27 +108,39 @@ def login():
     data = request.get_json(force=True)
     email = data.get("email", "").strip().lower()
     password = data.get("password", "")
-    db = SessionLocal()
+    db = requestdb.get()
+    user = db.execute(select(User).where(User.email == email)).scalar_one_or_none()
     try:
-        user = db.execute(select(User).where(User.email == email)).scalar_one_or_none()
-        if not user or not verify_password(password, user.password_hash):
-            return jsonify({"error": "Credenciais inválidas"}), 401
-
-        claims = {"role": user.role, "lock_loja": user.lock_loja, "store_id": user.store_id}
-        token = create_access_token(
-            identity=str(user.id),
-            additional_claims=claims,
-            expires_delta=timedelta(hours=8),
-        )
-        return jsonify({
-            "token": token,
-            "user": {
-                "id": user.id, "name": user.name, "email": user.email,
-                "role": user.role, "lock_loja": user.lock_loja, "store_id": user.store_id
-            },
-        })
-    finally:
-        db.close()
+        ok = bool(user) and passwords.verify(password, user.password_hash)
+    except (PoolSaturated, TimeoutError):
+        # pool cheio ou fila que não andou em PASSWORD_TIMEOUT: mesmo 503
+        resp = jsonify({"error": "Muitos logins simultâneos, tente novamente"})
+        resp.headers["Retry-After"] = str(passwords.RETRY_AFTER)
+        return resp, 503
+    if not ok:
+        return jsonify({"error": "Credenciais inválidas"}), 401
+
+    if passwords.needs_rehash(user.password_hash):
+        # custo (BCRYPT_ROUNDS) mudou: regrava o hash (no commit da requisição)
+        try:
+            user.password_hash = passwords.hash(password)
+            # mesma senha: os tokens já emitidos continuam valendo
+            keep_tokens(db, user)
+        except (PoolSaturated, TimeoutError):
+            pass
+
+    token = create_access_token(
+        identity=str(user.id),
+        additional_claims=token_claims(user),
+        expires_delta=timedelta(hours=8),
+    )
+    return jsonify({
+        "token": token,
+        "user": {
+            "id": user.id, "name": user.name, "email": user.email,
+            "role": user.role, "lock_loja": user.lock_loja, "store_id": user.store_id
+        },
+    })
 
 
 @app.get("/api/auth/me")
@@ -105,10 +149,8 @@ def me():
     user = current_user()
     if not user:
         return jsonify({"error": "not found"}), 404
-    return jsonify({
-        "id": user.id, "name": user.name, "email": user.email,
-        "role": user.role, "lock_loja": user.lock_loja, "store_id": user.store_id
-    })
+    db = requestdb.read()
+    return handlers.me(db, user)
 
 
 # ================ ADMIN =================
@@ -117,17 +159,25 @@ def _require_admin():
     return claims.get("role") == "ADMIN"
 
 
+def _admin_only(view):
+    """403 para não-admin antes dos decoradores internos (ex.: o 304 de httpcache.conditional)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _require_admin():
+            return jsonify({"error": "forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
 @app.get("/api/admin/stores")
 @jwt_required()
+@_admin_only
+@httpcache.conditional(
+    cache_control=httpcache.REFERENCE,
+    fingerprint=lambda: repr([(s.id, s.name, s.meta_visitas) for s in stores.registry.all()]),
+)
 def list_stores():
-    if not _require_admin():
-        return jsonify({"error": "forbidden"}), 403
-    db = SessionLocal()
-    try:
-        stores = db.execute(select(Store)).scalars().all()
-        return jsonify([{"id": s.id, "name": s.name, "meta_visitas": s.meta_visitas} for s in stores])
-    finally:
-        db.close()
+    return jsonify([s.to_dict() for s in stores.registry.all()])
 
 
 @app.post("/api/admin/users")
@@ -136,7 +186,7 @@ def create_user():
     if not _require_admin():
         return jsonify({"error": "forbidden"}), 403
     data = request.get_json(force=True)
-    db = SessionLocal()
+    db = requestdb.get()
     try:
         store_id = data.get("store_id")
         lock_loja = True if store_id else False
@@ -149,191 +199,270 @@ def create_user():
             store_id=store_id,
         )
         db.add(u)
-        db.commit()
-        return jsonify({
-            "id": u.id, "name": u.name, "email": u.email,
-            "role": u.role, "lock_loja": u.lock_loja, "store_id": u.store_id
-        }), 201
+        db.flush()
     except IntegrityError:
-        db.rollback()
         return jsonify({"error": "email já existe"}), 400
-    finally:
-        db.close()
+    return jsonify({
+        "id": u.id, "name": u.name, "email": u.email,
+        "role": u.role, "lock_loja": u.lock_loja, "store_id": u.store_id
+    }), 201
 
 
-@app.get("/api/admin/users")
+@app.post("/api/admin/clientes/import")
 @jwt_required()
-def list_users():
+def import_clients():
+    """Importa clientes de um CSV/XLSX (campo `file`); ver src/importer.py.
+
+    Form: store_id (loja padrão), update=1 para atualizar CPFs já cadastrados.
+    """
     if not _require_admin():
         return jsonify({"error": "forbidden"}), 403
-    db = SessionLocal()
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        return jsonify({"error": "envie o arquivo no campo 'file'"}), 400
+    store_id = request.form.get("store_id", type=int)
+    update_existing = request.form.get("update") in ("1", "true")
     try:
-        items = db.execute(select(User).order_by(User.id.desc())).scalars().all()
-        return jsonify([
-            {
-                "id": u.id, "name": u.name, "email": u.email,
-                "role": u.role, "lock_loja": u.lock_loja, "store_id": u.store_id
-            } for u in items
-        ])
-    finally:
-        db.close()
+        result = importer.run_import(
+            requestdb.get(), upload.stream, upload.filename,
+            default_store_id=store_id, update_existing=update_existing,
+        )
+        return jsonify(result)
+    except importer.InvalidImportFile as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.get("/api/admin/users")
+@jwt_required()
+@_admin_only
+@httpcache.conditional(tables=("users",))
+def list_users():
+    db = requestdb.read()
+    rows = db.execute(select(*serializers.USER.columns).order_by(User.id.desc()))
+    return jsonify(serializers.USER.dump(rows))
 
 
 # =============== CLIENTES ===============
 @app.post("/api/clientes")
 @jwt_required()
 def create_client():
-    user = current_user()
-    data = request.get_json(force=True)
-    db = SessionLocal()
-    try:
-        raw_bday = data.get("birthday")
-        bday_str = None
-        if raw_bday:
-            try:
-                bday_str = date.fromisoformat(str(raw_bday)).isoformat()
-            except Exception:
-                return jsonify({"error": "birthday inválido. Use YYYY-MM-DD"}), 400
-
-        c = Client(
-            name=data.get("name", "").strip(),
-            cpf=(data.get("cpf") or "").strip(),
-            phone=(data.get("phone") or "").strip(),
-            email=(data.get("email") or "").strip() or None,
-            birthday=bday_str,
-            store_id=(data.get("store_id") or user.store_id),
-        )
-        db.add(c)
-        db.commit()
-        return jsonify({"id": c.id}), 201
-    except IntegrityError:
-        db.rollback()
-        return jsonify({"error": "CPF já cadastrado"}), 400
-    finally:
-        db.close()
+    db = requestdb.get()
+    return handlers.create_client(db, current_user(), request.get_json(force=True))
 
 
 @app.get("/api/clientes")
 @jwt_required()
 def list_clients():
-    user = current_user()
-    cpf = (request.args.get("cpf") or "").strip()
-    page = int(request.args.get("page", 1))
-    per_page = int(request.args.get("per_page", 10))
-    db = SessionLocal()
-    try:
-        q = select(Client)
-        if cpf:
-            q = q.where(Client.cpf == cpf)
-        elif user.lock_loja and user.store_id:
-            q = q.where(Client.store_id == user.store_id)
-        total = db.execute(select(func.count()).select_from(q.subquery())).scalar_one()
-        items = db.execute(
-            q.order_by(Client.created_at.desc())
-             .offset((page - 1) * per_page)
-             .limit(per_page)
-        ).scalars().all()
-        return jsonify({
-            "total": int(total),
-            "items": [{
-                "id": c.id, "name": c.name, "cpf": c.cpf, "phone": c.phone,
-                "email": c.email, "birthday": c.birthday,
-                "store_id": c.store_id,
-            } for c in items],
-        })
-    finally:
-        db.close()
+    """Lista clientes com paginação por cursor (?cursor=, ?per_page=, ?total=)."""
+    db = requestdb.read()
+    return handlers.list_clients(db, current_user(), request.args)
+
+
+@app.get("/api/clientes/search")
+@jwt_required()
+def buscar_clientes():
+    """Busca do balcão: ?q= nome (parcial, sem acento) ou dígitos (início do CPF / final do telefone)."""
+    db = requestdb.read()
+    return handlers.search_clients(db, current_user(), request.args)
+
+
+@app.get("/api/clientes/<int:cid>/cartao")
+@jwt_required()
+def client_card(cid):
+    """Cartão de fidelidade (PNG) do cliente, com ETag/If-None-Match."""
+    from . import imagegen
+
+    db = requestdb.read()
+    row = db.execute(
+        select(Client.name, Client.visits_cycle, Store.meta_visitas)
+        .join(Store, Store.id == Client.store_id, isouter=True)
+        .where(Client.id == cid)
+    ).one_or_none()
+    if not row:
+        return jsonify({"error": "Cliente não encontrado"}), 404
+
+    name, visitas, meta = row.name, int(row.visits_cycle or 0), int(row.meta_visitas or handlers.DEFAULT_META)
+    faltam = max(meta - visitas, 0)
+    etag = imagegen.card_etag(imagegen.first_name(name), visitas, meta, faltam)
+    if etag in request.if_none_match:
+        resp = app.response_class(status=304)
+    else:
+        png, etag = imagegen.render_card(name, visitas, meta, faltam)
+        resp = app.response_class(png, mimetype="image/png")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
 
 # =============== RESGATES ===============
 @app.post("/api/resgates")
 @jwt_required()
 def redeem_gift():
-    user = current_user()
-    data = request.get_json(force=True)
-    cpf = (data.get("cpf") or "").strip()
-    gift_name = (data.get("gift_name") or GIFT_NAME).strip()
-    db = SessionLocal()
-    try:
-        c = db.execute(select(Client).where(Client.cpf == cpf)).scalar_one_or_none()
-        if not c:
-            return jsonify({"error": "Cliente não encontrado"}), 404
-
-        store_id = user.store_id or c.store_id
-        if not store_id:
-            st = db.execute(select(Store).order_by(Store.id.asc())).scalars().first()
-            store_id = st.id if st else None
-
-        store = db.get(Store, store_id) if store_id else None
-        meta = store.meta_visitas if store else DEFAULT_META
-
-        count_visits = db.execute(select(func.count(Visit.id)).where(Visit.client_id == c.id)).scalar_one()
-        if count_visits < meta:
-            return jsonify({
-                "error": "Cliente ainda não atingiu a meta",
-                "visits_count": int(count_visits), "meta": int(meta),
-            }), 400
-
-        r = Redemption(client_id=c.id, store_id=store_id, gift_name=gift_name)
-        db.add(r)
-        db.commit()
-
-        db.execute(delete(Visit).where(Visit.client_id == c.id))
-        db.commit()
-
-        return jsonify({
-            "redemption_id": r.id, "gift_name": r.gift_name,
-            "when": r.created_at.isoformat(), "store_id": store_id,
-        })
-    finally:
-        db.close()
+    db = requestdb.get()
+    return handlers.redeem_gift(db, current_user(), request.get_json(force=True))
 
 
 # =============== DASHBOARD ===============
 @app.get("/api/dashboard/kpis")
 @jwt_required()
+@httpcache.conditional(tables=("daily_stats",), dated=True)
 def kpis():
-    user = current_user()
-    db = SessionLocal()
-    try:
-        since = datetime.utcnow() - timedelta(days=30)
-        vq = select(func.count(Visit.id)).where(Visit.created_at >= since)
-        rq = select(func.count(Redemption.id)).where(Redemption.created_at >= since)
-        cq = select(func.count(Client.id))
-        if user.lock_loja and user.store_id:
-            vq = vq.where(Visit.store_id == user.store_id)
-            rq = rq.where(Redemption.store_id == user.store_id)
-            cq = cq.where(Client.store_id == user.store_id)
-        visits_30 = db.execute(vq).scalar_one()
-        redemptions_30 = db.execute(rq).scalar_one()
-        clients_total = db.execute(cq).scalar_one()
-        return jsonify({
-            "visitas_30d": int(visits_30),
-            "clientes_total": int(clients_total),
-            "resgates_30d": int(redemptions_30),
-        })
-    finally:
-        db.close()
+    """KPIs do rollup diário; ver handlers.kpis (?start=, ?end=, ?by_store=1)."""
+    db = requestdb.read()
+    return handlers.kpis(db, current_user(), request.args)
 
 
 @app.get("/api/dashboard/aniversariantes")
 @jwt_required()
+@httpcache.conditional(tables=("clients_profile",), dated=True)
 def birthday_list():
+    """Aniversariantes do mês atual (ou ?mes=1..12), ou dos próximos ?dias=N."""
+    db = requestdb.read()
+    return handlers.birthday_list(db, current_user(), request.args)
+
+
+# =============== CAMPANHAS ===============
+def _campaign_args(source):
+    hoje = datetime.utcnow().date()
+    mes = int(source.get("mes") or hoje.month)
+    ano = int(source.get("ano") or hoje.year)
+    store_id = int(source["store_id"]) if source.get("store_id") else None
+    if not 1 <= mes <= 12:
+        raise ValueError("mes inválido")
+    return mes, ano, store_id
+
+
+@app.post("/api/admin/campanhas/aniversariantes")
+@jwt_required()
+def birthday_campaign_start():
+    """Gera (ou retoma) a campanha do mês; JSON: mes, ano, store_id, restart.
+
+    Dispara a CLI birthday-campaign num processo separado (src/campaign.py);
+    acompanhe pelo GET.
+    """
+    if not _require_admin():
+        return jsonify({"error": "forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        mes, ano, store_id = _campaign_args(data)
+        job = campaign.Job(mes, ano, store_id=store_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "mes/ano/store_id inválidos"}), 400
+    if not job.launch(restart=bool(data.get("restart"))):
+        return jsonify({"error": "campanha já em andamento", "status": job.status()}), 409
+    return jsonify(job.status()), 202
+
+
+@app.get("/api/admin/campanhas/aniversariantes")
+@jwt_required()
+def birthday_campaign_status():
+    """Progresso e vazão da campanha (?mes=, ?ano=, ?store_id=)."""
+    if not _require_admin():
+        return jsonify({"error": "forbidden"}), 403
+    try:
+        mes, ano, store_id = _campaign_args(request.args)
+    except ValueError:
+        return jsonify({"error": "mes/ano/store_id inválidos"}), 400
+    status = campaign.read_status(mes, ano, store_id)
+    if status is None:
+        return jsonify({"error": "campanha não encontrada"}), 404
+    return jsonify(status)
+
+
+@app.get("/api/admin/campanhas/aniversariantes/download")
+@jwt_required()
+def birthday_campaign_download():
+    """ZIP da campanha concluída: cartões, manifest.ndjson e contatos.csv."""
+    if not _require_admin():
+        return jsonify({"error": "forbidden"}), 403
+    try:
+        mes, ano, store_id = _campaign_args(request.args)
+    except ValueError:
+        return jsonify({"error": "mes/ano/store_id inválidos"}), 400
+    status = campaign.read_status(mes, ano, store_id) or {}
+    path = os.path.join(campaign.campaign_dir(mes, ano, store_id), campaign.ZIP_NAME)
+    if status.get("state") != "done" or not os.path.exists(path):
+        return jsonify({"error": "campanha não concluída"}), 404
+    suffix = f"_loja{store_id}" if store_id else ""
+    return send_file(path, mimetype="application/zip", as_attachment=True,
+                     download_name=f"aniversariantes_{ano}_{mes:02d}{suffix}.zip")
+
+
+# =============== SYNC (TERMINAIS OFFLINE) ===============
+@app.get("/api/sync")
+@jwt_required()
+def sync_changes():
+    """Lojas, clientes/saldos e exclusões alterados desde ?since= (ver src/sync.py)."""
+    db = requestdb.read()
+    payload, status = sync.changes(db, current_user(), request.args)
+    return sync.response(payload, status)
+
+
+# =============== EXPORTAÇÕES ===============
+def _export_format():
+    fmt = (request.args.get("format") or "xlsx").lower()
+    return fmt if fmt in exports.FORMATS else None
+
+
+@app.get("/api/dashboard/aniversariantes_export")
+@jwt_required()
+def birthday_export():
+    """Aniversariantes (mesmos filtros da lista) em ?format=xlsx|csv|ndjson, em streaming."""
     user = current_user()
-    mes = datetime.utcnow().month
-    db = SessionLocal()
+    hoje = datetime.utcnow().date()
+    fmt = _export_format()
+    if not fmt:
+        return jsonify({"error": "format deve ser xlsx, csv ou ndjson"}), 400
     try:
-        month_expr = func.extract("month", func.to_date(Client.birthday, 'YYYY-MM-DD'))
-        q = select(Client).where(month_expr == mes)
-        if user.lock_loja and user.store_id:
-            q = q.where(Client.store_id == user.store_id)
-        items = db.execute(q).scalars().all()
-        return jsonify([{
-            "id": c.id, "name": c.name, "cpf": c.cpf,
-            "birthday": c.birthday,
-        } for c in items])
-    finally:
-        db.close()
+        conds, _ = handlers.birthday_filters(user, request.args, hoje)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def build():
+        return (
+            select(Client.name, Client.cpf, Client.birthday, Store.name)
+            .join(Store, Store.id == Client.store_id, isouter=True)
+            .where(*conds)
+            .order_by(Client.birth_month, Client.birth_day, Client.id)
+        )
+
+    return exports.export_response(
+        fmt, f"aniversariantes_{hoje.year}_{hoje.month:02d}",
+        ["Nome", "CPF", "Nascimento", "Loja"], build,
+        session_factory=read_router.factory(user.id, request.headers.get(READ_MARKER_HEADER)),
+        title="Aniversariantes", widths=[30, 16, 14, 20],
+    )
+
+
+@app.get("/api/clientes/export")
+@jwt_required()
+def export_clients():
+    """Clientes (mesmos filtros da listagem) em ?format=csv|ndjson|xlsx, em streaming."""
+    user = current_user()
+    fmt = _export_format()
+    if not fmt:
+        return jsonify({"error": "format deve ser xlsx, csv ou ndjson"}), 400
+    conds, _ = handlers.client_filters(user, request.args)
+
+    def build():
+        return (
+            select(
+                Client.id, Client.name, Client.cpf, Client.phone, Client.email,
+                Client.birthday, Store.name, Client.visits_cycle, Client.visits_total,
+                Client.created_at,
+            )
+            .join(Store, Store.id == Client.store_id, isouter=True)
+            .where(*conds)
+            .order_by(Client.id)
+        )
+
+    return exports.export_response(
+        fmt, f"clientes_{datetime.utcnow():%Y%m%d}",
+        ["id", "nome", "cpf", "telefone", "email", "nascimento", "loja",
+         "visitas_ciclo", "visitas_total", "cadastro"],
+        build, session_factory=read_router.factory(user.id, request.headers.get(READ_MARKER_HEADER)),
+        title="Clientes", widths=[8, 30, 16, 16, 30, 14, 20, 12, 12, 20],
+    )
 
 
 # =============== HEALTH & SEED ===============
@@ -344,44 +473,230 @@ def health_api():
 
 @app.route("/api/_setup/seed", methods=["POST", "GET"])
 def seed():
-    Base.metadata.create_all(bind=engine)
+    # migrações (índices CONCURRENTLY, backfills) só pela CLI, nunca numa requisição
+    behind = schema_missing()
+    if behind:
+        return jsonify({
+            "error": "schema desatualizado: rode `flask --app src.main db upgrade`",
+            "pending": behind,
+        }), 503
+    db = requestdb.get()
+    existing = set(db.execute(select(Store.name)).scalars())
+    novas = [Store(name=nm, meta_visitas=handlers.DEFAULT_META) for nm in STORE_NAMES if nm not in existing]
+    if novas:
+        db.add_all(novas)
+        db.flush()
+        stores.notify_changed(db)
+    infos = [stores.StoreInfo.of(s) for s in novas]
+    # lojas antes dos usuários: o gerente usa o registro em memória
+    db.commit()
+    for info in infos:
+        stores.registry.put(info)
+
+    admin = db.execute(select(User).where(User.email == "admin@cdc.com")).scalar_one_or_none()
+    if not admin:
+        admin = User(
+            name="Admin", email="admin@cdc.com",
+            password_hash=hash_password("123456"),
+            role="ADMIN", lock_loja=False, store_id=None,
+        )
+        db.add(admin)
+
+    mascote = stores.registry.by_name("Mascote")
+    if mascote:
+        gerente = db.execute(
+            select(User).where(User.email == "gerente.mascote@cdc.com")
+        ).scalar_one_or_none()
+        if not gerente:
+            gerente = User(
+                name="Gerente Mascote", email="gerente.mascote@cdc.com",
+                password_hash=hash_password("123456"),
+                role="GERENTE", lock_loja=True, store_id=mascote.id,
+            )
+            db.add(gerente)
+
+    return {"ok": True, "admin_login": "admin@cdc.com", "password": "123456"}
+
+
+# =============== CLI ===============
+@app.cli.command("reconcile-balances")
+@click.option("--client-id", "client_ids", type=int, multiple=True, help="Limita a estes clientes.")
+def reconcile_balances(client_ids):
+    """Reconstrói visits_total/visits_cycle dos clientes a partir de `visits`."""
+    ensure_schema()
     db = SessionLocal()
     try:
-        for nm in STORE_NAMES:
-            ex = db.execute(select(Store).where(Store.name == nm)).scalar_one_or_none()
-            if not ex:
-                db.add(Store(name=nm, meta_visitas=DEFAULT_META))
+        n = balance.reconcile(db, client_ids or None)
+    finally:
+        db.close()
+    click.echo(f"{n} cliente(s) reconciliado(s)")
+
+
+@app.cli.command("revoke-tokens")
+@click.argument("emails", nargs=-1, required=True)
+def revoke_tokens_cmd(emails):
+    """Derruba os tokens já emitidos dos usuários (ex.: depois de um UPDATE manual em users)."""
+    db = SessionLocal()
+    try:
+        ids = list(db.execute(
+            select(User.id).where(User.email.in_([e.strip().lower() for e in emails]))
+        ).scalars())
+        auth.revoke_tokens(db, ids)
         db.commit()
+    finally:
+        db.close()
+    click.echo(f"{len(ids)} usuário(s) com tokens revogados")
 
-        admin = db.execute(select(User).where(User.email == "admin@cdc.com")).scalar_one_or_none()
-        if not admin:
-            admin = User(
-                name="Admin", email="admin@cdc.com",
-                password_hash=hash_password("123456"),
-                role="ADMIN", lock_loja=False, store_id=None,
+
+@app.cli.command("rebuild-daily-stats")
+def rebuild_daily_stats():
+    """Recria o rollup daily_stats a partir de visits/redemptions/clients."""
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        n = stats.rebuild(db)
+    finally:
+        db.close()
+    click.echo(f"{n} linha(s) em daily_stats")
+
+
+@app.cli.command("import-clients")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--store-id", type=int, default=None, help="Loja padrão para linhas sem loja.")
+@click.option("--update", "update_existing", is_flag=True, help="Atualiza CPFs já cadastrados.")
+def import_clients_cmd(path, store_id, update_existing):
+    """Importa clientes de um CSV/XLSX."""
+    import json
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        with open(path, "rb") as fh:
+            result = importer.run_import(
+                db, fh, path, default_store_id=store_id, update_existing=update_existing,
             )
-            db.add(admin); db.commit()
-
-        mascote = db.execute(select(Store).where(Store.name == "Mascote")).scalar_one_or_none()
-        if mascote:
-            gerente = db.execute(
-                select(User).where(User.email == "gerente.mascote@cdc.com")
-            ).scalar_one_or_none()
-            if not gerente:
-                gerente = User(
-                    name="Gerente Mascote", email="gerente.mascote@cdc.com",
-                    password_hash=hash_password("123456"),
-                    role="GERENTE", lock_loja=True, store_id=mascote.id,
-                )
-                db.add(gerente); db.commit()
-
-        return {"ok": True, "admin_login": "admin@cdc.com", "password": "123456"}
+        db.commit()
+    finally:
+        db.close()
+    click.echo(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+@app.cli.command("purge-sync-tombstones")
+def purge_sync_tombstones():
+    """Apaga as exclusões do sync mais antigas que SYNC_TOMBSTONE_DAYS."""
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        n = sync.purge(db)
     finally:
         db.close()
+    click.echo(f"{n} tombstone(s) removido(s)")
+
+
+@app.cli.command("birthday-campaign")
+@click.option("--mes", type=int, default=None, help="Mês dos aniversariantes (padrão: o atual).")
+@click.option("--ano", type=int, default=None, help="Ano da campanha (padrão: o atual).")
+@click.option("--store-id", type=int, default=None, help="Só clientes desta loja.")
+@click.option("--workers", type=int, default=None, help="Processos de renderização (padrão: núcleos).")
+@click.option("--restart", is_flag=True, help="Descarta o progresso e gera do zero.")
+@click.option("--lock-fd", type=int, default=None, hidden=True)  # lock herdado de Job.launch
+def birthday_campaign(mes, ano, store_id, workers, restart, lock_fd):
+    """Cartões + links do WhatsApp dos aniversariantes do mês, em ZIP (retomável)."""
+    ensure_schema()
+    hoje = datetime.utcnow().date()
+    job = campaign.Job(mes or hoje.month, ano or hoje.year, store_id=store_id, workers=workers)
+    if lock_fd is not None:
+        job.adopt_lock(lock_fd)
+    elif not job.acquire():
+        raise click.ClickException("campanha já em andamento")
+    if restart:
+        job.reset()
+    result = job.run(progress=lambda s: click.echo(
+        f"{s['clients']} cliente(s), {s['clients_per_s']} cliente(s)/s,"
+        f" {s['cards_rendered']} cartão(ões) novo(s), {s['cards_reused']} reaproveitado(s)"
+    ))
+    click.echo(f"{result['without_phone']} sem telefone válido; {os.path.join(job.dir, campaign.ZIP_NAME)}")
+
+
+@app.cli.command("send-emails")
+@click.option("--once", is_flag=True, help="Esvazia a fila e sai (sem loop).")
+def send_emails(once):
+    """Processa a outbox de e-mails (email_outbox) neste processo."""
+    from .emailer import OutboxSender
+
+    ensure_schema()
+    sender = OutboxSender()
+    if once:
+        click.echo(f"{sender.drain()} mensagem(ns) processada(s)")
+        return
+    sender.run_forever()
+
+
+@app.cli.command("backfill-birthdays")
+def backfill_birthdays():
+    """Preenche birth_month/birth_day dos clientes cadastrados antes das colunas."""
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        n = birthdays.backfill(db)
+    finally:
+        db.close()
+    click.echo(f"{n} cliente(s) atualizado(s)")
+
+
+@app.cli.group("db")
+def db_cli():
+    """Migrações do schema e conferência de índices."""
+
+
+@db_cli.command("upgrade")
+@click.option("--target", default=None, help="Para nesta versão (inclusive).")
+def db_upgrade(target):
+    """Cria tabelas/colunas e aplica as migrações pendentes."""
+    executed = ensure_schema(target=target, echo=click.echo)
+    n = sum(1 for e in executed if e.startswith("migration "))
+    click.echo(f"{n} migração(ões) aplicada(s)")
+
+
+@db_cli.command("status")
+def db_status():
+    """Lista as migrações e quando cada uma foi aplicada."""
+    from . import migrations
+
+    for version, description, applied_at in migrations.status():
+        when = str(applied_at)[:19] if applied_at else "pendente"
+        click.echo(f"{version}  {when:19}  {description}")
+
+
+@db_cli.command("check-indexes")
+def db_check_indexes():
+    """Aponta índices faltando, sem uso, INVALID ou redundantes."""
+    from . import indexes
+
+    report = indexes.check()
+    for line in indexes.format_report(report):
+        click.echo(line)
+    if report.missing or report.invalid:
+        raise SystemExit(1)
+
+
+@db_cli.command("replica-status")
+def db_replica_status():
+    """Mostra para onde vão as leituras e se a réplica acompanha o primário."""
+    from . import db as dbmod
+
+    click.echo(f"primário: {engine.url.render_as_string(hide_password=True)}")
+    click.echo(f"leitura:  {read_engine.url.render_as_string(hide_password=True)}"
+               + ("" if dbmod.REPLICA_URL else " (mesmo banco, pool próprio)"))
+    for name, prefix in (("primário", "DB_"), ("leitura", "DB_READ_")):
+        opts = " ".join(f"{k}={v}" for k, v in dbmod.pool_options(prefix).items())
+        click.echo(f"pool {name}: {opts}")
+    if dbmod.REPLICA_URL:
+        read_router.refresh()
+        click.echo(f"réplica em dia: {'sim' if read_router.healthy else 'não (leituras no primário)'}")
 
 
 # =============== BOOT (local) ===============
 if __name__ == "__main__":
-    Base.metadata.create_all(bind=engine)
+    ensure_schema()
     app.run(host="127.0.0.1", port=5000, debug=True)
     
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""Métricas de requisições e SQL no formato de texto do Prometheus.
+
+Coleta por processo (cada worker do gunicorn tem as suas):
+
+  - latência por endpoint (histograma) e contagem por status;
+  - nº de statements SQL e tempo em SQL por requisição (eventos do engine);
+  - amostras das consultas lentas, com o SQL normalizado (literais viram ?);
+  - espera por conexão do pool (`TimedQueuePool`, usado em db.py).
+
+Tudo fica em memória, atualizado sob um lock com operações O(1); custo de
+poucos microssegundos por requisição/statement. Exposto em /api/_metrics.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+SLOW_QUERY_SECONDS = float(os.getenv("METRICS_SLOW_QUERY_MS", "200")) / 1000
+SLOW_QUERY_SAMPLES = int(os.getenv("METRICS_SLOW_QUERY_SAMPLES", "50"))
+# se definido, /api/_metrics exige "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        sep = "," if labels else ""
+        out, acc = [], 0
+        for bound, n in zip(self.buckets, self.counts):
+            acc += n
+            out.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {acc}')
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        out.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        out.append(f"{name}_count{suffix} {self.count}")
+        return out
+
+
+# ---------- normalização de SQL ----------
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_PARAM = re.compile(r"%\(\w+\)s|:\w+|\$\d+|%s")
+_RE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL sem literais/parâmetros nem espaços repetidos (agrupa consultas iguais)."""
+    s = _RE_STRING.sub("?", sql)
+    s = _RE_PARAM.sub("?", s)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_LIST.sub("(?...)", s)
+    return _RE_SPACE.sub(" ", s).strip()[:500]
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.statements: Dict[Tuple[str, str], Histogram] = {}
+        self.sql_seconds: Dict[Tuple[str, str], float] = {}
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.pool_wait = Histogram(POOL_WAIT_BUCKETS)
+        # sql normalizado -> [ocorrências, soma, máximo, endpoint do pior caso]
+        self.slow: Dict[str, list] = {}
+        self.pools: List[QueuePool] = []
+
+    def observe_request(self, endpoint, method, status, seconds, statements, sql_seconds):
+        key = (endpoint, method)
+        with self.lock:
+            h = self.latency.get(key)
+            if h is None:
+                h = self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.statements[key] = Histogram(STATEMENT_BUCKETS)
+                self.sql_seconds[key] = 0.0
+            h.observe(seconds)
+            self.statements[key].observe(statements)
+            self.sql_seconds[key] += sql_seconds
+            rkey = (endpoint, method, str(status))
+            self.requests[rkey] = self.requests.get(rkey, 0) + 1
+
+    def observe_slow(self, sql: str, seconds: float, endpoint: str) -> None:
+        norm = normalize_sql(sql)
+        with self.lock:
+            entry = self.slow.get(norm)
+            if entry is None:
+                if len(self.slow) >= SLOW_QUERY_SAMPLES:
+                    # descarta a amostra menos lenta
+                    victim = min(self.slow, key=lambda k: self.slow[k][2])
+                    if self.slow[victim][2] >= seconds:
+                        return
+                    del self.slow[victim]
+                entry = self.slow[norm] = [0, 0.0, 0.0, endpoint]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds >= entry[2]:
+                entry[2], entry[3] = seconds, endpoint
+
+    def observe_pool_wait(self, seconds: float) -> None:
+        with self.lock:
+            self.pool_wait.observe(seconds)
+
+    def render(self) -> str:
+        out: List[str] = []
+        with self.lock:
+            out += [
+                "# HELP app_request_duration_seconds Latência das requisições por endpoint.",
+                "# TYPE app_request_duration_seconds histogram",
+            ]
+            for (ep, method), h in sorted(self.latency.items()):
+                out += h.lines("app_request_duration_seconds", _labels(endpoint=ep, method=method))
+            out += [
+                "# HELP app_requests_total Requisições por endpoint e status.",
+                "# TYPE app_requests_total counter",
+            ]
+            for (ep, method, status), n in sorted(self.requests.items()):
+                out.append(f"app_requests_total{{{_labels(endpoint=ep, method=method, status=status)}}} {n}")
+            out += [
+                "# HELP app_request_sql_statements Statements SQL por requisição.",
+                "# TYPE app_request_sql_statements histogram",
+            ]
+            for (ep, method), h in sorted(self.statements.items()):
+                out += h.lines("app_request_sql_statements", _labels(endpoint=ep, method=method))
+            out += [
+                "# HELP app_request_sql_seconds_total Tempo gasto em SQL pelas requisições.",
+                "# TYPE app_request_sql_seconds_total counter",
+            ]
+            for (ep, method), s in sorted(self.sql_seconds.items()):
+                out.append(f"app_request_sql_seconds_total{{{_labels(endpoint=ep, method=method)}}} {s:.6f}")
+            out += [
+                "# HELP app_db_pool_wait_seconds Espera por uma conexão do pool.",
+                "# TYPE app_db_pool_wait_seconds histogram",
+            ]
+            out += self.pool_wait.lines("app_db_pool_wait_seconds", "")
+            out += [
+                f"# HELP app_sql_slow_queries_total Consultas acima de {SLOW_QUERY_SECONDS * 1000:g} ms (SQL normalizado).",
+                "# TYPE app_sql_slow_queries_total counter",
+            ]
+            slow = sorted(self.slow.items(), key=lambda kv: -kv[1][2])
+            for sql, (n, total, worst, ep) in slow:
+                out.append(f"app_sql_slow_queries_total{{{_labels(sql=sql, endpoint=ep)}}} {n}")
+            out += ["# TYPE app_sql_slow_query_max_seconds gauge"]
+            for sql, (n, total, worst, ep) in slow:
+                out.append(f"app_sql_slow_query_max_seconds{{{_labels(sql=sql, endpoint=ep)}}} {worst:.6f}")
+        out += [
+            "# HELP app_db_pool_checked_out Conexões do pool em uso.",
+            "# TYPE app_db_pool_checked_out gauge",
+        ]
+        for i, pool in enumerate(self.pools):
+            out.append(f'app_db_pool_checked_out{{pool="{i}"}} {pool.checkedout()}')
+        out += ["# TYPE app_db_pool_size gauge"]
+        for i, pool in enumerate(self.pools):
+            out.append(f'app_db_pool_size{{pool="{i}"}} {pool.size()}')
+        return "\n".join(out) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _labels(**kw) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in kw.items())
+
+
+registry = Registry()
+
+# contadores da requisição corrente (uma thread por requisição no gthread)
+_local = threading.local()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool que mede quanto tempo cada checkout esperou por uma conexão."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        registry.pools.append(self)
+
+    def _do_get(self):
+        if not ENABLED:
+            return super()._do_get()
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            registry.observe_pool_wait(time.perf_counter() - t0)
+
+    def dispose(self):
+        super().dispose()
+        if self in registry.pools:
+            registry.pools.remove(self)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    t0 = getattr(context, "_metrics_t0", None)
+    if t0 is None:
+        return
+    elapsed = time.perf_counter() - t0
+    req = getattr(_local, "req", None)
+    if req is not None:
+        req[0] += 1
+        req[1] += elapsed
+    if elapsed >= SLOW_QUERY_SECONDS:
+        registry.observe_slow(statement, elapsed, req[2] if req is not None else "-")
+
+
+def instrument_engine(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _endpoint_label(request) -> str:
+    # a regra (/api/clientes/<int:cid>/cartao), nunca o path: cardinalidade fixa
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+_request_hooks: List[Callable[[str, int, float], None]] = []
+
+
+def on_request(fn: Callable[[str, int, float], None]):
+    """Registra `fn(endpoint, statements, sql_seconds)` no fim de cada requisição (ex.: bench)."""
+    _request_hooks.append(fn)
+    return fn
+
+
+def init_app(app, *engines) -> None:
+    """Liga os hooks do Flask e dos engines e registra GET /api/_metrics."""
+    from flask import Response, request
+
+    if ENABLED:
+        for engine in engines:
+            instrument_engine(engine)
+
+        @app.before_request
+        def _metrics_start():
+            _local.req = [0, 0.0, _endpoint_label(request), time.perf_counter(), None]
+
+        @app.after_request
+        def _metrics_status(response):
+            req = getattr(_local, "req", None)
+            if req is not None:
+                req[4] = response.status_code
+            return response
+
+        @app.teardown_request
+        def _metrics_finish(exc):
+            req = getattr(_local, "req", None)
+            _local.req = None
+            if req is None:
+                return
+            statements, sql_seconds, endpoint, t0, status = req
+            registry.observe_request(
+                endpoint, request.method, status or 500,
+                time.perf_counter() - t0, statements, sql_seconds,
+            )
+            for fn in _request_hooks:
+                fn(endpoint, statements, sql_seconds)
+
+    @app.get("/api/_metrics")
+    def metrics_api():
+        if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            return {"error": "unauthorized"}, 401
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
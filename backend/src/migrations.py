@@ -0,0 +1,353 @@
+"""Migrações versionadas do schema.
+
+`ensure_schema` (src/schema.py) cria as tabelas e colunas que faltam; o que
+precisa de cuidado em bancos grandes — índices, backfills — vem daqui, em
+revisões numeradas registradas na tabela `schema_migrations`. Cada revisão
+roda uma vez por banco, em ordem.
+
+No PostgreSQL os índices são criados com CREATE INDEX CONCURRENTLY (sem
+travar escritas nas tabelas quentes), fora de transação; uma construção
+interrompida deixa um índice INVALID, que é descartado e refeito na próxima
+execução. `upgrade` segura um advisory lock para que dois processos não
+migrem ao mesmo tempo.
+
+    flask --app src.main db upgrade
+    flask --app src.main db status
+    flask --app src.main db check-indexes
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from . import stats
+from .db import engine as default_engine
+
+# chave do pg_advisory_lock das migrações
+_LOCK_KEY = 7_160_016
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: str
+    description: str
+    up: Callable[[Connection], None]
+    # False = roda em autocommit (necessário para CREATE INDEX CONCURRENTLY)
+    transactional: bool = True
+
+
+# ---------- helpers para as revisões ----------
+def create_index(
+    conn: Connection, name: str, table: str, columns: Sequence[str],
+    unique: bool = False, using: Optional[str] = None, where: Optional[str] = None,
+) -> None:
+    """CREATE INDEX idempotente; CONCURRENTLY no PostgreSQL (conn em autocommit)."""
+    cols = ", ".join(columns)
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    if conn.dialect.name == "postgresql":
+        valid = conn.execute(text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid"
+            " WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+        ), {"name": name}).scalar()
+        if valid is False:
+            # sobra de um CONCURRENTLY interrompido
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        method = f" USING {using}" if using else ""
+        stmt = f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table}{method} ({cols})"
+    else:
+        stmt = f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({cols})"
+    if where:
+        stmt += f" WHERE {where}"
+    conn.execute(text(stmt))
+
+
+def drop_index(conn: Connection, name: str) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    else:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _indexes(*specs: Tuple[str, str, Sequence[str]]) -> Callable[[Connection], None]:
+    def up(conn: Connection) -> None:
+        for name, table, columns in specs:
+            create_index(conn, name, table, columns)
+    return up
+
+
+# ---------- backfill de colunas derivadas ----------
+_BACKFILL_CHUNK = 5000
+
+
+def backfill(
+    conn: Connection, table: str, source: Sequence[str], pending: str,
+    derive: Callable[..., Dict[str, object]],
+) -> None:
+    """Preenche colunas derivadas em Python, em lotes por faixa de id (transações curtas).
+
+    `pending` é a condição SQL das linhas ainda sem valor; `derive(*source)`
+    devolve {coluna: valor} — a mesma normalização que o model faz no write.
+    """
+    cols = ", ".join(source)
+    last = 0
+    while True:
+        with conn.engine.begin() as tx:
+            rows = tx.execute(text(
+                f"SELECT id, {cols} FROM {table} WHERE id > :last AND ({pending})"
+                " ORDER BY id LIMIT :n"
+            ), {"last": last, "n": _BACKFILL_CHUNK}).all()
+            if not rows:
+                return
+            params = [{"id": row[0], **derive(*row[1:])} for row in rows]
+            sets = ", ".join(f"{c} = :{c}" for c in params[0] if c != "id")
+            tx.execute(text(f"UPDATE {table} SET {sets} WHERE id = :id"), params)
+        last = rows[-1][0]
+
+
+# ---------- 0003: cpf_key ----------
+_MERGE_FILL = ("phone", "email", "birthday", "birth_month", "birth_day", "store_id")
+
+
+def _backfill_cpf_key(conn: Connection) -> None:
+    from .util import normalize_cpf
+
+    backfill(conn, "clients", ("cpf",), "cpf_key IS NULL",
+             lambda cpf: {"cpf_key": normalize_cpf(cpf) or None})
+
+
+def _merge_client(tx: Connection, keep: int, dup: int) -> None:
+    """Funde `dup` em `keep`: visitas, resgates, saldo e dados de contato que faltam.
+
+    As visitas do ciclo aberto de `dup` entram no ciclo aberto de `keep`; as
+    dos ciclos já resgatados (e os resgates) vão para ciclos negativos, que
+    nunca coincidem com o ciclo vigente e não voltam a contar no saldo.
+    """
+    cols = ", ".join(("cycle", "visits_cycle", "visits_total") + _MERGE_FILL)
+    k = tx.execute(text(f"SELECT {cols} FROM clients WHERE id = :id"), {"id": keep}).mappings().one()
+    d = tx.execute(text(f"SELECT {cols} FROM clients WHERE id = :id"), {"id": dup}).mappings().one()
+    p = {"keep": keep, "dup": dup, "dcycle": d["cycle"], "kcycle": k["cycle"]}
+    tx.execute(text(
+        "UPDATE visits SET client_id = :keep, cycle = CASE WHEN cycle = :dcycle THEN :kcycle"
+        " ELSE cycle - :dcycle - 1 END WHERE client_id = :dup"
+    ), p)
+    tx.execute(text(
+        "UPDATE redemptions SET client_id = :keep, cycle = cycle - :dcycle - 1"
+        " WHERE client_id = :dup"
+    ), p)
+    fill = {c: d[c] for c in _MERGE_FILL if k[c] in (None, "") and d[c] not in (None, "")}
+    sets = "".join(f", {c} = :{c}" for c in fill)
+    now = datetime.utcnow()
+    tx.execute(text(
+        "UPDATE clients SET visits_total = visits_total + :total,"
+        f" visits_cycle = visits_cycle + :vcycle, updated_at = :now{sets} WHERE id = :keep"
+    ), {"keep": keep, "total": d["visits_total"], "vcycle": d["visits_cycle"], "now": now, **fill})
+    tx.execute(text("DELETE FROM clients WHERE id = :dup"), {"dup": dup})
+    # terminais offline apagam o duplicado na próxima sincronização (src/sync.py)
+    tx.execute(text(
+        "INSERT INTO sync_tombstones (entity, entity_id, deleted_at) VALUES ('clients', :dup, :now)"
+    ), {"dup": dup, "now": now})
+
+
+def _dedupe_cpf_key(conn: Connection) -> None:
+    """Clientes com o mesmo CPF em formatações diferentes viram um só (o de menor id)."""
+    groups = conn.execute(text(
+        "SELECT cpf_key FROM clients WHERE cpf_key IS NOT NULL"
+        " GROUP BY cpf_key HAVING COUNT(*) > 1"
+    )).scalars().all()
+    for key in groups:
+        with conn.engine.begin() as tx:
+            lock = " FOR UPDATE" if tx.dialect.name == "postgresql" else ""
+            ids = tx.execute(text(
+                f"SELECT id FROM clients WHERE cpf_key = :key ORDER BY id{lock}"
+            ), {"key": key}).scalars().all()
+            for dup in ids[1:]:
+                _merge_client(tx, ids[0], dup)
+
+
+def _cpf_key(conn: Connection) -> None:
+    _backfill_cpf_key(conn)
+    _dedupe_cpf_key(conn)
+    # linhas gravadas entre o backfill e agora já vêm com cpf_key (validator do model)
+    create_index(conn, "uq_clients_cpf_key", "clients", ("cpf_key",), unique=True)
+    drop_index(conn, "ix_clients_cpf")
+
+
+# ---------- 0004: busca por nome/telefone ----------
+def has_extension(conn: Connection, name: str) -> bool:
+    """Garante a extensão do PostgreSQL; False se não existir/sem permissão para criar."""
+    if conn.dialect.name != "postgresql":
+        return False
+    try:
+        conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {name}"))
+    except Exception:
+        pass
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_extension WHERE extname = :name"
+    ), {"name": name}).scalar())
+
+
+def _search_keys(conn: Connection) -> None:
+    from .util import phone_rev, search_key
+
+    backfill(
+        conn, "clients", ("name", "phone"),
+        "name_key IS NULL OR (phone_rev IS NULL AND phone IS NOT NULL AND phone <> '')",
+        lambda name, phone: {"name_key": search_key(name)[:255] or None, "phone_rev": phone_rev(phone)},
+    )
+    create_index(conn, "ix_clients_name_key", "clients", ("name_key",))
+    create_index(conn, "ix_clients_phone_rev", "clients", ("phone_rev",))
+    if has_extension(conn, "pg_trgm"):
+        create_index(conn, "ix_clients_name_key_trgm", "clients",
+                     ("name_key gin_trgm_ops",), using="gin")
+    elif conn.dialect.name == "postgresql":
+        print("[migrations] pg_trgm indisponível: busca por nome sem índice (varredura)")
+
+
+# ---------- 0005: updated_at (sync incremental) ----------
+def _updated_at(conn: Connection) -> None:
+    # linhas antigas: a última alteração conhecida é a criação
+    for table in ("stores", "clients"):
+        backfill(conn, table, ("created_at",), "updated_at IS NULL",
+                 lambda created_at: {"updated_at": created_at or datetime.utcnow()})
+    create_index(conn, "ix_stores_updated_at_id", "stores", ("updated_at", "id"))
+    create_index(conn, "ix_clients_updated_at_id", "clients", ("updated_at", "id"))
+    create_index(conn, "ix_clients_store_updated", "clients", ("store_id", "updated_at", "id"))
+    create_index(conn, "ix_sync_tombstones_deleted_at_id", "sync_tombstones", ("deleted_at", "id"))
+
+
+# ---------- 0006: rollup diário ----------
+def _daily_stats(conn: Connection) -> None:
+    # bancos anteriores ao rollup: sem isto os KPIs (e clientes_total) ficam
+    # errados até alguém rodar rebuild-daily-stats; a sessão usa a transação da revisão
+    with Session(bind=conn) as db:
+        stats.rebuild(db)
+
+
+# ---------- revisões ----------
+MIGRATIONS: List[Migration] = [
+    Migration(
+        "0001",
+        "índices já declarados nos models (aniversário, keyset, ciclo de visitas, outbox)",
+        _indexes(
+            ("ix_clients_birth_month_day", "clients", ("birth_month", "birth_day")),
+            ("ix_clients_created_at_id", "clients", ("created_at", "id")),
+            ("ix_visits_created_at_id", "visits", ("created_at", "id")),
+            ("ix_redemptions_created_at_id", "redemptions", ("created_at", "id")),
+            # cobre também as buscas por visits.client_id (coluna líder)
+            ("ix_visits_client_cycle", "visits", ("client_id", "cycle")),
+            ("ix_email_outbox_status_next", "email_outbox", ("status", "next_attempt_at")),
+        ),
+        transactional=False,
+    ),
+    Migration(
+        "0002",
+        "índices por loja e período (dashboard, listagens, rollup)",
+        _indexes(
+            ("ix_visits_store_created", "visits", ("store_id", "created_at")),
+            ("ix_redemptions_store_created", "redemptions", ("store_id", "created_at")),
+            ("ix_clients_store_created", "clients", ("store_id", "created_at")),
+        ),
+        transactional=False,
+    ),
+    Migration(
+        "0003",
+        "cpf_key normalizado: backfill, fusão de CPFs duplicados e índice único",
+        _cpf_key,
+        transactional=False,
+    ),
+    Migration(
+        "0004",
+        "busca de clientes: name_key/phone_rev, btrees de nome e telefone, GIN pg_trgm no nome",
+        _search_keys,
+        transactional=False,
+    ),
+    Migration(
+        "0005",
+        "sync incremental: updated_at em lojas/clientes (backfill) e índices de watermark",
+        _updated_at,
+        transactional=False,
+    ),
+    Migration(
+        "0006",
+        "daily_stats: rollup recalculado a partir de visits/redemptions/clients",
+        _daily_stats,
+    ),
+]
+
+
+# ---------- execução ----------
+def _ensure_table(bind: Engine) -> None:
+    with bind.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " version VARCHAR(32) PRIMARY KEY,"
+            " description VARCHAR(255) NOT NULL,"
+            " applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def applied(bind: Optional[Engine] = None) -> Dict[str, datetime]:
+    bind = bind or default_engine
+    _ensure_table(bind)
+    with bind.connect() as conn:
+        rows = conn.execute(text("SELECT version, applied_at FROM schema_migrations")).all()
+    return {v: at for v, at in rows}
+
+
+def pending(bind: Optional[Engine] = None) -> List[Migration]:
+    done = applied(bind)
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def _run(bind: Engine, m: Migration) -> None:
+    record = text(
+        "INSERT INTO schema_migrations (version, description, applied_at)"
+        " VALUES (:v, :d, :at)"
+    )
+    params = {"v": m.version, "d": m.description[:255], "at": datetime.utcnow()}
+    if m.transactional:
+        with bind.begin() as conn:
+            m.up(conn)
+            conn.execute(record, params)
+    else:
+        with bind.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            m.up(conn)
+            conn.execute(record, params)
+
+
+def upgrade(
+    bind: Optional[Engine] = None, target: Optional[str] = None,
+    echo: Callable[[str], None] = lambda _: None,
+) -> List[str]:
+    """Aplica as revisões pendentes (até `target`, inclusive). Devolve as versões aplicadas."""
+    bind = bind or default_engine
+    _ensure_table(bind)
+    lock_conn = None
+    if bind.dialect.name == "postgresql":
+        lock_conn = bind.connect().execution_options(isolation_level="AUTOCOMMIT")
+        lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _LOCK_KEY})
+    try:
+        done: List[str] = []
+        for m in pending(bind):
+            if target is not None and m.version > target:
+                break
+            echo(f"{m.version}: {m.description}")
+            _run(bind, m)
+            done.append(m.version)
+        return done
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+            lock_conn.close()
+
+
+def status(bind: Optional[Engine] = None) -> List[Tuple[str, str, Optional[datetime]]]:
+    """(versão, descrição, aplicada em | None) de todas as revisões conhecidas."""
+    done = applied(bind)
+    return [(m.version, m.description, done.get(m.version)) for m in MIGRATIONS]
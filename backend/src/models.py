@@ -1,25 +1,34 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 from sqlalchemy import (
+    BigInteger,
     String,
     Integer,
     DateTime,
+    Date,
     ForeignKey,
     Boolean,
     Text,
     func,
     UniqueConstraint,
+    SmallInteger,
+    Index,
+    and_,
 )
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 
 from .db import Base
+from .util import birthday_parts, digit_prefix_bounds, normalize_cpf, phone_rev, search_key
 
 
 class Store(Base):
     __tablename__ = "stores"
+    __table_args__ = (
+        Index("ix_stores_updated_at_id", "updated_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
@@ -35,6 +44,10 @@ class Store(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=False), server_default=func.now()
     )
+    # última alteração (sync incremental dos terminais, src/sync.py)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=False), nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
 
 
 class User(Base):
@@ -54,6 +67,9 @@ class User(Base):
 
     store: Mapped[Optional["Store"]] = relationship("Store", back_populates="users")
 
+    # incrementar invalida todos os tokens já emitidos (rebaixamento, troca de senha...)
+    token_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=False), server_default=func.now()
     )
@@ -63,20 +79,47 @@ class Client(Base):
     __tablename__ = "clients"
     __table_args__ = (
         UniqueConstraint("cpf", name="uq_clients_cpf"),
+        # chave canônica: busca exata e por prefixo (faixa) usam este índice
+        Index("uq_clients_cpf_key", "cpf_key", unique=True),
+        Index("ix_clients_birth_month_day", "birth_month", "birth_day"),
+        Index("ix_clients_created_at_id", "created_at", "id"),
+        Index("ix_clients_store_created", "store_id", "created_at"),
+        Index("ix_clients_name_key", "name_key"),
+        Index("ix_clients_phone_rev", "phone_rev"),
+        Index("ix_clients_updated_at_id", "updated_at", "id"),
+        Index("ix_clients_store_updated", "store_id", "updated_at", "id"),
+        # no PostgreSQL há também ix_clients_name_key_trgm (GIN pg_trgm em
+        # name_key), criado pela migração 0004 quando a extensão existe
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
-    cpf: Mapped[str] = mapped_column(String(14), nullable=False, index=True)
+    # derivados de name/phone (preenchidos no write) para a busca do balcão
+    name_key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    phone_rev: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    # como digitado/exibido; buscas usam cpf_key
+    cpf: Mapped[str] = mapped_column(String(14), nullable=False)
+    # só dígitos ('12345678900'), preenchido no write a partir de cpf
+    cpf_key: Mapped[Optional[str]] = mapped_column(String(14), nullable=True)
     phone: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
     email: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
 
     # IMPORTANTE: agora é string 'YYYY-MM-DD' para alinhar ao banco (VARCHAR(10))
     birthday: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
+    # derivados de birthday (preenchidos no write) para consultas por índice
+    birth_month: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+    birth_day: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
 
     store_id: Mapped[Optional[int]] = mapped_column(ForeignKey("stores.id"), nullable=True)
     store: Mapped[Optional["Store"]] = relationship("Store", back_populates="clients")
 
+    # ciclo atual (época): cada resgate fecha o ciclo e incrementa este número
+    cycle: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
+    # saldo materializado (mantido por src/balance.py na mesma transação da visita/resgate)
+    visits_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    visits_cycle: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
     visits: Mapped[List["Visit"]] = relationship("Visit", back_populates="client")
     redemptions: Mapped[List["Redemption"]] = relationship(
         "Redemption", back_populates="client"
@@ -85,15 +128,78 @@ class Client(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=False), server_default=func.now()
     )
+    # última alteração, inclusive do saldo: o default/onupdate vale também para
+    # os update() do Core (src/balance.py); SQL textual grava a coluna à mão
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=False), nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    @validates("birthday")
+    def _sync_birth_parts(self, key, value):
+        self.birth_month, self.birth_day = birthday_parts(value)
+        return value
+
+    @validates("cpf")
+    def _sync_cpf_key(self, key, value):
+        self.cpf_key = normalize_cpf(value) or None
+        return value
+
+    @validates("name")
+    def _sync_name_key(self, key, value):
+        self.name_key = search_key(value)[:255] or None
+        return value
+
+    @validates("phone")
+    def _sync_phone_rev(self, key, value):
+        self.phone_rev = phone_rev(value)
+        return value
+
+    @classmethod
+    def cpf_is(cls, value):
+        """Condição de busca exata por CPF, em qualquer formatação."""
+        return cls.cpf_key == (normalize_cpf(value) or None)
+
+    @classmethod
+    def cpf_startswith(cls, value):
+        """Busca por prefixo de CPF como faixa em cpf_key (usa o índice único).
+
+        Equivale a LIKE 'prefixo%' sem depender de collation/operator class.
+        """
+        digits = normalize_cpf(value)
+        if len(digits) >= 11:
+            return cls.cpf_key == digits
+        return _digit_prefix(cls.cpf_key, digits)
+
+    @classmethod
+    def phone_endswith(cls, value):
+        """Busca pelo final do telefone: prefixo de phone_rev (índice btree)."""
+        return _digit_prefix(cls.phone_rev, phone_rev(value) or "")
+
+
+def _digit_prefix(column, prefix: str):
+    """`column` começa com `prefix` (string de dígitos), como faixa no índice."""
+    if not prefix:
+        return column.is_not(None)
+    low, high = digit_prefix_bounds(prefix)
+    return column >= low if high is None else and_(column >= low, column < high)
 
 
 class Visit(Base):
     __tablename__ = "visits"
+    __table_args__ = (
+        Index("ix_visits_created_at_id", "created_at", "id"),
+        Index("ix_visits_client_cycle", "client_id", "cycle"),
+        Index("ix_visits_store_created", "store_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False)
     store_id: Mapped[Optional[int]] = mapped_column(ForeignKey("stores.id"), nullable=True)
 
+    # ciclo do cliente em que a visita entrou (Client.cycle no momento do registro);
+    # visitas nunca são apagadas — o resgate só fecha o ciclo
+    cycle: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
     client: Mapped["Client"] = relationship("Client", back_populates="visits")
     store: Mapped[Optional["Store"]] = relationship("Store", back_populates="visits")
 
@@ -104,6 +210,10 @@ class Visit(Base):
 
 class Redemption(Base):
     __tablename__ = "redemptions"
+    __table_args__ = (
+        Index("ix_redemptions_created_at_id", "created_at", "id"),
+        Index("ix_redemptions_store_created", "store_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False)
@@ -111,6 +221,9 @@ class Redemption(Base):
 
     gift_name: Mapped[str] = mapped_column(String(255), nullable=False, default="Brinde")
 
+    # ciclo de visitas consumido por este resgate (NULL em resgates anteriores ao ledger)
+    cycle: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
     notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
     client: Mapped["Client"] = relationship("Client", back_populates="redemptions")
@@ -119,3 +232,70 @@ class Redemption(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=False), server_default=func.now()
     )
+
+
+class EmailOutbox(Base):
+    """Fila durável de e-mails; enviada em lote por src/emailer.OutboxSender."""
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    to_addr: Mapped[str] = mapped_column(String(255), nullable=False)
+    subject: Mapped[str] = mapped_column(String(255), nullable=False)
+    body: Mapped[str] = mapped_column(Text, nullable=False)
+    subtype: Mapped[str] = mapped_column(String(10), nullable=False, default="plain")
+
+    # pending -> sent | failed
+    status: Mapped[str] = mapped_column(String(10), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), nullable=False, server_default=func.now()
+    )
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), server_default=func.now()
+    )
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=False), nullable=True)
+
+
+class DailyStat(Base):
+    """Agregado diário por loja, mantido incrementalmente por src/stats.py."""
+    __tablename__ = "daily_stats"
+
+    # 0 = sem loja (chave primária não aceita NULL)
+    store_id: Mapped[int] = mapped_column(Integer, primary_key=True, default=0)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+
+    visits: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    redemptions: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    clients_new: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
+
+class TableVersion(Base):
+    """Versão por tabela, incrementada a cada commit que a altera (src/httpcache.py)."""
+    __tablename__ = "table_versions"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=False), nullable=True)
+
+
+class SyncTombstone(Base):
+    """Registro de exclusão para o sync incremental (src/sync.py); expurgado após SYNC_TOMBSTONE_DAYS."""
+    __tablename__ = "sync_tombstones"
+    __table_args__ = (
+        Index("ix_sync_tombstones_deleted_at_id", "deleted_at", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # "clients" | "stores"
+    entity: Mapped[str] = mapped_column(String(32), nullable=False)
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    # cliente que mudou de loja: a loja de onde saiu (só os terminais dela removem); NULL = exclusão
+    store_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    deleted_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=False), nullable=False, default=datetime.utcnow
+    )
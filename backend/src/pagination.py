@@ -0,0 +1,135 @@
+"""Paginação por cursor (keyset) e totais estimados para as listagens.
+
+O cursor é opaco para o cliente: base64url de [created_at, id] da última
+linha da página. A próxima página filtra `(created_at, id) < cursor` usando o
+índice composto correspondente, então a página N custa o mesmo que a página 1.
+
+O total exato (COUNT) é opcional (?total=exact). Por padrão usamos uma
+contagem em cache por alguns segundos (ou a estimativa do planner do
+PostgreSQL quando não há filtro); ?total=none pula a contagem.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, literal, select, text, tuple_
+from sqlalchemy.orm import Session
+
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "60"))
+MAX_PER_PAGE = 100
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str) -> Tuple[datetime, int]:
+    """Decodifica um cursor; ValueError se estiver corrompido."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception as e:
+        raise ValueError("cursor inválido") from e
+
+
+def per_page_arg(args, default: int = 10) -> int:
+    return max(1, min(MAX_PER_PAGE, args.get("per_page", default, type=int) or default))
+
+
+def ts_bound(db: Session, ts: datetime) -> Any:
+    """Timestamp de cursor como valor de comparação no dialeto da sessão."""
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite guarda datetime como texto e CURRENT_TIMESTAMP não tem
+        # microssegundos; comparar com o texto exato preserva a ordem.
+        return literal(ts.isoformat(sep=" "))
+    return ts
+
+
+def keyset(db: Session, q, created_col, id_col, cursor: Optional[str]):
+    """Aplica ORDER BY created_at DESC, id DESC e o filtro do cursor (se houver)."""
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        q = q.where(tuple_(created_col, id_col) < tuple_(ts_bound(db, ts), row_id))
+    return q.order_by(created_col.desc(), id_col.desc())
+
+
+def fetch_page(db: Session, q, per_page: int, created_attr: str = "created_at"):
+    """Executa `q` (já ordenado) trazendo per_page+1 linhas para saber se há próxima.
+
+    `q` pode selecionar uma entidade (itens ORM) ou colunas (itens Row, que
+    precisam incluir id e `created_attr`). Devolve (itens, next_cursor).
+    """
+    result = db.execute(q.limit(per_page + 1))
+    rows = result.scalars().all() if len(q.column_descriptions) == 1 else result.all()
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_attr), last.id)
+
+
+class _CountCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[float, int]] = {}
+
+    def get(self, key: str) -> Optional[int]:
+        hit = self._data.get(key)
+        if hit and time.monotonic() - hit[0] < COUNT_CACHE_TTL:
+            return hit[1]
+        return None
+
+    def put(self, key: str, value: int) -> None:
+        with self._lock:
+            if len(self._data) > 1000:
+                self._data.clear()
+            self._data[key] = (time.monotonic(), value)
+
+
+count_cache = _CountCache()
+
+
+def _planner_estimate(db: Session, table: str) -> Optional[int]:
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    n = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"),
+        {"t": table},
+    ).scalar()
+    # reltuples = -1 enquanto a tabela nunca foi analisada
+    return int(n) if n is not None and n >= 0 else None
+
+
+def total_for(db: Session, q, mode: str, cache_key: str, table: Optional[str] = None) -> Dict[str, Any]:
+    """Campos de total para a resposta, conforme ?total=exact|estimate|none.
+
+    `q` é a consulta filtrada sem ORDER BY/LIMIT; `table` só deve ser passado
+    quando não há filtro (permite usar a estimativa do planner).
+    """
+    if mode == "none":
+        return {}
+
+    def exact() -> int:
+        n = int(db.execute(select(func.count()).select_from(q.order_by(None).subquery())).scalar_one())
+        count_cache.put(cache_key, n)
+        return n
+
+    if mode == "exact":
+        return {"total": exact(), "total_exact": True}
+
+    cached = count_cache.get(cache_key)
+    if cached is not None:
+        return {"total": cached, "total_exact": False}
+    if table:
+        est = _planner_estimate(db, table)
+        if est is not None:
+            return {"total": est, "total_exact": False}
+    return {"total": exact(), "total_exact": False}
@@ -0,0 +1,106 @@
+"""Hash/verificação de senhas (bcrypt) num pool limitado de workers.
+
+`bcrypt.checkpw` custa ~250 ms no custo 12; rodando direto no handler ele
+prende uma thread do gunicorn por login. Aqui o trabalho vai para um pool
+dedicado (threads por padrão — o bcrypt solta o GIL — ou processos com
+PASSWORD_POOL=process), com limite de tarefas em andamento: quando o pool
+está cheio a chamada falha na hora com `PoolSaturated` (a rota responde 503
+com Retry-After) em vez de enfileirar logins indefinidamente. Uma tarefa
+aceita que não termina em PASSWORD_TIMEOUT levanta `TimeoutError` (o
+`concurrent.futures`/`asyncio` do Python 3.11+), tratado igual na rota.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from . import util
+
+POOL_KIND = os.getenv("PASSWORD_POOL", "thread").strip().lower()
+POOL_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 2)))
+# tarefas em andamento + na fila; acima disso rejeita
+POOL_QUEUE = int(os.getenv("PASSWORD_QUEUE", str(POOL_WORKERS * 4)))
+POOL_TIMEOUT = float(os.getenv("PASSWORD_TIMEOUT", "10"))
+RETRY_AFTER = int(os.getenv("PASSWORD_RETRY_AFTER", "2"))
+
+
+class PoolSaturated(RuntimeError):
+    """Pool de senhas cheio; tente de novo em alguns segundos."""
+
+
+_executor: Optional[Executor] = None
+_executor_pid: Optional[int] = None
+_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(POOL_QUEUE)
+
+
+def _get_executor() -> Executor:
+    """Cria o pool sob demanda, uma vez por processo (seguro com fork do gunicorn)."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _lock:
+            if _executor is None or _executor_pid != os.getpid():
+                if POOL_KIND == "process":
+                    _executor = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+                else:
+                    _executor = ThreadPoolExecutor(
+                        max_workers=POOL_WORKERS, thread_name_prefix="bcrypt"
+                    )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _enqueue(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PoolSaturated("pool de senhas saturado")
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def _submit(fn, *args):
+    return _enqueue(fn, *args).result(timeout=POOL_TIMEOUT)
+
+
+async def _submit_async(fn, *args):
+    # mesmo pool e mesmo limite; o event loop (src/asgi.py) não fica bloqueado
+    return await asyncio.wait_for(asyncio.wrap_future(_enqueue(fn, *args)), POOL_TIMEOUT)
+
+
+def verify(password: str, hashed: str) -> bool:
+    """`util.verify_password` executado no pool."""
+    return _submit(util.verify_password, password, hashed)
+
+
+def hash(password: str) -> str:
+    """`util.hash_password` executado no pool."""
+    return _submit(util.hash_password, password)
+
+
+async def verify_async(password: str, hashed: str) -> bool:
+    """`verify` para rotas async: aguarda o pool sem prender o event loop."""
+    return await _submit_async(util.verify_password, password, hashed)
+
+
+async def hash_async(password: str) -> str:
+    return await _submit_async(util.hash_password, password)
+
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """Custo de um hash bcrypt ('$2b$12$...' -> 12)."""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True se o hash foi gerado com um custo diferente do configurado."""
+    return hash_rounds(hashed) != util.BCRYPT_ROUNDS
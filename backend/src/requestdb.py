@@ -0,0 +1,125 @@
+"""Uma sessão de banco por requisição (Flask), aberta sob demanda.
+
+`get()` devolve a sessão de escrita (primário) e `read()` a de leitura
+(src/db.py: réplica/pool de leitura, ou o primário logo após uma escrita).
+As duas ficam no contexto da aplicação (`g`) e só pegam conexão do pool no
+primeiro uso; se a requisição já abriu a de escrita, `read()` devolve a
+mesma — lê o que acabou de escrever, sem um segundo checkout.
+
+Um único desfecho por requisição: `after_request` faz o commit se a resposta
+for < 400 (falha no commit vira 500) e rollback caso contrário;
+`teardown_appcontext` desfaz o que sobrou (exceção na view) e fecha tudo.
+As rotas não chamam commit/close:
+
+  - `savepoint()` isola um trecho (ex.: item de um lote) num SAVEPOINT;
+  - `after_commit(fn)` roda `fn` só depois do commit (caches em memória).
+
+Statements por requisição vêm dos eventos do engine em src/metrics.py.
+
+Exportações em streaming seguem com sessão própria (src/exports.py): o corpo
+é gerado depois do fim da requisição. CLI e threads de fundo usam
+`SessionLocal` diretamente.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from flask import g, jsonify, request
+from sqlalchemy.orm import Session
+
+from .auth import current_user
+from .db import READ_MARKER_HEADER, SessionLocal, read_router
+
+
+class RequestDB:
+    """Sessões da requisição corrente."""
+
+    def __init__(self):
+        self.write: Optional[Session] = None
+        self.read: Optional[Session] = None
+        self.committed = False
+        self._after_commit: List[Callable[[], None]] = []
+
+    def finish(self, commit: bool) -> None:
+        """Commit (ou rollback) da sessão de escrita; idempotente."""
+        if self.write is None or self.committed:
+            return
+        self.committed = True
+        if not commit:
+            self.write.rollback()
+            return
+        self.write.commit()
+        for fn in self._after_commit:
+            fn()
+
+    def close(self) -> None:
+        for db in {id(s): s for s in (self.write, self.read) if s is not None}.values():
+            db.close()
+
+
+def _state() -> RequestDB:
+    state = g.get("_request_db")
+    if state is None:
+        state = g._request_db = RequestDB()
+    return state
+
+
+def get() -> Session:
+    """Sessão de escrita da requisição (primário)."""
+    state = _state()
+    if state.write is None:
+        state.write = SessionLocal()
+    return state.write
+
+
+def read() -> Session:
+    """Sessão de leitura da requisição; a de escrita se ela já foi aberta."""
+    state = _state()
+    if state.write is not None:
+        return state.write
+    if state.read is None:
+        user = current_user()
+        factory = read_router.factory(user.id if user else None, request.headers.get(READ_MARKER_HEADER))
+        state.read = factory()
+    return state.read
+
+
+@contextmanager
+def savepoint(db: Optional[Session] = None) -> Iterator[Session]:
+    """SAVEPOINT: se o bloco falhar, desfaz só ele e a transação da requisição segue."""
+    db = db or get()
+    with db.begin_nested():
+        yield db
+
+
+def after_commit(fn: Callable[[], None]) -> None:
+    """Agenda `fn` para depois do commit da requisição (descartada no rollback)."""
+    _state()._after_commit.append(fn)
+
+
+def init_app(app) -> None:
+    @app.after_request
+    def _request_db_commit(response):
+        state = g.get("_request_db")
+        if state is None:
+            return response
+        try:
+            state.finish(commit=response.status_code < 400)
+        except Exception:
+            state.write.rollback()
+            resp = jsonify({"error": "Falha ao gravar"})
+            resp.status_code = 500
+            return resp
+        return response
+
+    @app.teardown_appcontext
+    def _request_db_close(exc):
+        state = g.pop("_request_db", None)
+        if state is None:
+            return
+        try:
+            if state.write is not None and not state.committed:
+                state.write.rollback()
+        finally:
+            state.close()
@@ -1,8 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt
 from sqlalchemy import select
-from ..db import SessionLocal
 from ..models import Store
+from .. import requestdb, stores
 
 admin_bp = Blueprint("admin_bp", __name__)
 
@@ -20,26 +20,22 @@ def criar_loja():
     meta = int(data.get("meta_visitas") or 10)
     if not name:
         return jsonify({"error": "name obrigatório"}), 422
-    db = SessionLocal()
-    try:
-        exists = db.execute(select(Store).where(Store.name == name)).scalar_one_or_none()
-        if exists:
-            return jsonify({"error": "loja já existe"}), 400
-        s = Store(name=name, meta_visitas=meta)
-        db.add(s)
-        db.commit()
-        return jsonify({"id": s.id, "name": s.name, "meta_visitas": s.meta_visitas}), 201
-    finally:
-        db.close()
+    db = requestdb.get()
+    exists = db.execute(select(Store).where(Store.name == name)).scalar_one_or_none()
+    if exists:
+        return jsonify({"error": "loja já existe"}), 400
+    s = Store(name=name, meta_visitas=meta)
+    db.add(s)
+    db.flush()
+    info = stores.StoreInfo.of(s)
+    stores.notify_changed(db)
+    # write-through: este worker enxerga a loja assim que o commit sai; os outros via NOTIFY/TTL
+    requestdb.after_commit(lambda: stores.registry.put(info))
+    return jsonify(info.to_dict()), 201
 
 @admin_bp.get("/lojas")
 @jwt_required()
 def listar_lojas():
     if not _is_admin():
         return jsonify({"error": "forbidden"}), 403
-    db = SessionLocal()
-    try:
-        items = db.execute(select(Store).order_by(Store.id.asc())).scalars().all()
-        return jsonify([{"id": x.id, "name": x.name, "meta_visitas": x.meta_visitas} for x in items])
-    finally:
-        db.close()
+    return jsonify([s.to_dict() for s in stores.registry.all()])
@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from sqlalchemy import select, func, desc, delete
-from ..db import SessionLocal
-from ..models import Client, Redemption, Visit, Store
+from sqlalchemy import insert, select
+from ..models import Client, Redemption, Store
+from ..util import normalize_cpf
+from .. import balance, handlers, pagination, requestdb, serializers, stats, stores
 
 resgate_bp = Blueprint("resgate_bp", __name__)
 
@@ -13,34 +14,44 @@ def criar_resgate():
     cpf = (data.get("cpf") or "").strip()
     client_id = data.get("client_id")
     gift_name = (data.get("gift_name") or "Brinde").strip()
-    db = SessionLocal()
-    try:
-        c = None
-        if cpf:
-            c = db.execute(select(Client).where(Client.cpf == cpf)).scalar_one_or_none()
-        elif client_id:
-            c = db.get(Client, int(client_id))
-        if not c:
-            return jsonify({"error": "Cliente não encontrado"}), 404
-        r = Redemption(client_id=c.id, store_id=c.store_id, gift_name=gift_name)
-        db.add(r)
-        db.commit()
-        db.execute(delete(Visit).where(Visit.client_id == c.id))
-        db.commit()
-        return jsonify({"redemption_id": r.id, "gift_name": r.gift_name, "when": r.created_at.isoformat()}), 201
-    finally:
-        db.close()
+    db = requestdb.get()
+    c = None
+    if normalize_cpf(cpf):
+        c = balance.lock_client(db, Client.cpf_is(cpf))
+    elif client_id:
+        c = balance.lock_client(db, Client.id == int(client_id))
+    if not c:
+        return jsonify({"error": "Cliente não encontrado"}), 404
+    # meta conferida com a linha travada: dois resgates simultâneos não passam juntos
+    meta = stores.registry.meta_for(c.store_id, handlers.DEFAULT_META)
+    if c.visits_cycle < meta:
+        return jsonify({
+            "error": "Cliente ainda não atingiu a meta",
+            "visits_count": int(c.visits_cycle), "meta": int(meta),
+        }), 400
+    # consome o ciclo na transação da requisição; as visitas ficam no histórico
+    ciclo = balance.close_cycle(db, c.id)
+    r_id, r_when = db.execute(
+        insert(Redemption)
+        .values(client_id=c.id, store_id=c.store_id, gift_name=gift_name, cycle=ciclo)
+        .returning(Redemption.id, Redemption.created_at)
+    ).one()
+    stats.bump(db, c.store_id, redemptions=1)
+    return jsonify({"redemption_id": r_id, "gift_name": gift_name, "when": r_when.isoformat()}), 201
 
 @resgate_bp.get("/resgates")
 @jwt_required()
 def listar_resgates():
-    page = int(request.args.get("page", 1))
-    per_page = int(request.args.get("per_page", 10))
-    db = SessionLocal()
+    cursor = request.args.get("cursor")
+    page = max(1, request.args.get("page", 1, type=int) or 1)
+    per_page = pagination.per_page_arg(request.args)
+    db = requestdb.read()
     try:
-        q = select(Redemption).order_by(desc(Redemption.created_at))
-        total = db.execute(select(func.count()).select_from(q.subquery())).scalar_one()
-        items = db.execute(q.offset((page-1)*per_page).limit(per_page)).scalars().all()
-        return jsonify({"total": int(total), "items": [{"id": r.id, "gift_name": r.gift_name, "created_at": r.created_at.isoformat()} for r in items]})
-    finally:
-        db.close()
+        totals = pagination.total_for(db, select(Redemption.id), request.args.get("total", "estimate"), cache_key="redemptions:", table="redemptions")
+        q = pagination.keyset(db, select(*serializers.REDEMPTION.columns), Redemption.created_at, Redemption.id, cursor)
+        if not cursor and page > 1:
+            q = q.offset((page-1)*per_page)
+        items, next_cursor = pagination.fetch_page(db, q, per_page)
+        return jsonify({**totals, "next_cursor": next_cursor, "items": serializers.REDEMPTION.dump(items)})
+    except ValueError:
+        return jsonify({"error": "cursor inválido"}), 400
@@ -0,0 +1,72 @@
+"""Criação/atualização do schema.
+
+`create_all` só cria tabelas que não existem; colunas novas adicionadas aos
+models não chegam em bancos já criados. `ensure_schema` cobre esse caso
+adicionando as colunas (ALTER TABLE ... ADD COLUMN) e depois aplica as
+migrações versionadas pendentes (src/migrations.py), que é onde ficam os
+índices — criados sem travar as tabelas em bancos grandes.
+"""
+from __future__ import annotations
+
+from typing import Callable
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from .db import Base, engine as default_engine
+from . import migrations
+from . import models  # noqa: F401  (registra as tabelas em Base.metadata)
+
+
+def _column_ddl(bind: Engine, column) -> str:
+    ddl = f"{column.name} {column.type.compile(dialect=bind.dialect)}"
+    default = column.server_default
+    if default is not None:
+        ddl += f" DEFAULT {default.arg}"
+    if not column.nullable and default is not None:
+        ddl += " NOT NULL"
+    return ddl
+
+
+def ensure_schema(
+    bind: Engine | None = None,
+    target: str | None = None,
+    echo: Callable[[str], None] = lambda _: None,
+) -> list[str]:
+    """Cria tabelas, adiciona colunas faltantes e aplica as migrações. Devolve o que foi feito."""
+    bind = bind or default_engine
+    Base.metadata.create_all(bind=bind)
+
+    executed: list[str] = []
+    insp = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                stmt = f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(bind, column)}"
+                conn.execute(text(stmt))
+                executed.append(stmt)
+
+    executed += [f"migration {v}" for v in migrations.upgrade(bind, target=target, echo=echo)]
+    return executed
+
+
+def missing(bind: Engine | None = None) -> list[str]:
+    """O que `ensure_schema` ainda faria (tabelas, colunas, migrações), sem alterar nada."""
+    bind = bind or default_engine
+    insp = inspect(bind)
+    tables = set(insp.get_table_names())
+    out: list[str] = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            out.append(f"tabela {table.name}")
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        out += [f"coluna {table.name}.{c.name}" for c in table.columns if c.name not in existing]
+    if "schema_migrations" in tables:
+        out += [f"migração {m.version}" for m in migrations.pending(bind)]
+    else:
+        out += [f"migração {m.version}" for m in migrations.MIGRATIONS]
+    return out
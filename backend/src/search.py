@@ -0,0 +1,127 @@
+"""Busca de clientes no balcão: por nome, final do telefone ou início do CPF.
+
+Nome, em duas etapas (tudo sobre `name_key`: minúsculo, sem acento):
+
+  1. quem começa pelo termo — faixa no btree ix_clients_name_key, já na
+     ordem do índice; para após `limit` linhas em qualquer banco;
+  2. se faltar resultado, quem contém todas as palavras em qualquer posição.
+     No PostgreSQL com pg_trgm o filtro usa o GIN de trigramas
+     (ix_clients_name_key_trgm); sem ele (SQLite em dev, PG sem a extensão)
+     é um LIKE com varredura. Em ambos só os primeiros CANDIDATES achados
+     são ordenados (por similaridade, no PG): sobrenomes comuns casam com
+     dezenas de milhares de linhas e ordenar todas estouraria a latência.
+
+Dígitos: início do CPF (cpf_key) e final do telefone (phone_rev, o número
+invertido) — ambos faixas em índices btree, em qualquer banco.
+
+Devolve linhas com as colunas de `serializers.CLIENT_SEARCH`.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy import Row, func, select, text
+from sqlalchemy.orm import Session
+
+from .models import Client
+from .serializers import CLIENT_SEARCH
+from .util import normalize_cpf, prefix_bounds, search_key
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
+MIN_NAME_CHARS = 2
+MIN_PHONE_DIGITS = 4
+MIN_CPF_DIGITS = 3
+# teto de linhas ranqueadas na etapa 2 da busca por nome
+CANDIDATES = 200
+TRGM_INDEX = "ix_clients_name_key_trgm"
+# intervalo para reconferir se o índice de trigramas já existe
+_TRGM_RECHECK = 60.0
+
+
+class _TrgmProbe:
+    """Cache por worker de "o índice pg_trgm existe e é válido?"."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ready = False
+        self._checked_at = 0.0
+
+    def ready(self, db: Session) -> bool:
+        if self._ready:
+            return True
+        if db.get_bind().dialect.name != "postgresql":
+            return False
+        if time.monotonic() - self._checked_at < _TRGM_RECHECK:
+            return False
+        with self._lock:
+            if time.monotonic() - self._checked_at >= _TRGM_RECHECK:
+                self._ready = bool(db.execute(text(
+                    "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid"
+                    " WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+                ), {"name": TRGM_INDEX}).scalar())
+                self._checked_at = time.monotonic()
+        return self._ready
+
+    def invalidate(self) -> None:
+        self._ready = False
+        self._checked_at = 0.0
+
+
+trgm = _TrgmProbe()
+
+
+def _scoped(q, store_id: Optional[int]):
+    return q.where(Client.store_id == store_id) if store_id else q
+
+
+def by_name(db: Session, term: str, store_id: Optional[int] = None,
+            limit: int = SEARCH_LIMIT) -> List[Row]:
+    key = search_key(term)
+    if len(key.replace(" ", "")) < MIN_NAME_CHARS:
+        return []
+    # search_key só deixa [0-9a-z ]: nada a escapar no LIKE
+    low, high = prefix_bounds(key)
+    starts = Client.name_key.like(f"{key}%")
+    q = _scoped(select(*CLIENT_SEARCH.columns).where(
+        Client.name_key >= low, Client.name_key < high, starts), store_id)
+    found = db.execute(q.order_by(Client.name_key, Client.id).limit(limit)).all()
+    if len(found) >= limit:
+        return found
+
+    words = [Client.name_key.like(f"%{w}%") for w in key.split()]
+    inner = _scoped(select(Client.id).where(*words, ~starts), store_id).limit(CANDIDATES).subquery()
+    q = select(*CLIENT_SEARCH.columns).join(inner, inner.c.id == Client.id)
+    if trgm.ready(db):
+        q = q.order_by(func.similarity(Client.name_key, key).desc(), Client.id)
+    else:
+        q = q.order_by(Client.name_key, Client.id)
+    return found + db.execute(q.limit(limit - len(found))).all()
+
+
+def by_digits(db: Session, term: str, store_id: Optional[int] = None,
+              limit: int = SEARCH_LIMIT) -> List[Row]:
+    """CPF que começa com os dígitos, depois telefones que terminam com eles."""
+    digits = normalize_cpf(term)
+    found: List[Row] = []
+    if len(digits) >= MIN_CPF_DIGITS and len(digits) <= 11:
+        q = _scoped(select(*CLIENT_SEARCH.columns).where(Client.cpf_startswith(digits)), store_id)
+        found += db.execute(q.order_by(Client.cpf_key).limit(limit)).all()
+    if len(digits) >= MIN_PHONE_DIGITS and len(found) < limit:
+        seen = {c.id for c in found}
+        q = _scoped(select(*CLIENT_SEARCH.columns).where(Client.phone_endswith(digits)), store_id)
+        q = q.order_by(Client.phone_rev, Client.id).limit(limit)
+        found += [c for c in db.execute(q) if c.id not in seen]
+    return found[:limit]
+
+
+def search_clients(db: Session, term: str, store_id: Optional[int] = None,
+                   limit: int = SEARCH_LIMIT) -> List[Row]:
+    """Busca por nome ou, se o termo não tiver letras, por CPF/telefone."""
+    term = (term or "").strip()
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    if term and not any(ch.isalpha() for ch in term):
+        return by_digits(db, term, store_id, limit)
+    return by_name(db, term, store_id, limit)
@@ -0,0 +1,116 @@
+"""Projeções de colunas e JSON das listagens.
+
+Cada `Projection` diz quais colunas uma listagem devolve e com que nome. A
+rota seleciona só essas colunas (`select(*P.columns)`, linhas Row, sem
+entidades ORM nem identity map) e `P.dump(rows)` vira a lista de dicts da
+resposta. Datas/datetimes saem como estão: o provider JSON do app os grava
+em ISO 8601.
+
+O provider usa orjson quando instalado (bem mais rápido que o json da
+stdlib em páginas de 100 linhas); sem ele, cai no provider padrão do Flask
+com datas em ISO, para a resposta ser a mesma nos dois casos.
+"""
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Tuple
+
+from flask.json.provider import DefaultJSONProvider
+
+from .models import Client, Redemption, User, Visit
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+class Projection:
+    """Colunas de uma listagem; `extra` são selecionadas mas não vão para o JSON."""
+
+    __slots__ = ("names", "columns")
+
+    def __init__(self, *fields: Tuple[str, Any], extra: Tuple[Any, ...] = ()):
+        self.names: Tuple[str, ...] = tuple(name for name, _ in fields)
+        self.columns: Tuple[Any, ...] = tuple(col.label(name) for name, col in fields) + extra
+
+    def dump(self, rows: Iterable[Any]) -> List[Dict[str, Any]]:
+        names = self.names
+        # zip para no menor: as colunas `extra` (no fim) ficam de fora
+        return [dict(zip(names, row)) for row in rows]
+
+    def dump_one(self, row: Any) -> Dict[str, Any]:
+        return dict(zip(self.names, row))
+
+
+# ---------- projeções ----------
+CLIENT = Projection(
+    ("id", Client.id), ("name", Client.name), ("cpf", Client.cpf), ("phone", Client.phone),
+    ("email", Client.email), ("birthday", Client.birthday), ("store_id", Client.store_id),
+    extra=(Client.created_at,),  # cursor do keyset
+)
+CLIENT_SEARCH = Projection(
+    ("id", Client.id), ("name", Client.name), ("cpf", Client.cpf), ("phone", Client.phone),
+    ("email", Client.email), ("birthday", Client.birthday), ("store_id", Client.store_id),
+    ("visits_cycle", Client.visits_cycle),
+)
+CLIENT_DETAIL = Projection(
+    ("id", Client.id), ("name", Client.name), ("cpf", Client.cpf), ("phone", Client.phone),
+    ("email", Client.email), ("birthday", Client.birthday), ("store_id", Client.store_id),
+    ("created_at", Client.created_at),
+)
+BIRTHDAY = Projection(
+    ("id", Client.id), ("name", Client.name), ("cpf", Client.cpf), ("birthday", Client.birthday),
+    extra=(Client.birth_month, Client.birth_day),  # ordenação por ?dias=
+)
+USER = Projection(
+    ("id", User.id), ("name", User.name), ("email", User.email), ("role", User.role),
+    ("lock_loja", User.lock_loja), ("store_id", User.store_id),
+)
+VISIT = Projection(
+    ("id", Visit.id), ("client_id", Visit.client_id), ("store_id", Visit.store_id),
+    ("created_at", Visit.created_at),
+)
+REDEMPTION = Projection(
+    ("id", Redemption.id), ("gift_name", Redemption.gift_name), ("created_at", Redemption.created_at),
+)
+
+
+# ---------- provider JSON ----------
+def _default(o: Any) -> Any:
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return str(o)
+    return DefaultJSONProvider.default(o)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Provider padrão do Flask com datas em ISO 8601 (em vez de data HTTP)."""
+
+    default = staticmethod(_default)
+
+
+class OrjsonProvider(JSONProvider):
+    _options = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            # indent/sort_keys etc.: só o json da stdlib entende
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self._options | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app) -> None:
+    """Registra o provider JSON (orjson se disponível)."""
+    app.json_provider_class = OrjsonProvider if orjson else JSONProvider
+    app.json = app.json_provider_class(app)
@@ -0,0 +1,133 @@
+"""Rollup diário (store_id, day) que alimenta /api/dashboard/kpis.
+
+Cada caminho de escrita (visita, resgate, novo cliente) chama `bump` na mesma
+transação, e o dashboard soma no máximo uma linha por loja por dia em vez de
+contar as tabelas brutas.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from .models import Client, DailyStat, Redemption, Visit
+
+COUNTERS = ("visits", "redemptions", "clients_new")
+
+
+def today() -> date:
+    return datetime.utcnow().date()
+
+
+def _insert_for(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def bump(db: Session, store_id: Optional[int], day: Optional[date] = None, **deltas: int) -> None:
+    """Soma `deltas` (visits=, redemptions=, clients_new=) na linha (store_id, day)."""
+    deltas = {k: int(v) for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    unknown = set(deltas) - set(COUNTERS)
+    if unknown:
+        raise ValueError(f"contador desconhecido: {', '.join(sorted(unknown))}")
+    key = {"store_id": store_id or 0, "day": day or today()}
+
+    insert = _insert_for(db)
+    if insert is not None:
+        stmt = insert(DailyStat).values(**key, **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyStat.store_id, DailyStat.day],
+            set_={k: getattr(DailyStat, k) + stmt.excluded[k] for k in deltas},
+        )
+        # a loja deixa o ETag do dashboard (src/httpcache.py) usar a linha dela em table_versions
+        db.execute(stmt, execution_options={"versions_store_id": key["store_id"]})
+        return
+
+    # fallback genérico: UPDATE e, se não havia linha, INSERT
+    res = db.execute(
+        update(DailyStat)
+        .where(DailyStat.store_id == key["store_id"], DailyStat.day == key["day"])
+        .values({k: getattr(DailyStat, k) + v for k, v in deltas.items()}),
+        execution_options={"versions_store_id": key["store_id"]},
+    )
+    if res.rowcount == 0:
+        db.add(DailyStat(**key, **deltas))
+        db.flush()
+
+
+def totals(
+    db: Session,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    store_id: Optional[int] = None,
+    by_store: bool = False,
+):
+    """Soma os contadores no intervalo [start, end] (datas inclusivas).
+
+    Devolve um dict {contador: total} ou, com `by_store`, {store_id: {contador: total}}.
+    """
+    cols = [func.coalesce(func.sum(getattr(DailyStat, k)), 0).label(k) for k in COUNTERS]
+    q = select(*cols)
+    if by_store:
+        q = select(DailyStat.store_id, *cols).group_by(DailyStat.store_id).order_by(DailyStat.store_id)
+    if start:
+        q = q.where(DailyStat.day >= start)
+    if end:
+        q = q.where(DailyStat.day <= end)
+    if store_id:
+        q = q.where(DailyStat.store_id == store_id)
+
+    if by_store:
+        return {
+            row.store_id: {k: int(getattr(row, k)) for k in COUNTERS}
+            for row in db.execute(q)
+        }
+    row = db.execute(q).one()
+    return {k: int(getattr(row, k)) for k in COUNTERS}
+
+
+def rebuild(db: Session) -> int:
+    """Recria o rollup inteiro a partir das tabelas brutas. Devolve o nº de linhas.
+
+    Atenção: em bases anteriores ao ledger de ciclos (src/balance.py), as visitas
+    apagadas pelos resgates antigos não entram na reconstrução.
+    """
+    acc: Dict[Tuple[int, date], Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    sources = (
+        ("visits", Visit),
+        ("redemptions", Redemption),
+        ("clients_new", Client),
+    )
+    for counter, model in sources:
+        day_expr = func.date(model.created_at)
+        q = (
+            select(model.store_id, day_expr.label("day"), func.count(model.id))
+            .group_by(model.store_id, day_expr)
+        )
+        for store_id, day, n in db.execute(q):
+            if day is None:
+                continue
+            if isinstance(day, str):
+                day = date.fromisoformat(day)
+            elif isinstance(day, datetime):
+                day = day.date()
+            acc[(store_id or 0, day)][counter] += int(n)
+
+    db.execute(delete(DailyStat))
+    db.add_all(
+        DailyStat(store_id=store_id, day=day, **counters)
+        for (store_id, day), counters in acc.items()
+    )
+    db.commit()
+    return len(acc)
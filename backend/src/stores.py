@@ -0,0 +1,167 @@
+"""Cadastro de lojas em memória (poucas linhas, lidas em toda rota).
+
+Cada worker mantém um mapa {id: StoreInfo}, carregado no primeiro uso (ou
+no lifespan do modo ASGI, fora do event loop), e resolve
+meta_visitas, nomes e a loja padrão sem ir ao banco. Escritas em `stores`
+atualizam o mapa local na hora (write-through) e chamam `notify_changed`,
+que no PostgreSQL emite NOTIFY na mesma transação; uma thread por worker faz
+LISTEN e invalida o mapa quando outro worker altera as lojas. Nos demais
+bancos (SQLite em dev) a recarga periódica (STORE_CACHE_TTL) cobre o resto.
+Falhas da carga antecipada e do LISTEN vão para o logger do app (`init_app`).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, text
+
+from .db import SessionLocal, engine
+from .models import Store
+
+STORE_CACHE_TTL = float(os.getenv("STORE_CACHE_TTL", "300"))
+CHANNEL = "stores_changed"
+# intervalo mínimo entre recargas forçadas por loja desconhecida
+_MISS_REFRESH_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class StoreInfo:
+    id: int
+    name: str
+    meta_visitas: int
+
+    @classmethod
+    def of(cls, store: Store) -> "StoreInfo":
+        return cls(id=store.id, name=store.name, meta_visitas=store.meta_visitas)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "name": self.name, "meta_visitas": self.meta_visitas}
+
+
+class _StoreRegistry:
+    """Mapa {store_id: StoreInfo} compartilhado pelas threads do worker."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, StoreInfo] = {}
+        self._loaded_at = 0.0
+        self._listener_pid: Optional[int] = None
+        self.logger = logging.getLogger(__name__)
+
+    def _refresh(self) -> None:
+        db = SessionLocal()
+        try:
+            rows = db.execute(select(Store.id, Store.name, Store.meta_visitas)).all()
+        finally:
+            db.close()
+        self._by_id = {sid: StoreInfo(sid, name, meta) for sid, name, meta in rows}
+        self._loaded_at = time.monotonic()
+
+    def _due(self, miss: bool = False) -> bool:
+        age = time.monotonic() - self._loaded_at
+        return age > STORE_CACHE_TTL or (miss and age > _MISS_REFRESH_INTERVAL)
+
+    def _ensure(self, miss: bool = False) -> None:
+        self._ensure_listener()
+        if self._due(miss):
+            with self._lock:
+                # outra thread pode ter recarregado enquanto esperávamos
+                if self._due(miss):
+                    self._refresh()
+
+    def stale(self) -> bool:
+        """True se o próximo acesso vai recarregar o mapa (e portanto ir ao banco)."""
+        return self._due()
+
+    def refresh(self) -> None:
+        """Recarrega se vencido; o modo ASGI chama fora do event loop antes do `run_sync`."""
+        self._ensure()
+
+    def warm(self) -> None:
+        """Carga antecipada (lifespan do ASGI); sem tabela ainda (banco novo) fica para o 1º uso."""
+        try:
+            self._ensure()
+        except Exception as e:
+            self.logger.warning("cadastro de lojas: carga inicial adiada (%s)", e.__class__.__name__)
+
+    def get(self, store_id: Optional[int]) -> Optional[StoreInfo]:
+        if not store_id:
+            return None
+        self._ensure()
+        info = self._by_id.get(store_id)
+        if info is None:
+            self._ensure(miss=True)
+            info = self._by_id.get(store_id)
+        return info
+
+    def all(self) -> List[StoreInfo]:
+        self._ensure()
+        return sorted(self._by_id.values(), key=lambda s: s.id)
+
+    def by_name(self, name: str) -> Optional[StoreInfo]:
+        key = (name or "").strip().lower()
+        return next((s for s in self.all() if s.name.strip().lower() == key), None)
+
+    def default(self) -> Optional[StoreInfo]:
+        """Loja de menor id (fallback quando nem usuário nem cliente têm loja)."""
+        stores = self.all()
+        return stores[0] if stores else None
+
+    def meta_for(self, store_id: Optional[int], default: int) -> int:
+        info = self.get(store_id)
+        return info.meta_visitas if info else default
+
+    def put(self, info: StoreInfo) -> None:
+        """Write-through: reflete uma loja recém-gravada (após o commit) neste worker."""
+        with self._lock:
+            by_id = dict(self._by_id)
+            by_id[info.id] = info
+            self._by_id = by_id
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0.0
+
+    # ---------- invalidação entre workers (PostgreSQL) ----------
+    def _ensure_listener(self) -> None:
+        if engine.dialect.name != "postgresql" or self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            threading.Thread(target=self._listen, name="stores-listen", daemon=True).start()
+
+    def _listen(self) -> None:
+        import psycopg
+
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            try:
+                with psycopg.connect(dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    # pode ter perdido avisos enquanto estava desconectado
+                    self.invalidate()
+                    for _ in conn.notifies():
+                        self.invalidate()
+            except Exception as e:
+                self.logger.warning("cadastro de lojas: LISTEN caiu, reconectando: %s", e)
+                time.sleep(5)
+
+
+registry = _StoreRegistry()
+
+
+def init_app(app) -> None:
+    """Liga o registro ao logger do app; nada vai ao banco até o primeiro uso."""
+    registry.logger = app.logger
+
+
+def notify_changed(db) -> None:
+    """Avisa os outros workers (NOTIFY sai no commit da transação de `db`)."""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"NOTIFY {CHANNEL}"))
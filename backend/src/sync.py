@@ -0,0 +1,240 @@
+"""Sincronização incremental dos terminais de loja (modo offline).
+
+`GET /api/sync?since=<token>&limit=N` devolve o que mudou desde o watermark:
+lojas (meta de visitas), clientes com o saldo materializado e as exclusões.
+O token é opaco (base64url de JSON): um keyset `(updated_at, id)` por
+entidade — `(deleted_at, id)` para as exclusões —, então cada página usa os
+índices `ix_*_updated_at_id` e custa o mesmo em qualquer ponto do histórico.
+O terminal repete a chamada com o `since` devolvido enquanto `has_more`.
+
+  - Clientes vão como `{"columns": [...], "rows": [[...], ...]}`, sem repetir
+    os nomes em cada linha; o corpo sai com brotli (se instalado) ou gzip,
+    conforme o Accept-Encoding.
+  - Exclusões ficam em `sync_tombstones` (gravadas pelos eventos de mapper de
+    `track()` ou por `tombstone()` em deletes do Core) por
+    SYNC_TOMBSTONE_DAYS; um token mais velho que isso recebe `"reset": true`
+    e o snapshot completo — o terminal descarta a cópia local.
+  - Cliente que muda de loja some do filtro `store_id` do terminal travado na
+    loja antiga: a mudança grava um tombstone com essa loja, entregue só aos
+    terminais dela (e só enquanto o cliente não voltou para lá).
+  - Só lojas e clientes têm `updated_at`: visitas e resgates são um ledger
+    só de inserção (o saldo que o terminal usa está em `clients.visits_*`,
+    que já atualiza o cliente) e usuários não vão para o terminal — o login
+    continua online.
+  - `updated_at` é gravado antes do commit: uma transação longa pode tornar
+    visível uma linha com carimbo anterior ao último watermark entregue. Por
+    isso a última página volta o watermark para `agora - SYNC_OVERLAP_SECONDS`
+    e as linhas recentes vêm de novo na próxima sincronização (o terminal
+    aplica como upsert). A janela também cobre o atraso da réplica, que o
+    roteador de leitura (src/db.py) já limita.
+"""
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, request
+from sqlalchemy import delete, event, exists, insert, inspect, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+from . import pagination
+from .auth import Identity
+from .models import Client, Store, SyncTombstone
+from .serializers import Projection
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+SYNC_DEFAULT_LIMIT = 1000
+SYNC_MAX_LIMIT = int(os.getenv("SYNC_MAX_LIMIT", "5000"))
+SYNC_OVERLAP_SECONDS = int(os.getenv("SYNC_OVERLAP_SECONDS", "60"))
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", "90"))
+# abaixo disso a compressão não compensa o custo
+COMPRESS_MIN_BYTES = 1024
+
+STORE = Projection(
+    ("id", Store.id), ("name", Store.name), ("meta_visitas", Store.meta_visitas),
+    extra=(Store.updated_at,),
+)
+CLIENT = Projection(
+    ("id", Client.id), ("name", Client.name), ("cpf", Client.cpf), ("phone", Client.phone),
+    ("email", Client.email), ("birthday", Client.birthday), ("store_id", Client.store_id),
+    ("visits_cycle", Client.visits_cycle), ("visits_total", Client.visits_total),
+    extra=(Client.updated_at,),
+)
+
+Key = Tuple[datetime, int]
+# chaves do token: clientes, lojas, exclusões
+_ENTITIES = ("c", "s", "d")
+
+
+# ---------- token ----------
+def encode_token(keys: Dict[str, Optional[Key]]) -> str:
+    state = {k: [ts.isoformat(), row_id] for k, (ts, row_id) in
+             ((k, keys[k]) for k in _ENTITIES if keys.get(k) is not None)}
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_token(token: str) -> Dict[str, Optional[Key]]:
+    """Decodifica o `since`; ValueError se estiver corrompido."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+        keys: Dict[str, Optional[Key]] = {}
+        for k in _ENTITIES:
+            value = state.get(k)
+            keys[k] = (datetime.fromisoformat(value[0]), int(value[1])) if value else None
+        return keys
+    except Exception as e:
+        raise ValueError("since inválido") from e
+
+
+# ---------- consultas ----------
+def _page(db: Session, q, ts_col, id_col, key: Optional[Key], limit: int):
+    """Linhas com (ts, id) > key, em ordem crescente; uma a mais para saber se há outra página."""
+    q = q.where(ts_col.is_not(None))
+    if key is not None:
+        q = q.where(tuple_(ts_col, id_col) > tuple_(pagination.ts_bound(db, key[0]), key[1]))
+    rows = db.execute(q.order_by(ts_col, id_col).limit(limit + 1)).all()
+    return rows[:limit], len(rows) > limit
+
+
+def _last(rows, key: Optional[Key]) -> Optional[Key]:
+    # nas três consultas o id é a primeira coluna e updated_at/deleted_at a última
+    if not rows:
+        return key
+    row = rows[-1]
+    return row[-1], int(row[0])
+
+
+def changes(db: Session, user: Identity, args, now: Optional[datetime] = None) -> Tuple[Any, int]:
+    """Página do sync incremental (?since=, ?limit=); devolve `(payload, status)` como src/handlers.py."""
+    now = now or datetime.utcnow()
+    limit = max(1, min(SYNC_MAX_LIMIT, args.get("limit", SYNC_DEFAULT_LIMIT, type=int) or SYNC_DEFAULT_LIMIT))
+    token = args.get("since")
+    try:
+        keys = decode_token(token) if token else None
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    floor: Key = (now - timedelta(seconds=SYNC_OVERLAP_SECONDS), 0)
+    horizon = now - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    reset = keys is None or keys["d"] is None or keys["d"][0] < horizon
+    if reset:
+        # snapshot completo; exclusões anteriores a ele não interessam
+        keys = {"c": None, "s": None, "d": floor}
+
+    client_q = select(*CLIENT.columns)
+    store_q = select(*STORE.columns)
+    if user.lock_loja and user.store_id:
+        client_q = client_q.where(Client.store_id == user.store_id)
+        store_q = store_q.where(Store.id == user.store_id)
+
+    clients, more_c = _page(db, client_q, Client.updated_at, Client.id, keys["c"], limit)
+    stores_, more_s = _page(db, store_q, Store.updated_at, Store.id, keys["s"], limit)
+    deleted_q = select(SyncTombstone.id, SyncTombstone.entity, SyncTombstone.entity_id, SyncTombstone.deleted_at)
+    if user.lock_loja and user.store_id:
+        # mudanças de loja só para a loja antiga, e não se o cliente já voltou para ela
+        back = exists().where(Client.id == SyncTombstone.entity_id, Client.store_id == user.store_id)
+        deleted_q = deleted_q.where(or_(
+            SyncTombstone.store_id.is_(None),
+            (SyncTombstone.store_id == user.store_id) & ~back,
+        ))
+    else:
+        deleted_q = deleted_q.where(SyncTombstone.store_id.is_(None))
+    deleted, more_d = _page(db, deleted_q, SyncTombstone.deleted_at, SyncTombstone.id, keys["d"], limit)
+
+    has_more = more_c or more_s or more_d
+    if has_more:
+        nxt = {"c": _last(clients, keys["c"]), "s": _last(stores_, keys["s"]),
+               "d": _last(deleted, keys["d"])}
+    else:
+        # em dia: volta a janela de sobreposição (commits atrasados chegam na próxima)
+        nxt = {k: floor for k in _ENTITIES}
+
+    gone: Dict[str, List[int]] = {"clients": [], "stores": []}
+    for _, entity, entity_id, _ in deleted:
+        gone.setdefault(entity, []).append(int(entity_id))
+
+    return {
+        "reset": reset,
+        "has_more": has_more,
+        "since": encode_token(nxt),
+        "server_time": now,
+        "stores": {"columns": list(STORE.names), "rows": [list(r[:-1]) for r in stores_]},
+        "clients": {"columns": list(CLIENT.names), "rows": [list(r[:-1]) for r in clients]},
+        "deleted": gone,
+    }, 200
+
+
+# ---------- resposta comprimida ----------
+def _encoding() -> Optional[str]:
+    offered = ("br", "gzip") if brotli is not None else ("gzip",)
+    return request.accept_encodings.best_match(offered)
+
+
+def response(payload: Any, status: int = 200):
+    """JSON do payload comprimido conforme o Accept-Encoding (brotli > gzip > nenhum)."""
+    body = current_app.json.dumps(payload).encode()
+    encoding = _encoding() if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    resp = current_app.response_class(body, status=status, mimetype="application/json")
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.headers["Cache-Control"] = "private, no-store"
+    return resp
+
+
+# ---------- exclusões ----------
+def tombstone(db, entity: str, ids: Iterable[int], at: Optional[datetime] = None,
+              store_id: Optional[int] = None) -> None:
+    """Registra a exclusão de `ids` de `entity` ("clients"/"stores"); use junto de deletes do Core.
+
+    Com `store_id`, registra a saída de clientes dessa loja (UPDATE de
+    `store_id` pelo Core): só os terminais travados nela removem a linha.
+    `db` pode ser uma Session ou uma Connection — grava na mesma transação.
+    """
+    at = at or datetime.utcnow()
+    rows = [{"entity": entity, "entity_id": int(i), "store_id": store_id, "deleted_at": at} for i in ids]
+    if rows:
+        db.execute(insert(SyncTombstone), rows)
+
+
+def _after_delete(mapper, connection, target) -> None:
+    tombstone(connection, mapper.local_table.name, [target.id])
+
+
+def _after_update(mapper, connection, target) -> None:
+    # histórico do flush ainda disponível: as lojas de onde o cliente saiu
+    for old in inspect(target).attrs.store_id.history.deleted:
+        if old is not None and old != target.store_id:
+            tombstone(connection, "clients", [target.id], store_id=old)
+
+
+def track() -> None:
+    """Exclusões pelo ORM (`db.delete(obj)`) de clientes e lojas e mudanças de
+    loja de clientes (`client.store_id = ...`) viram tombstones."""
+    for model in (Client, Store):
+        if not event.contains(model, "after_delete", _after_delete):
+            event.listen(model, "after_delete", _after_delete)
+    if not event.contains(Client, "after_update", _after_update):
+        event.listen(Client, "after_update", _after_update)
+
+
+def purge(db: Session, now: Optional[datetime] = None) -> int:
+    """Apaga tombstones além da retenção (tokens tão antigos recebem reset). Devolve quantos."""
+    horizon = (now or datetime.utcnow()) - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    n = db.execute(delete(SyncTombstone).where(SyncTombstone.deleted_at < horizon)).rowcount
+    db.commit()
+    return int(n or 0)
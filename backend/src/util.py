@@ -1,7 +1,11 @@
 import bcrypt
 import hmac
+import os
+import re
+import unicodedata
+from datetime import date
 
-BCRYPT_ROUNDS = 12  # custo padrão
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # custo padrão
 
 def hash_password(password: str) -> str:
     return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
@@ -13,3 +17,50 @@ def verify_password(password: str, hashed: str) -> bool:
         return hmac.compare_digest(b"\x01" if ok else b"\x00", b"\x01")
     except Exception:
         return False
+
+
+def birthday_parts(value):
+    """(mês, dia) de um aniversário 'YYYY-MM-DD' ou date; (None, None) se inválido."""
+    if not value:
+        return None, None
+    if isinstance(value, date):
+        return value.month, value.day
+    try:
+        d = date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        return None, None
+    return d.month, d.day
+
+
+def normalize_cpf(value) -> str:
+    """Só os dígitos do CPF ('123.456.789-00' -> '12345678900')."""
+    return "".join(ch for ch in str(value or "") if ch.isdigit())
+
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def search_key(value) -> str:
+    """Texto para busca: sem acentos, minúsculo, só letras/dígitos ('José  da Silva' -> 'jose da silva')."""
+    s = unicodedata.normalize("NFKD", str(value or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    return _NON_ALNUM.sub(" ", s).strip()
+
+
+def phone_rev(value):
+    """Dígitos do telefone invertidos: busca pelo final vira busca por prefixo."""
+    digits = normalize_cpf(value)
+    return digits[::-1] or None
+
+
+def prefix_bounds(prefix: str):
+    """(início, fim) da faixa de strings que começam com `prefix` (texto de search_key)."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def digit_prefix_bounds(prefix: str):
+    """(início, fim) da faixa de strings de dígitos que começam com `prefix`; fim None = sem limite."""
+    head = prefix.rstrip("9")
+    if not head:
+        return prefix, None
+    return prefix, head[:-1] + str(int(head[-1]) + 1)
@@ -6,11 +6,15 @@ export default function Clientes(){
   const [page,setPage] = useState(1)
   const [items,setItems] = useState([])
   const [total,setTotal] = useState(0)
+  // cursores[i] = cursor que abre a página i+1 (paginação keyset do backend)
+  const [cursors,setCursors] = useState([null])
   const [form,setForm] = useState({name:'',cpf:'',phone:'',email:'',birthday:''})
 
   async function load(){
-    const r = await api.get('/api/clientes?cpf='+encodeURIComponent(cpf)+'&page='+page+'&per_page=10')
+    const cursor = cursors[page-1]
+    const r = await api.get('/api/clientes?cpf='+encodeURIComponent(cpf)+'&per_page=10'+(cursor ? '&cursor='+encodeURIComponent(cursor) : ''))
     setItems(r.data.items); setTotal(r.data.total)
+    setCursors(cs => { const next = cs.slice(0, page); next[page] = r.data.next_cursor; return next })
   }
   useEffect(()=>{ load() },[page])
 
@@ -18,7 +22,7 @@ export default function Clientes(){
     e.preventDefault()
     await api.post('/api/clientes', form)
     setForm({name:'',cpf:'',phone:'',email:'',birthday:''})
-    setPage(1); load()
+    setCursors([null]); setPage(1); load()
   }
 
   return (
@@ -40,7 +44,7 @@ export default function Clientes(){
       <div className="card">
         <label>Buscar por CPF</label>
         <input value={cpf} onChange={e=>setCpf(e.target.value)} placeholder="000.000.000-00" />
-        <button className="btn" style={{marginTop:8}} onClick={()=>{setPage(1); load()}}>Buscar</button>
+        <button className="btn" style={{marginTop:8}} onClick={()=>{setCursors([null]); setPage(1); load()}}>Buscar</button>
       </div>
       <table className="card">
         <thead><tr><th>Nome</th><th>CPF</th><th>Telefone</th><th>Email</th><th>Nasc.</th></tr></thead>
@@ -49,7 +53,7 @@ export default function Clientes(){
       <div style={{display:'flex', gap:8}}>
         <button className="btn ghost" onClick={()=>setPage(p=>Math.max(1,p-1))}>Anterior</button>
         <span style={{alignSelf:'center'}}>Página {page}</span>
-        <button className="btn" onClick={()=>setPage(p=>p+1)}>Próxima</button>
+        <button className="btn" disabled={!cursors[page]} onClick={()=>setPage(p=>p+1)}>Próxima</button>
       </div>
     </div>
   )
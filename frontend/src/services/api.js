@@ -17,8 +17,14 @@ export function setToken(token) {
   }
 }
 
+// depois de uma escrita o backend devolve X-Last-Write; reenviado nas próximas
+// requisições, as leituras veem o que acabou de ser gravado em qualquer worker
 api.interceptors.response.use(
-  (r) => r,
+  (r) => {
+    const marker = r.headers?.['x-last-write']
+    if (marker) api.defaults.headers.common['X-Last-Write'] = marker
+    return r
+  },
   (err) => {
     const code = err?.response?.status
     if (code === 401 || code === 422) {